@@ -4,6 +4,7 @@ from .login import router as login_router
 from .logout import router as logout_router
 from .posts import router as posts_router
 from .rate_limits import router as rate_limits_router
+from .slides import router as slides_router
 from .tasks import router as tasks_router
 from .tiers import router as tiers_router
 from .users import router as users_router
@@ -16,3 +17,4 @@ router.include_router(posts_router)
 router.include_router(tasks_router)
 router.include_router(tiers_router)
 router.include_router(rate_limits_router)
+router.include_router(slides_router)
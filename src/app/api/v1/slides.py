@@ -0,0 +1,56 @@
+from typing import Annotated, Any, Literal
+
+from fastapi import APIRouter, Depends, Request
+from fastcrud.paginated import PaginatedListResponse, compute_offset, paginated_response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...core.db.database import async_get_db
+from ...core.exceptions.http_exceptions import NotFoundException
+from ...crud.crud_slide import crud_slides
+from ...schemas.slide import SlideRead
+
+router = APIRouter(tags=["slides"])
+
+
+@router.get("/slides", response_model=PaginatedListResponse[SlideRead])
+async def read_slides(
+    request: Request,
+    db: Annotated[AsyncSession, Depends(async_get_db)],
+    page: int = 1,
+    items_per_page: int = 10,
+    format: str | None = None,
+    min_width: int | None = None,
+    min_height: int | None = None,
+    sort_by: Literal["name", "modified_at", "size_bytes", "width"] = "name",
+    sort_order: Literal["asc", "desc"] = "asc",
+) -> dict:
+    """List the slide catalog, which the background scanner keeps in line with the slides directory."""
+    filters: dict[str, Any] = {}
+    if format is not None:
+        filters["format"] = format.lower()
+    if min_width is not None:
+        filters["width__gte"] = min_width
+    if min_height is not None:
+        filters["height__gte"] = min_height
+
+    slides_data = await crud_slides.get_multi(
+        db=db,
+        offset=compute_offset(page, items_per_page),
+        limit=items_per_page,
+        schema_to_select=SlideRead,
+        sort_columns=sort_by,
+        sort_orders=sort_order,
+        **filters,
+    )
+
+    response: dict[str, Any] = paginated_response(crud_data=slides_data, page=page, items_per_page=items_per_page)
+    return response
+
+
+@router.get("/slide/{name}", response_model=SlideRead)
+async def read_slide(request: Request, name: str, db: Annotated[AsyncSession, Depends(async_get_db)]) -> dict:
+    db_slide: SlideRead | None = await crud_slides.get(db=db, schema_to_select=SlideRead, name=name)
+    if db_slide is None:
+        raise NotFoundException("Slide not found")
+
+    return db_slide
@@ -1,11 +1,21 @@
-from typing import Any
+import asyncio
+import json
+from pathlib import Path
+from typing import Annotated, Any
 
 from arq.jobs import Job as ArqJob
 from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...api.dependencies import rate_limiter
+from ...core.config import settings
+from ...core.db.database import async_get_db
+from ...core.exceptions.http_exceptions import BadRequestException
 from ...core.utils import queue
+from ...core.utils.slide_cache import slide_identity
+from ...crud.crud_slide import crud_slides
 from ...schemas.job import Job
+from ...schemas.slide import SlideRead, SlideStageJobs, SlideStageRequest
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
@@ -28,6 +38,207 @@ async def create_task(message: str) -> dict[str, str]:
     return {"id": job.job_id}
 
 
+@router.post("/pyramid/{slide_name}", response_model=Job, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_pyramid_task(slide_name: str) -> dict[str, str]:
+    """Enqueue pre-rendering of a slide's full DeepZoom pyramid to the tile store.
+
+    Parameters
+    ----------
+    slide_name: str
+        The slide file name inside the slides directory.
+
+    Returns
+    -------
+    dict[str, str]
+        A dictionary containing the ID of the created task.
+    """
+    job = await queue.pool.enqueue_job("generate_pyramid", slide_name)  # type: ignore
+    return {"id": job.job_id}
+
+
+@router.post("/dicom-index/{slide_name}", response_model=Job, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_dicom_index_task(slide_name: str) -> dict[str, str]:
+    """Enqueue indexing of a DICOM series folder, so tile and metadata requests never parse its headers.
+
+    Parameters
+    ----------
+    slide_name: str
+        The series folder name inside the slides directory.
+
+    Returns
+    -------
+    dict[str, str]
+        A dictionary containing the ID of the created task.
+    """
+    job = await queue.pool.enqueue_job("index_dicom_series", slide_name)  # type: ignore
+    return {"id": job.job_id}
+
+
+@router.post("/previews/{slide_name}", response_model=Job, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_previews_task(slide_name: str) -> dict[str, str]:
+    """Enqueue rendering of a slide's thumbnail, label and macro previews.
+
+    New and modified slides are queued automatically by the slide catalog; this re-runs it on demand.
+
+    Parameters
+    ----------
+    slide_name: str
+        The slide name inside the slides directory.
+
+    Returns
+    -------
+    dict[str, str]
+        A dictionary containing the ID of the created task.
+    """
+    job = await queue.pool.enqueue_job("generate_slide_previews", slide_name)  # type: ignore
+    return {"id": job.job_id}
+
+
+@router.post("/levels/{slide_name}", response_model=Job, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_levels_task(slide_name: str) -> dict[str, str]:
+    """Enqueue synthesis of the low-resolution levels a slide does not store.
+
+    Parameters
+    ----------
+    slide_name: str
+        The slide name inside the slides directory.
+
+    Returns
+    -------
+    dict[str, str]
+        A dictionary containing the ID of the created task.
+    """
+    job = await queue.pool.enqueue_job("synthesize_slide_levels", slide_name)  # type: ignore
+    return {"id": job.job_id}
+
+
+@router.post("/tissue-mask/{slide_name}", response_model=Job, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_tissue_mask_task(slide_name: str) -> dict[str, str]:
+    """Enqueue computation of a slide's tissue mask, used to answer background tiles without reading the slide.
+
+    Parameters
+    ----------
+    slide_name: str
+        The slide name inside the slides directory.
+
+    Returns
+    -------
+    dict[str, str]
+        A dictionary containing the ID of the created task.
+    """
+    job = await queue.pool.enqueue_job("generate_slide_tissue_mask", slide_name)  # type: ignore
+    return {"id": job.job_id}
+
+
+@router.post("/dicom/{slide_name}", response_model=Job, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_dicom_conversion_task(slide_name: str) -> dict[str, str]:
+    """Enqueue conversion of a slide into a DICOM VL Whole Slide Microscopy series.
+
+    Progress, with frame and byte throughput, is reported by `/task/{task_id}` while the job runs.
+
+    Parameters
+    ----------
+    slide_name: str
+        The slide name inside the slides directory.
+
+    Returns
+    -------
+    dict[str, str]
+        A dictionary containing the ID of the created task.
+    """
+    job = await queue.pool.enqueue_job("convert_slide_to_dicom", slide_name)  # type: ignore
+    return {"id": job.job_id}
+
+
+@router.post("/normalize/{slide_name}", response_model=Job, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_normalize_task(slide_name: str, force: bool = False) -> dict[str, str]:
+    """Enqueue writing a tiled pyramidal TIFF copy of a slide, which the tile routes then read instead.
+
+    Parameters
+    ----------
+    slide_name: str
+        The slide name inside the slides directory.
+    force: bool, optional
+        Normalize slides that are already tiled and pyramidal too. Defaults to False.
+
+    Returns
+    -------
+    dict[str, str]
+        A dictionary containing the ID of the created task.
+    """
+    job = await queue.pool.enqueue_job("normalize_slide_copy", slide_name, force)  # type: ignore
+    return {"id": job.job_id}
+
+
+@router.post("/stage", response_model=SlideStageJobs, status_code=201, dependencies=[Depends(rate_limiter)])
+async def create_stage_tasks(
+    worklist: SlideStageRequest, db: Annotated[AsyncSession, Depends(async_get_db)]
+) -> dict[str, Any]:
+    """Enqueue copying catalog slides to the local staging cache, to warm a worklist before it is viewed.
+
+    Slides are picked from the slide catalog by name, in the order given, or else by format and modification
+    time, most recently modified first. Slides that would take the worklist past the staging budget are left
+    out, since copying them would evict slides staged for it.
+
+    Parameters
+    ----------
+    worklist: SlideStageRequest
+        The slide names, or the format and modification time to pick slides by.
+    db: AsyncSession
+        The database session.
+
+    Returns
+    -------
+    dict[str, Any]
+        The job ID per queued slide, None for slides already queued, the slides left out for the budget,
+        and the names missing from the catalog.
+    """
+    if not settings.SLIDE_STAGING:
+        raise BadRequestException("Slide staging is disabled")
+
+    filters: dict[str, Any] = {}
+    if worklist.names is not None:
+        filters["name__in"] = worklist.names
+    if worklist.format is not None:
+        filters["format"] = worklist.format.lower()
+    if worklist.modified_since is not None:
+        filters["modified_at__gte"] = worklist.modified_since
+
+    slides_data = await crud_slides.get_multi(
+        db=db,
+        limit=len(worklist.names) if worklist.names is not None else worklist.limit,
+        schema_to_select=SlideRead,
+        sort_columns="modified_at",
+        sort_orders="desc",
+        **filters,
+    )
+    slides = {slide["name"]: slide for slide in slides_data["data"]}
+
+    result: dict[str, Any] = {"jobs": {}, "over_budget": [], "missing": []}
+    staged_bytes = 0
+    for name in worklist.names if worklist.names is not None else slides:
+        slide = slides.get(name)
+        if slide is None:
+            result["missing"].append(name)
+            continue
+        if staged_bytes + slide["size_bytes"] > settings.SLIDE_STAGING_MAX_BYTES:
+            result["over_budget"].append(name)
+            continue
+
+        try:
+            slide_id = await asyncio.to_thread(slide_identity, Path(settings.SLIDES_DIR) / name)
+        except FileNotFoundError:
+            result["missing"].append(name)
+            continue
+
+        staged_bytes += slide["size_bytes"]
+        # Named like the jobs tile renders queue, so a slide is staged once whichever asks first.
+        job = await queue.pool.enqueue_job("stage_slide", name, _job_id=f"stage:{slide_id}")  # type: ignore
+        result["jobs"][name] = job.job_id if job is not None else None
+
+    return result
+
+
 @router.get("/task/{task_id}")
 async def get_task(task_id: str) -> dict[str, Any] | None:
     """Get information about a specific background task.
@@ -41,7 +252,16 @@ async def get_task(task_id: str) -> dict[str, Any] | None:
     -------
     Optional[dict[str, Any]]
         A dictionary containing information about the task if found, or None otherwise.
+        Tasks that publish progress include it under `progress`, with an ETA.
     """
     job = ArqJob(task_id, queue.pool)
     job_info: dict = await job.info()
-    return vars(job_info)
+    if job_info is None:
+        return None
+
+    task = vars(job_info)
+    progress = await queue.pool.get(f"{queue.JOB_PROGRESS_PREFIX}{task_id}")  # type: ignore
+    if progress is not None:
+        task["progress"] = json.loads(progress)
+
+    return task
@@ -0,0 +1,457 @@
+import asyncio
+from pathlib import Path
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.db.database import async_get_db
+from ..core.exceptions.tile_exceptions import ClientDisconnectedError, TileQueueFullError
+from ..core.logger import logging
+from ..core.utils import (
+    dicom_wsi,
+    level_synthesis,
+    single_flight,
+    slide_cache,
+    slide_previews,
+    slide_regions,
+    slide_staging,
+    tile_cache,
+    tile_prefetch,
+    tile_render,
+    tile_store,
+    tissue_mask,
+)
+from ..core.utils.slide_serving import (
+    client_disconnected_response,
+    dzi_etag,
+    enqueue_slide_job,
+    etag_matches,
+    get_slide_geometry,
+    get_slide_metadata,
+    get_tile_bytes,
+    local_path,
+    not_modified_response,
+    request_priority,
+    run_tile_job,
+    schedule_prefetch,
+    served_slide,
+    slide_cache_headers,
+    stored_tile_path,
+    stored_tile_response,
+    stream_tile_frames,
+    tile_etag,
+    tile_key,
+    tile_queue_full_response,
+    unless_disconnected,
+    viewer_session,
+)
+from ..core.utils.tile_encoding import FORMAT_ALIASES, negotiate_format
+from ..core.utils.tile_render import RenderPriority
+from ..crud.crud_slide import crud_slides
+from ..schemas.tile import TileBatchRequest
+
+logger = logging.getLogger(__name__)
+
+# Slides directory, configurable through SLIDES_DIR
+SLIDES_DIR = Path(settings.SLIDES_DIR)
+logger.info(f"Checking slides directory: {SLIDES_DIR}")
+
+# Number of catalog slides listed in the viewer's slide selector
+VIEWER_SLIDE_LIMIT = 1000
+
+router = APIRouter(tags=["viewer"])
+
+
+# ---------- Viewer Route ----------
+@router.get("/viewer", response_class=HTMLResponse)
+async def viewer_page(request: Request, db: Annotated[AsyncSession, Depends(async_get_db)]):
+    """Render the DeepZoom viewer page with the slides of the slide catalog (files & folders)."""
+    catalog = await crud_slides.get_multi(
+        db=db, limit=VIEWER_SLIDE_LIMIT, sort_columns="name", return_total_count=False
+    )
+    slides = [slide["name"] for slide in catalog["data"]]
+
+    # The worker fills the catalog on its first scan of the slides directory.
+    if not slides:
+        logger.warning("The slide catalog is empty")
+
+    return request.app.state.templates.TemplateResponse("viewer.html", {"request": request, "slides": slides})
+
+
+# ---------- DeepZoom DZI Metadata ----------
+@router.get("/dzi/{slide_name}.dzi")
+async def get_dzi(request: Request, slide_name: str):
+    """Serve Deep Zoom Image (DZI) metadata for a given slide."""
+    slide_path = SLIDES_DIR / slide_name
+
+    logger.info(f"Checking DZI for: {slide_name}, Full path: {slide_path}")
+
+    if not slide_path.exists():
+        slide_path = SLIDES_DIR / (slide_name + ".svs")  # Try appending .svs
+
+    if not slide_path.exists():
+        logger.error(f"Slide not found: {slide_name} at {slide_path}")
+        return JSONResponse(content={"error": "Slide not found"}, status_code=404)
+
+    slide = served_slide(slide_path)
+    headers = slide_cache_headers(request, dzi_etag(slide.slide_id), slide.slide_id)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return not_modified_response(headers)
+
+    try:
+        stored_dzi = tile_store.store.dzi_path(slide.slide_id) if tile_store.store else None
+        if stored_dzi is not None and stored_dzi.is_file():
+            dzi = stored_dzi.read_text()
+        else:
+            dzi = (await get_slide_metadata(slide))["dzi"]
+
+        # Fix the Tile URL in DZI XML
+        corrected_dzi = dzi.replace(f"{slide_name}_files/", f"tiles/{slide_name}/")
+        logger.info(f"DZI successfully generated for: {slide_name}")
+        return Response(content=corrected_dzi, media_type="application/xml", headers=headers)
+    except TileQueueFullError as e:
+        return tile_queue_full_response(e)
+    except Exception as e:
+        logger.error(f"Error generating DZI for {slide_name}: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+
+# ---------- DeepZoom Tile Fetching ----------
+@router.get("/tiles/{slide_name}/{level}/{col}_{row}.{ext}")
+async def get_tile(request: Request, slide_name: str, level: int, col: int, row: int, ext: str):
+    """Serve DeepZoom tiles for the viewer.
+
+    `.jpeg`, `.png` and `.webp` URLs are supported. A `.jpeg` request is answered with WebP when the
+    client accepts it and `TILE_NEGOTIATE_FORMAT` is enabled.
+    """
+    slide_path = SLIDES_DIR / slide_name
+
+    if not slide_path.exists():
+        logger.error(f"Slide not found: {slide_name}")
+        return JSONResponse(content={"error": "Slide not found"}, status_code=404)
+
+    # DICOM frames are served as stored, so their JPEG URLs are never upgraded to WebP.
+    negotiate = settings.TILE_NEGOTIATE_FORMAT and not dicom_wsi.is_dicom_series(slide_path)
+    format = negotiate_format(ext, request.headers.get("accept"), negotiate)
+    if format is None:
+        return JSONResponse(content={"error": f"Unsupported tile format: {ext}"}, status_code=404)
+
+    # Revalidation only needs a stat of the slide file, so repeat viewers never cause a slide open.
+    slide = served_slide(slide_path)
+    vary_accept = negotiate and FORMAT_ALIASES.get(ext.lower()) == "jpeg"
+    etag = tile_etag(slide.slide_id, level, col, row, format)
+    headers = slide_cache_headers(request, etag, slide.slide_id, vary_accept)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return not_modified_response(headers)
+
+    try:
+        geometry = await get_slide_geometry(slide.source)
+    except TileQueueFullError as e:
+        return tile_queue_full_response(e)
+
+    if not geometry.has_tile(level, col, row):
+        logger.error(f"Invalid tile request: level={level}, col={col}, row={row}")
+        return JSONResponse(content={"error": "Invalid tile coordinates"}, status_code=404)
+
+    key = tile_key(slide.slide_id, level, col, row, format, geometry.level_count)
+    session, priority = viewer_session(request), request_priority(request)
+    stored = stored_tile_response(key, headers)
+    if stored is not None:
+        schedule_prefetch(session, priority, slide, format, geometry, level, col, row)
+        return stored
+
+    try:
+        content = await unless_disconnected(request, get_tile_bytes(slide, key, priority, session))
+    except TileQueueFullError as e:
+        return tile_queue_full_response(e)
+    except ClientDisconnectedError:
+        return client_disconnected_response()
+
+    schedule_prefetch(session, priority, slide, format, geometry, level, col, row)
+    return Response(content=content, media_type=key.encoding.media_type, headers=headers)
+
+
+@router.post("/tiles/{slide_name}/batch")
+async def get_tile_batch(request: Request, slide_name: str, batch: TileBatchRequest):
+    """Stream many tiles of one slide in a single response, each as soon as it is rendered.
+
+    Used by bulk clients such as exports and cache warmers, and by the viewer when opened with ?batchTiles.
+    Frames carry no ETag, so the viewer stores each one in the browser Cache API under the GET URL of its tile.
+
+    The body is a sequence of frames: an 18-byte big-endian header (level, col, row as int32, HTTP status
+    as uint16, payload length as uint32) followed by the payload, the encoded tile when the status is 200.
+    """
+    slide_path = SLIDES_DIR / slide_name
+
+    if not slide_path.exists():
+        logger.error(f"Slide not found: {slide_name}")
+        return JSONResponse(content={"error": "Slide not found"}, status_code=404)
+
+    return StreamingResponse(
+        stream_tile_frames(viewer_session(request), request_priority(request), slide_path, batch.tiles, batch.format),
+        media_type="application/octet-stream",
+        headers={"X-Tile-Frame-Format": "level:i32,col:i32,row:i32,status:u16,length:u32"},
+    )
+
+
+@router.head("/tiles/{slide_name}/{level}/{col}_{row}.{ext}")
+async def get_tile_head(request: Request, slide_name: str, level: int, col: int, row: int, ext: str):
+    """Handles HEAD requests for tiles from the cached pyramid geometry, without reading pixels."""
+    slide_path = SLIDES_DIR / slide_name
+
+    if not slide_path.exists():
+        return JSONResponse(content={"error": "Slide not found"}, status_code=404)
+
+    # DICOM frames are served as stored, so their JPEG URLs are never upgraded to WebP.
+    negotiate = settings.TILE_NEGOTIATE_FORMAT and not dicom_wsi.is_dicom_series(slide_path)
+    format = negotiate_format(ext, request.headers.get("accept"), negotiate)
+    if format is None:
+        return JSONResponse(content={"error": f"Unsupported tile format: {ext}"}, status_code=404)
+
+    slide = served_slide(slide_path)
+    vary_accept = negotiate and FORMAT_ALIASES.get(ext.lower()) == "jpeg"
+    etag = tile_etag(slide.slide_id, level, col, row, format)
+    headers = slide_cache_headers(request, etag, slide.slide_id, vary_accept)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return not_modified_response(headers)
+
+    try:
+        geometry = await get_slide_geometry(slide.source)
+    except TileQueueFullError as e:
+        return tile_queue_full_response(e)
+
+    if not geometry.has_tile(level, col, row):
+        return JSONResponse(content={"error": "Invalid tile coordinates"}, status_code=404)
+
+    key = tile_key(slide.slide_id, level, col, row, format, geometry.level_count)
+    response = Response(status_code=200, media_type=key.encoding.media_type, headers=headers)
+
+    # Content-Length is only known once the tile has been encoded, in the tile store or tile cache.
+    stored_path = stored_tile_path(key)
+    cached = tile_cache.tiles.peek_local(key) if tile_cache.tiles else None
+    if stored_path is not None:
+        response.headers["Content-Length"] = str(stored_path.stat().st_size)
+    elif cached is not None:
+        response.headers["Content-Length"] = str(len(cached))
+    else:
+        del response.headers["Content-Length"]
+
+    return response
+
+
+@router.get("/metadata/{slide_name}")
+async def get_metadata(slide_name: str):
+    """Return metadata for a given slide (SVS, TIFF, DICOM, etc.).
+
+    One response carries the pyramid geometry, the DZI and the header fields or vendor properties, read
+    once per slide version and shared across workers through the slide metadata cache.
+    """
+    slide_path = SLIDES_DIR / slide_name
+    logger.info(f"Fetching metadata for: {slide_name}, Full path: {slide_path}")
+
+    if not slide_path.exists():
+        logger.error(f"Slide not found: {slide_name} at {slide_path}")
+        return JSONResponse(content={"error": "Slide not found"}, status_code=404)
+
+    slide = served_slide(slide_path)
+    try:
+        metadata = {"slide_id": slide.slide_id, **await get_slide_metadata(slide)}
+    except TileQueueFullError as e:
+        return tile_queue_full_response(e)
+    except Exception as e:
+        logger.error(f"Error retrieving metadata for {slide_name} : {str(e)}", exc_info=True)
+        return JSONResponse(content={"error": f"Internal Server Error: {str(e)}"}, status_code=500)
+
+    if tissue_mask.store is not None:
+        manifest = await asyncio.to_thread(tissue_mask.store.read_manifest, slide_cache.slide_identity(slide_path))
+        if manifest is not None:
+            metadata["tissue"] = {
+                "fraction": manifest["tissue_fraction"],
+                "background": manifest["background"],
+            }
+
+    # DICOM series carry their own header fields; other formats still show the placeholders.
+    if "metadata" not in metadata:
+        metadata.update(
+            {
+                "macroscopy": "Placeholder macroscopy data",
+                "microscopy": "Placeholder microscopy data",
+                "clinical": "Placeholder clinical details",
+                "diagnosis": "Placeholder diagnosis",
+            }
+        )
+
+    logger.info(f"Metadata retrieved successfully for: {slide_name}")
+    return JSONResponse(metadata)
+
+
+# ---------- Slide Regions ----------
+@router.get("/regions/{slide_name}")
+async def get_region(
+    request: Request,
+    slide_name: str,
+    x: int,
+    y: int,
+    width: int,
+    height: int,
+    level: int | None = None,
+    mpp: float | None = None,
+    format: str = "png",
+):
+    """Stream an arbitrary region of a slide as raw RGB, PNG or tiled TIFF, for analysis clients.
+
+    `x` and `y` are the top-left corner in full-resolution pixels and `width` and `height` the output
+    size. The output scale is a native `level` (0 is full resolution) or `mpp` microns per pixel, and
+    defaults to full resolution. The region is read and encoded block by block on the tile render
+    executor, so memory use does not grow with its size, and the stream stops when the client goes away.
+    """
+    slide_path = SLIDES_DIR / slide_name
+    if not slide_path.exists():
+        logger.error(f"Slide not found: {slide_name} at {slide_path}")
+        return JSONResponse(content={"error": "Slide not found"}, status_code=404)
+
+    if format not in slide_regions.REGION_FORMATS:
+        return JSONResponse(content={"error": f"Unsupported region format: {format}"}, status_code=400)
+    if width <= 0 or height <= 0:
+        return JSONResponse(content={"error": "Region width and height must be positive"}, status_code=400)
+    if level is not None and mpp is not None:
+        return JSONResponse(content={"error": "Pass either level or mpp, not both"}, status_code=400)
+    if mpp is not None and mpp <= 0:
+        return JSONResponse(content={"error": "Region mpp must be positive"}, status_code=400)
+    if width * height > settings.REGION_MAX_PIXELS:
+        return JSONResponse(content={"error": f"Region exceeds {settings.REGION_MAX_PIXELS} pixels"}, status_code=413)
+
+    # Regions are exports for analysis clients, so their reads give way to viewers.
+    user = viewer_session(request)
+    source = local_path(slide_path, slide_cache.slide_identity(slide_path))
+    try:
+        info = await run_tile_job(
+            slide_path, slide_regions.read_region_info, source, priority=RenderPriority.BATCH, user=user
+        )
+    except TileQueueFullError as e:
+        return tile_queue_full_response(e)
+
+    if mpp is not None:
+        if info.mpp is None:
+            return JSONResponse(content={"error": "Slide resolution is unknown"}, status_code=400)
+        downsample = mpp / info.mpp
+    elif level is not None:
+        if not 0 <= level < len(info.level_downsamples):
+            return JSONResponse(content={"error": "Invalid level"}, status_code=400)
+        downsample = info.level_downsamples[level]
+    else:
+        downsample = 1.0
+
+    try:
+        encoder = slide_regions.region_encoder(
+            format, width, height, info.mpp * downsample if info.mpp is not None else None
+        )
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+
+    async def read_block(block_x: int, block_y: int, block_width: int, block_height: int):
+        return await run_tile_job(
+            slide_path,
+            slide_regions.read_region_block,
+            source,
+            x + round(block_x * downsample),
+            y + round(block_y * downsample),
+            downsample,
+            block_width,
+            block_height,
+            info.dicom,
+            priority=RenderPriority.BATCH,
+            user=user,
+        )
+
+    headers = {"Cache-Control": "no-store", "X-Region-Downsample": f"{downsample:g}"}
+    if encoder.content_length is not None:
+        headers["Content-Length"] = str(encoder.content_length)
+
+    return StreamingResponse(
+        slide_regions.stream_region(encoder, read_block, request.is_disconnected),
+        media_type=encoder.media_type,
+        headers=headers,
+    )
+
+
+# ---------- Slide Previews ----------
+@router.get("/previews/{slide_name}/{kind}")
+async def get_preview(request: Request, slide_name: str, kind: str, size: int = slide_previews.DEFAULT_PREVIEW_SIZE):
+    """Serve a precomputed thumbnail, label or macro image of a slide.
+
+    `size` is the longest side in pixels; the smallest precomputed size at least as large is served.
+    Previews are rendered by the `generate_slide_previews` job, which is enqueued here when missing.
+    """
+    if kind not in slide_previews.PREVIEW_KINDS:
+        return JSONResponse(content={"error": f"Unknown preview: {kind}"}, status_code=404)
+
+    slide_path = SLIDES_DIR / slide_name
+    if not slide_path.exists():
+        logger.error(f"Slide not found: {slide_name} at {slide_path}")
+        return JSONResponse(content={"error": "Slide not found"}, status_code=404)
+
+    if slide_previews.store is None:
+        return JSONResponse(content={"error": "Slide previews are not configured"}, status_code=404)
+
+    slide_id = slide_cache.slide_identity(slide_path)
+    manifest = await asyncio.to_thread(slide_previews.store.read_manifest, slide_id)
+    if manifest is None:
+        await enqueue_slide_job("generate_slide_previews", slide_path, f"previews:{slide_id}")
+        return JSONResponse(content={"error": "Previews are not generated yet"}, status_code=404)
+
+    if kind not in manifest:
+        return JSONResponse(content={"error": f"Slide has no {kind} image"}, status_code=404)
+
+    # Requested sizes served by the same precomputed image share its ETag.
+    served_size = slide_previews.best_size(manifest[kind], size)
+    headers = slide_cache_headers(request, f'"{slide_id}-{kind}-{served_size}"', slide_id)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return not_modified_response(headers)
+
+    path = slide_previews.store.path(slide_id, kind, served_size)
+    return FileResponse(path, headers=headers, media_type=slide_previews.PREVIEW_ENCODING.media_type)
+
+
+@router.get("/debug/files")
+async def debug_files(db: Annotated[AsyncSession, Depends(async_get_db)]):
+    """Debugging route to list the slides of the slide catalog, as the worker last found them on disk."""
+    catalog = await crud_slides.get_multi(db=db, limit=None, sort_columns="name", return_total_count=False)
+    return {"files_found": [slide["name"] for slide in catalog["data"]]}
+
+
+@router.get("/debug/tile-stats")
+async def debug_tile_stats():
+    """Debugging route to report slide handle cache, tile render, tile cache and coalescing counters."""
+    return {
+        "slide_handles": slide_cache.handles.stats() if slide_cache.handles else None,
+        "dicom_slides": dicom_wsi.slides.stats() if dicom_wsi.slides else None,
+        "renderer": tile_render.renderer.stats() if tile_render.renderer else None,
+        "tile_cache": tile_cache.tiles.stats() if tile_cache.tiles else None,
+        "single_flight": single_flight.flights.stats() if single_flight.flights else None,
+        "prefetch": tile_prefetch.prefetcher.stats() if tile_prefetch.prefetcher else None,
+        "level_synthesis": level_synthesis.store.stats() if level_synthesis.store else None,
+        "tissue_mask": tissue_mask.store.stats() if tissue_mask.store else None,
+        "slide_staging": slide_staging.store.stats() if slide_staging.store else None,
+    }
+
+
+@router.get("/metrics")
+async def metrics():
+    """Report tile render queue depth and wait time per priority class in the Prometheus text format."""
+    content = tile_render.renderer.metrics() if tile_render.renderer else ""
+    return Response(content=content, media_type="text/plain; version=0.0.4")
+
+
+@router.get("/debug/check-file/{filename}")
+async def debug_check_file(filename: str):
+    """Debugging route to check if FastAPI can access a specific file."""
+    file_path = SLIDES_DIR / filename
+    return {
+        "exists": file_path.exists(),
+        "is_file": file_path.is_file(),
+        "absolute_path": str(file_path),
+    }
@@ -78,6 +78,133 @@ class RedisCacheSettings(BaseSettings):
 
 class ClientSideCacheSettings(BaseSettings):
     CLIENT_CACHE_MAX_AGE: int = config("CLIENT_CACHE_MAX_AGE", default=60)
+    TILE_CLIENT_CACHE_MAX_AGE: int = config("TILE_CLIENT_CACHE_MAX_AGE", default=31536000)
+
+
+class SlideStorageSettings(BaseSettings):
+    SLIDES_DIR: str = config("SLIDES_DIR", default="/code/slides")
+    DICOM_INDEX_DIR: str = config("DICOM_INDEX_DIR", default="/code/dicom_index")
+
+
+class SlideCatalogSettings(BaseSettings):
+    SLIDE_CATALOG_WATCH: bool = config("SLIDE_CATALOG_WATCH", default=True)
+    SLIDE_CATALOG_POLL_SECONDS: int = config("SLIDE_CATALOG_POLL_SECONDS", default=60)
+    # inotify does not see changes made by other hosts on network mounts, so those need polling.
+    SLIDE_CATALOG_FORCE_POLLING: bool = config("SLIDE_CATALOG_FORCE_POLLING", default=False)
+
+
+class SlideNormalizationSettings(BaseSettings):
+    NORMALIZED_SLIDES_DIR: str = config("NORMALIZED_SLIDES_DIR", default="/code/normalized_slides")
+    # Queue normalization for every new or modified slide; the job skips slides that are fast as they are.
+    SLIDE_NORMALIZE_ON_INGEST: bool = config("SLIDE_NORMALIZE_ON_INGEST", default=False)
+    SLIDE_NORMALIZE_WORKERS: int = config("SLIDE_NORMALIZE_WORKERS", default=os.cpu_count() or 1)
+    SLIDE_NORMALIZE_QUALITY: int = config("SLIDE_NORMALIZE_QUALITY", default=90)
+    SLIDE_NORMALIZE_BATCH_SIZE: int = config("SLIDE_NORMALIZE_BATCH_SIZE", default=64)
+    # Seconds a normalization job may run before the worker cancels it.
+    SLIDE_NORMALIZE_JOB_TIMEOUT: int = config("SLIDE_NORMALIZE_JOB_TIMEOUT", default=6 * 3600)
+
+
+class SlideStagingSettings(BaseSettings):
+    # Copy viewed slides from network storage to a local disk, and read tiles from the copies
+    SLIDE_STAGING: bool = config("SLIDE_STAGING", default=False)
+    SLIDE_STAGING_DIR: str = config("SLIDE_STAGING_DIR", default="/code/slide_staging")
+    SLIDE_STAGING_MAX_BYTES: int = config("SLIDE_STAGING_MAX_BYTES", default=200 * 1024**3)
+    # Seconds a staging copy may run before the worker cancels it; large slides on slow mounts take a while.
+    SLIDE_STAGING_JOB_TIMEOUT: int = config("SLIDE_STAGING_JOB_TIMEOUT", default=2 * 3600)
+
+
+class SlidePreviewSettings(BaseSettings):
+    SLIDE_PREVIEW_DIR: str = config("SLIDE_PREVIEW_DIR", default="/code/slide_previews")
+    SLIDE_PREVIEW_ON_INGEST: bool = config("SLIDE_PREVIEW_ON_INGEST", default=True)
+
+
+class SlideHandleCacheSettings(BaseSettings):
+    SLIDE_HANDLE_CACHE_SIZE: int = config("SLIDE_HANDLE_CACHE_SIZE", default=32)
+
+
+class SlideMetadataSettings(BaseSettings):
+    SLIDE_METADATA_CACHE_SIZE: int = config("SLIDE_METADATA_CACHE_SIZE", default=1024)
+    SLIDE_METADATA_CACHE_TTL: int = config("SLIDE_METADATA_CACHE_TTL", default=86400)
+
+
+class SlideRegionSettings(BaseSettings):
+    # Largest region, in output pixels, the region endpoint streams.
+    REGION_MAX_PIXELS: int = config("REGION_MAX_PIXELS", default=16384 * 16384)
+
+
+class TileRenderSettings(BaseSettings):
+    TILE_RENDER_WORKERS: int = config("TILE_RENDER_WORKERS", default=min(32, (os.cpu_count() or 1) + 4))
+    TILE_RENDER_PER_SLIDE_LIMIT: int = config("TILE_RENDER_PER_SLIDE_LIMIT", default=4)
+    TILE_RENDER_QUEUE_LIMIT: int = config("TILE_RENDER_QUEUE_LIMIT", default=256)
+
+
+class TileCacheSettings(BaseSettings):
+    TILE_CACHE_MAX_BYTES: int = config("TILE_CACHE_MAX_BYTES", default=256 * 1024 * 1024)
+    TILE_CACHE_REDIS_SPILL: bool = config("TILE_CACHE_REDIS_SPILL", default=False)
+    TILE_CACHE_REDIS_TTL: int = config("TILE_CACHE_REDIS_TTL", default=3600)
+
+
+class TileSingleFlightSettings(BaseSettings):
+    TILE_SINGLE_FLIGHT: bool = config("TILE_SINGLE_FLIGHT", default=True)
+    # Coalesces across worker processes; they pick up each other's tiles through TILE_CACHE_REDIS_SPILL.
+    TILE_SINGLE_FLIGHT_REDIS_LOCK: bool = config("TILE_SINGLE_FLIGHT_REDIS_LOCK", default=False)
+    TILE_SINGLE_FLIGHT_LOCK_TIMEOUT: float = config("TILE_SINGLE_FLIGHT_LOCK_TIMEOUT", default=10.0)
+
+
+class TilePrefetchSettings(BaseSettings):
+    TILE_PREFETCH: bool = config("TILE_PREFETCH", default=True)
+    # Tiles each viewer session may prefetch per window of TILE_PREFETCH_WINDOW seconds.
+    TILE_PREFETCH_BUDGET: int = config("TILE_PREFETCH_BUDGET", default=64)
+    TILE_PREFETCH_WINDOW: float = config("TILE_PREFETCH_WINDOW", default=10.0)
+    TILE_PREFETCH_CONCURRENCY: int = config("TILE_PREFETCH_CONCURRENCY", default=2)
+
+
+class SlideAffinitySettings(BaseSettings):
+    # Comma-separated host:port of the app processes the generated nginx config hashes slides across
+    SLIDE_AFFINITY_BACKENDS: str = config("SLIDE_AFFINITY_BACKENDS", default="web:8000")
+
+
+class LevelSynthesisSettings(BaseSettings):
+    LEVEL_SYNTHESIS_DIR: str = config("LEVEL_SYNTHESIS_DIR", default="/code/level_cache")
+    # A level is synthesized when each of its pixels reads at least this many stored pixels per axis.
+    LEVEL_SYNTHESIS_MIN_RATIO: float = config("LEVEL_SYNTHESIS_MIN_RATIO", default=4.0)
+    LEVEL_SYNTHESIS_MAX_PIXELS: int = config("LEVEL_SYNTHESIS_MAX_PIXELS", default=4096 * 4096)
+    LEVEL_SYNTHESIS_ON_INGEST: bool = config("LEVEL_SYNTHESIS_ON_INGEST", default=True)
+
+
+class TissueMaskSettings(BaseSettings):
+    TISSUE_MASK_DIR: str = config("TISSUE_MASK_DIR", default="/code/tissue_masks")
+    # Largest side of the DeepZoom level the mask is thresholded from.
+    TISSUE_MASK_SIZE: int = config("TISSUE_MASK_SIZE", default=2048)
+    TISSUE_MASK_CACHE_SIZE: int = config("TISSUE_MASK_CACHE_SIZE", default=256)
+    TISSUE_MASK_ON_INGEST: bool = config("TISSUE_MASK_ON_INGEST", default=True)
+
+
+class TileEncodingSettings(BaseSettings):
+    TILE_QUALITY: int = config("TILE_QUALITY", default=75)
+    # Comma-separated depth:quality[:subsampling] entries, depth counted in levels below full resolution.
+    TILE_QUALITY_PROFILES: str = config("TILE_QUALITY_PROFILES", default="")
+    TILE_NEGOTIATE_FORMAT: bool = config("TILE_NEGOTIATE_FORMAT", default=True)
+
+
+class TileStoreSettings(BaseSettings):
+    TILE_STORE_DIR: str = config("TILE_STORE_DIR", default="/code/tile_store")
+    TILE_STORE_ACCEL_PREFIX: str | None = config("TILE_STORE_ACCEL_PREFIX", default=None)
+    PYRAMID_WORKERS: int = config("PYRAMID_WORKERS", default=os.cpu_count() or 1)
+    PYRAMID_CHUNK_SIZE: int = config("PYRAMID_CHUNK_SIZE", default=128)
+    # Seconds a pyramid job may run before the worker cancels it; whole-slide pyramids take hours.
+    PYRAMID_JOB_TIMEOUT: int = config("PYRAMID_JOB_TIMEOUT", default=6 * 3600)
+
+
+class DicomConversionSettings(BaseSettings):
+    DICOM_CONVERT_DIR: str = config("DICOM_CONVERT_DIR", default="/code/dicom_converted")
+    DICOM_CONVERT_TILE_SIZE: int = config("DICOM_CONVERT_TILE_SIZE", default=256)
+    DICOM_CONVERT_QUALITY: int = config("DICOM_CONVERT_QUALITY", default=90)
+    DICOM_CONVERT_WORKERS: int = config("DICOM_CONVERT_WORKERS", default=os.cpu_count() or 1)
+    # Frames per batch sent to a worker process; at most two batches per process are in flight.
+    DICOM_CONVERT_BATCH_SIZE: int = config("DICOM_CONVERT_BATCH_SIZE", default=64)
+    # Seconds a conversion job may run before the worker cancels it.
+    DICOM_CONVERT_JOB_TIMEOUT: int = config("DICOM_CONVERT_JOB_TIMEOUT", default=6 * 3600)
 
 
 class RedisQueueSettings(BaseSettings):
@@ -114,6 +241,24 @@ class Settings(
     TestSettings,
     RedisCacheSettings,
     ClientSideCacheSettings,
+    SlideStorageSettings,
+    SlideCatalogSettings,
+    SlideNormalizationSettings,
+    SlideStagingSettings,
+    SlidePreviewSettings,
+    SlideHandleCacheSettings,
+    SlideMetadataSettings,
+    SlideRegionSettings,
+    TileRenderSettings,
+    TileCacheSettings,
+    TileSingleFlightSettings,
+    TilePrefetchSettings,
+    SlideAffinitySettings,
+    LevelSynthesisSettings,
+    TissueMaskSettings,
+    TileEncodingSettings,
+    TileStoreSettings,
+    DicomConversionSettings,
     RedisQueueSettings,
     RedisRateLimiterSettings,
     DefaultRateLimitSettings,
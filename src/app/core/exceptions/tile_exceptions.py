@@ -0,0 +1,11 @@
+class TileQueueFullError(Exception):
+    def __init__(self, message: str = "Tile render queue is full.", retry_after: int = 1) -> None:
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(self.message)
+
+
+class ClientDisconnectedError(Exception):
+    def __init__(self, message: str = "Client disconnected before the tile was ready.") -> None:
+        self.message = message
+        super().__init__(self.message)
@@ -1,42 +1,68 @@
-from collections.abc import AsyncGenerator, Callable
+from collections.abc import AsyncGenerator, Awaitable, Callable
 from contextlib import _AsyncGeneratorContextManager, asynccontextmanager
-from typing import Any
+from pathlib import Path
+from typing import Any, NamedTuple
 
-import json
-import pydicom
 import anyio
 import fastapi
 import redis.asyncio as redis
 from arq import create_pool
 from arq.connections import RedisSettings
-from fastapi import APIRouter, Depends, FastAPI,Request, Response
+from fastapi import APIRouter, Depends, FastAPI, Request
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
+from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from pathlib import Path
-from fastapi.responses import HTMLResponse, JSONResponse
-
-from .logger import logging
-
-import openslide
-from openslide.deepzoom import DeepZoomGenerator
 
 from ..api.dependencies import get_current_superuser
+from ..api.viewer import router as viewer_router
 from ..middleware.client_cache_middleware import ClientCacheMiddleware
+from ..models import *
 from .config import (
     AppSettings,
     ClientSideCacheSettings,
     DatabaseSettings,
     EnvironmentOption,
     EnvironmentSettings,
+    LevelSynthesisSettings,
     RedisCacheSettings,
     RedisQueueSettings,
     RedisRateLimiterSettings,
+    SlideHandleCacheSettings,
+    SlideMetadataSettings,
+    SlideNormalizationSettings,
+    SlidePreviewSettings,
+    SlideStagingSettings,
+    TileCacheSettings,
+    TilePrefetchSettings,
+    TileRenderSettings,
+    TileSingleFlightSettings,
+    TileStoreSettings,
+    TissueMaskSettings,
     settings,
 )
-from .db.database import Base, async_engine as engine
-from .utils import cache, queue, rate_limit
-from ..models import *
+from .db.database import Base
+from .db.database import async_engine as engine
+from .logger import logging
+from .utils import (
+    cache,
+    dicom_wsi,
+    level_synthesis,
+    queue,
+    rate_limit,
+    single_flight,
+    slide_cache,
+    slide_metadata,
+    slide_normalize,
+    slide_previews,
+    slide_staging,
+    tile_cache,
+    tile_prefetch,
+    tile_render,
+    tile_store,
+    tissue_mask,
+)
+from .utils.tile_render import RenderPriority
 
 #Logger
 logger = logging.getLogger(__name__)
@@ -45,44 +71,9 @@ logger = logging.getLogger(__name__)
 # Define templates directory
 TEMPLATES_DIR = Path(__file__).parent.parent / "templates"
 
-# Define a test slide load in
-#SLIDES_DIR = Path(__file__).parent / "slides" 
-# Needs fixing for configurable value
-SLIDES_DIR = Path("/code/slides") 
-logger.info(f"Checking slides directory: {SLIDES_DIR}") 
-
 # Initialize Jinja2
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-# -------------- deepzoom --------------
-# Function to create DeepZoom tiles
-def get_deepzoom(slide_path):
-    """Generate DeepZoom tiles from an OpenSlide image."""
-    slide = openslide.OpenSlide(str(slide_path))
-    return DeepZoomGenerator(slide, tile_size=256, overlap=1, limit_bounds=True)
-
-
-
-def extract_filtered_metadata(dicom_sample):
-    """Extract DICOM metadata while **excluding** base64/binary fields."""
-    dicom_dict = {}
-
-    for tag in dicom_sample.keys():
-        tag_data = dicom_sample[tag].value
-
-        # **Skip pixel data & known large binary fields**
-        if tag in [pydicom.tag.Tag(0x7FE00010), pydicom.tag.Tag(0x00420011)]:  
-            continue  # Skip pixel data (huge binary) & encapsulated PDFs
-
-        # **Skip large binary fields automatically** (anything over 1000 chars)
-        if isinstance(tag_data, bytes) and len(tag_data) > 1000:
-            continue  # Prevents dumping large base64 data
-        
-        # **Convert to string for safe JSON serialization**
-        dicom_dict[str(tag)] = str(tag_data)
-
-    return dicom_dict
-
 # -------------- database --------------
 async def create_tables() -> None:
     async with engine.begin() as conn:
@@ -118,12 +109,169 @@ async def close_redis_rate_limit_pool() -> None:
     await rate_limit.client.aclose()  # type: ignore
 
 
+# -------------- slide handles --------------
+async def create_slide_handle_cache() -> None:
+    slide_cache.handles = slide_cache.SlideHandleCache(max_handles=settings.SLIDE_HANDLE_CACHE_SIZE)
+    dicom_wsi.slides = dicom_wsi.DicomSlideCache(
+        max_slides=settings.SLIDE_HANDLE_CACHE_SIZE, index=dicom_wsi.DicomSeriesIndex(settings.DICOM_INDEX_DIR)
+    )
+
+
+async def close_slide_handle_cache() -> None:
+    slide_cache.handles.clear()  # type: ignore
+    dicom_wsi.slides.clear()  # type: ignore
+
+
+# -------------- slide metadata --------------
+async def create_slide_metadata_cache() -> None:
+    slide_metadata.metadata = slide_metadata.SlideMetadataCache(
+        max_entries=settings.SLIDE_METADATA_CACHE_SIZE, redis_ttl=settings.SLIDE_METADATA_CACHE_TTL
+    )
+
+
+async def close_slide_metadata_cache() -> None:
+    slide_metadata.metadata.clear()  # type: ignore
+
+
+# -------------- slide normalization --------------
+async def create_normalized_slide_store() -> None:
+    slide_normalize.store = slide_normalize.NormalizedSlideStore(settings.NORMALIZED_SLIDES_DIR)
+
+
+# -------------- slide staging --------------
+async def create_slide_staging_cache() -> None:
+    if settings.SLIDE_STAGING:
+        slide_staging.store = slide_staging.SlideStagingCache(
+            settings.SLIDE_STAGING_DIR, settings.SLIDE_STAGING_MAX_BYTES
+        )
+
+
+# -------------- slide previews --------------
+async def create_slide_preview_store() -> None:
+    slide_previews.store = slide_previews.PreviewStore(settings.SLIDE_PREVIEW_DIR)
+
+
+# -------------- level synthesis --------------
+async def create_level_synthesis_store() -> None:
+    level_synthesis.store = level_synthesis.LevelSynthesisStore(settings.LEVEL_SYNTHESIS_DIR)
+
+
+async def close_level_synthesis_store() -> None:
+    level_synthesis.store.clear()  # type: ignore
+
+
+# -------------- tissue mask --------------
+async def create_tissue_mask_store() -> None:
+    tissue_mask.store = tissue_mask.TissueMaskStore(
+        settings.TISSUE_MASK_DIR, max_loaded=settings.TISSUE_MASK_CACHE_SIZE
+    )
+
+
+async def close_tissue_mask_store() -> None:
+    tissue_mask.store.clear()  # type: ignore
+
+
+# -------------- tile render --------------
+async def create_tile_renderer() -> None:
+    tile_render.renderer = tile_render.TileRenderer(
+        max_workers=settings.TILE_RENDER_WORKERS,
+        per_slide_limit=settings.TILE_RENDER_PER_SLIDE_LIMIT,
+        max_queue_depth=settings.TILE_RENDER_QUEUE_LIMIT,
+    )
+
+
+async def close_tile_renderer() -> None:
+    tile_render.renderer.shutdown()  # type: ignore
+
+
+# -------------- tile single flight --------------
+async def create_tile_single_flight() -> None:
+    single_flight.flights = single_flight.SingleFlight(
+        redis_lock=settings.TILE_SINGLE_FLIGHT_REDIS_LOCK, lock_timeout=settings.TILE_SINGLE_FLIGHT_LOCK_TIMEOUT
+    )
+
+
+# -------------- tile prefetch --------------
+def renderer_busy() -> bool:
+    """Whether requested tiles are waiting for a render thread, so prefetches should not add to the queue."""
+    return tile_render.renderer is not None and tile_render.renderer.queued(RenderPriority.INTERACTIVE) > 0
+
+
+async def create_tile_prefetcher() -> None:
+    tile_prefetch.prefetcher = tile_prefetch.TilePrefetcher(
+        budget=settings.TILE_PREFETCH_BUDGET,
+        window=settings.TILE_PREFETCH_WINDOW,
+        max_concurrent=settings.TILE_PREFETCH_CONCURRENCY,
+        busy=renderer_busy,
+    )
+
+
+async def close_tile_prefetcher() -> None:
+    tile_prefetch.prefetcher.cancel_all()  # type: ignore
+
+
+# -------------- tile cache --------------
+async def create_tile_cache() -> None:
+    tile_cache.tiles = tile_cache.TileCache(
+        max_bytes=settings.TILE_CACHE_MAX_BYTES,
+        spill_to_redis=settings.TILE_CACHE_REDIS_SPILL,
+        redis_ttl=settings.TILE_CACHE_REDIS_TTL,
+    )
+
+
+async def close_tile_cache() -> None:
+    tile_cache.tiles.clear()  # type: ignore
+
+
+# -------------- tile store --------------
+async def create_tile_store() -> None:
+    tile_store.store = tile_store.TileStore(settings.TILE_STORE_DIR)
+
+
 # -------------- application --------------
 async def set_threadpool_tokens(number_of_tokens: int = 100) -> None:
     limiter = anyio.to_thread.current_default_thread_limiter()
     limiter.total_tokens = number_of_tokens
 
 
+class LifespanResource(NamedTuple):
+    """A module global created at startup and closed at shutdown when the app settings include `settings`."""
+
+    settings: type
+    create: Callable[[], Awaitable[None]]
+    close: Callable[[], Awaitable[None]] | None = None
+    flag: str | None = None  # Setting that also has to be true
+
+
+# In start order
+LIFESPAN_RESOURCES = (
+    LifespanResource(RedisCacheSettings, create_redis_cache_pool, close_redis_cache_pool),
+    LifespanResource(RedisQueueSettings, create_redis_queue_pool, close_redis_queue_pool),
+    LifespanResource(RedisRateLimiterSettings, create_redis_rate_limit_pool, close_redis_rate_limit_pool),
+    LifespanResource(SlideHandleCacheSettings, create_slide_handle_cache, close_slide_handle_cache),
+    LifespanResource(SlideMetadataSettings, create_slide_metadata_cache, close_slide_metadata_cache),
+    LifespanResource(SlideNormalizationSettings, create_normalized_slide_store),
+    LifespanResource(SlideStagingSettings, create_slide_staging_cache),
+    LifespanResource(SlidePreviewSettings, create_slide_preview_store),
+    LifespanResource(TileRenderSettings, create_tile_renderer, close_tile_renderer),
+    LifespanResource(TileCacheSettings, create_tile_cache, close_tile_cache),
+    LifespanResource(TileSingleFlightSettings, create_tile_single_flight, flag="TILE_SINGLE_FLIGHT"),
+    LifespanResource(TilePrefetchSettings, create_tile_prefetcher, close_tile_prefetcher, "TILE_PREFETCH"),
+    LifespanResource(LevelSynthesisSettings, create_level_synthesis_store, close_level_synthesis_store),
+    LifespanResource(TissueMaskSettings, create_tissue_mask_store, close_tissue_mask_store),
+    LifespanResource(TileStoreSettings, create_tile_store),
+)
+
+
+def lifespan_resources(settings: Any) -> list[LifespanResource]:
+    """Return the resources the app settings ask for, in start order."""
+    return [
+        resource
+        for resource in LIFESPAN_RESOURCES
+        if isinstance(settings, resource.settings) and (resource.flag is None or getattr(settings, resource.flag))
+    ]
+
+
 def lifespan_factory(
     settings: (
         DatabaseSettings
@@ -132,6 +280,18 @@ def lifespan_factory(
         | ClientSideCacheSettings
         | RedisQueueSettings
         | RedisRateLimiterSettings
+        | SlideHandleCacheSettings
+        | SlideMetadataSettings
+        | SlideNormalizationSettings
+        | SlideStagingSettings
+        | SlidePreviewSettings
+        | TileRenderSettings
+        | TileCacheSettings
+        | TileSingleFlightSettings
+        | TilePrefetchSettings
+        | LevelSynthesisSettings
+        | TissueMaskSettings
+        | TileStoreSettings
         | EnvironmentSettings
     ),
     create_tables_on_start: bool = True,
@@ -145,25 +305,16 @@ def lifespan_factory(
         if isinstance(settings, DatabaseSettings) and create_tables_on_start:
             await create_tables()
 
-        if isinstance(settings, RedisCacheSettings):
-            await create_redis_cache_pool()
-
-        if isinstance(settings, RedisQueueSettings):
-            await create_redis_queue_pool()
-
-        if isinstance(settings, RedisRateLimiterSettings):
-            await create_redis_rate_limit_pool()
+        resources = lifespan_resources(settings)
+        for resource in resources:
+            await resource.create()
 
         yield
 
-        if isinstance(settings, RedisCacheSettings):
-            await close_redis_cache_pool()
-
-        if isinstance(settings, RedisQueueSettings):
-            await close_redis_queue_pool()
-
-        if isinstance(settings, RedisRateLimiterSettings):
-            await close_redis_rate_limit_pool()
+        # Torn down in reverse, so nothing outlives what it uses, such as the prefetcher its renderer.
+        for resource in reversed(resources):
+            if resource.close is not None:
+                await resource.close()
 
     return lifespan
 
@@ -178,6 +329,18 @@ def create_application(
         | ClientSideCacheSettings
         | RedisQueueSettings
         | RedisRateLimiterSettings
+        | SlideHandleCacheSettings
+        | SlideMetadataSettings
+        | SlideNormalizationSettings
+        | SlideStagingSettings
+        | SlidePreviewSettings
+        | TileRenderSettings
+        | TileCacheSettings
+        | TileSingleFlightSettings
+        | TilePrefetchSettings
+        | LevelSynthesisSettings
+        | TissueMaskSettings
+        | TileStoreSettings
         | EnvironmentSettings
     ),
     create_tables_on_start: bool = True,
@@ -203,6 +366,18 @@ def create_application(
         - ClientSideCacheSettings: Integrates middleware for client-side caching.
         - RedisQueueSettings: Sets up event handlers for creating and closing a Redis queue pool.
         - RedisRateLimiterSettings: Sets up event handlers for creating and closing a Redis rate limiter pool.
+        - SlideHandleCacheSettings: Sets up event handlers for creating and closing the slide handle cache.
+        - SlideMetadataSettings: Sets up event handlers for creating and clearing the slide metadata cache.
+        - SlideNormalizationSettings: Renders tiles from normalized tiled TIFF copies of slow slide formats.
+        - SlideStagingSettings: Reads tiles from local disk copies of slides kept on network storage.
+        - SlidePreviewSettings: Serves precomputed thumbnail, label and macro previews from the preview store.
+        - TileRenderSettings: Sets up event handlers for starting and stopping the tile render executor.
+        - TileCacheSettings: Sets up event handlers for creating and clearing the encoded tile cache.
+        - TileSingleFlightSettings: Coalesces concurrent renders of the same tile, optionally across workers.
+        - TilePrefetchSettings: Prefetches the tiles around each served tile into the tile cache at low priority.
+        - LevelSynthesisSettings: Serves low-resolution tiles of sparse-level slides from synthesized levels.
+        - TissueMaskSettings: Answers tiles that fall entirely on glass with a shared blank tile.
+        - TileStoreSettings: Serves pre-rendered pyramids from the on-disk tile store when present.
         - EnvironmentSettings: Conditionally sets documentation URLs and integrates custom routes for API documentation
           based on the environment type.
 
@@ -255,7 +430,7 @@ def create_application(
         except Exception as e:
             logger.error(f"Error rendering {template_name}: {e}", exc_info=True)
             return HTMLResponse(content=f"<h1>500 Internal Server Error</h1><p>{e}</p>", status_code=500)
-    
+
     @application.get("/", response_class=HTMLResponse)
     async def home_page(request: Request):
         return await render_template(request, "index.html")
@@ -271,7 +446,7 @@ def create_application(
     @application.get("/database", response_class=HTMLResponse)
     async def database_page(request: Request):
         return await render_template(request, "database.html")
-    
+
     @application.get("/upload", response_class=HTMLResponse)
     async def upload_page(request: Request):
         return await render_template(request, "upload.html")
@@ -280,190 +455,8 @@ def create_application(
     async def upload_page(request: Request):
         return await render_template(request, "upload_ds.html")
 
-    # ---------- Viewer Route ----------
-    @application.get("/viewer", response_class=HTMLResponse)
-    async def viewer_page(request: Request):
-        """Render the DeepZoom viewer page with all supported slides (files & folders)."""
-        
-        slide_formats = {".svs", ".tiff", ".ndpi", ".vms", ".vmu", ".scn", ".mrxs", ".bif"}  # Common slide file types
-        slides = []
-
-        #Scan the /slides directory
-        for item in SLIDES_DIR.iterdir():
-            if item.is_file() and item.suffix.lower() in slide_formats:
-                slides.append(item.name)  # Normal slide files (.svs, .tiff)
-            elif item.is_dir():
-                # Handle folder-based slides like MRXS and DICOM
-                if any(f.suffix.lower() in {".dat", ".mrxs"} for f in item.iterdir()):
-                    slides.append(item.name)  # MRXS slide folder
-                elif any(f.suffix.lower() in {".dcm"} for f in item.iterdir()):
-                    slides.append(item.name)  # DICOM series folder
-
-        if not slides:
-            logger.warning("No slides found in /slides/")
-
-        return templates.TemplateResponse("viewer.html", {"request": request, "slides": slides})
-
-    # ---------- DeepZoom DZI Metadata ----------
-    @application.get("/dzi/{slide_name}.dzi")
-    async def get_dzi(slide_name: str):
-        """Serve Deep Zoom Image (DZI) metadata for a given slide."""
-        slide_path = SLIDES_DIR / slide_name
-
-        logger.info(f"Checking DZI for: {slide_name}, Full path: {slide_path}")
-
-        if not slide_path.exists():
-            slide_path = SLIDES_DIR / (slide_name + ".svs")  # Try appending .svs
-
-        if not slide_path.exists():
-            logger.error(f"Slide not found: {slide_name} at {slide_path}")
-            return JSONResponse(content={"error": "Slide not found"}, status_code=404)
-
-        try:
-            dzi = get_deepzoom(slide_path).get_dzi("jpeg")
-
-            # Fix the Tile URL in DZI XML
-            corrected_dzi = dzi.replace(f"{slide_name}_files/", f"tiles/{slide_name}/")
-            logger.info(f"DZI successfully generated for: {slide_name}")
-            return Response(content=corrected_dzi, media_type="application/xml")
-        except Exception as e:
-            logger.error(f"Error generating DZI for {slide_name}: {e}")
-            return JSONResponse(content={"error": str(e)}, status_code=500)
-
-
-    # ---------- DeepZoom Tile Fetching ----------
-    @application.get("/tiles/{slide_name}/{level}/{col}_{row}.jpeg")
-    async def get_tile(slide_name: str, level: int, col: int, row: int):
-        """Serve DeepZoom tiles for the viewer."""
-        slide_path = SLIDES_DIR / slide_name
-
-        if not slide_path.exists():
-            logger.error(f"Slide not found: {slide_name}")
-            return JSONResponse(content={"error": "Slide not found"}, status_code=404)
-
-        try:
-            dzi_gen = get_deepzoom(slide_path)
-            tile = dzi_gen.get_tile(level, (col, row))
-        except ValueError:
-            logger.error(f"Invalid tile request: level={level}, col={col}, row={row}")
-            return JSONResponse(content={"error": "Invalid tile coordinates"}, status_code=404)
-
-        from io import BytesIO
-        buffer = BytesIO()
-        tile.save(buffer, format="JPEG")
-
-        return Response(content=buffer.getvalue(), media_type="image/jpeg")
-    
-    @application.head("/tiles/{slide_name}/{level}/{col}_{row}.jpeg")
-    async def get_tile_head(slide_name: str, level: int, col: int, row: int):
-        """Handles HEAD requests for tiles (avoid fetching full image)."""
-        slide_path = SLIDES_DIR / slide_name
-
-        if not slide_path.exists():
-            return JSONResponse(content={"error": "Slide not found"}, status_code=404)
-
-        try:
-            dzi_gen = get_deepzoom(slide_path)
-            dzi_gen.get_tile(level, (col, row))  # Just check if tile exists
-            return Response(status_code=200)
-        except ValueError:
-            return JSONResponse(content={"error": "Invalid tile coordinates"}, status_code=404)
-
-    
-    @application.get("/metadata/{slide_name}")
-    async def get_metadata(slide_name: str):
-        """Return metadata for a given slide (SVS, TIFF, DICOM, etc.)."""
-        slide_path = SLIDES_DIR / slide_name
-        logger.info(f"Fetching metadata for: {slide_name}, Full path: {slide_path}")
-
-        if not slide_path.exists():
-            logger.error(f"Slide not found: {slide_name} at {slide_path}")
-            return JSONResponse(content={"error": "Slide not found"}, status_code=404)
-
-        # **DICOM Handling (Folder-Based Slides)**
-        if slide_path.is_dir():
-            dicom_files = list(slide_path.glob("*.dcm"))
-            if dicom_files:
-                try:
-                    dicom_sample = pydicom.dcmread(str(dicom_files[0]))
-
-                    # **Filtered DICOM Metadata (No Base64)**
-                    filtered_metadata = extract_filtered_metadata(dicom_sample)
-
-                    # **Log Safe Metadata**
-                    logger.info(f"Filtered DICOM metadata for {slide_name}: {json.dumps(filtered_metadata, indent=4)}")
-                    patient_name = dicom_sample.PatientName if "PatientName" in dicom_sample else "Unknown"
-                    patientID = dicom_sample.PatientID if "PatientID" in dicom_sample else "Unknown"
-                    specimenDescriptionSequence = dicom_sample.SpecimenDescriptionSequence if "SpecimenDescriptionSequence" in dicom_sample else "Unknown"
-                    acquisitionDate = dicom_sample.get("AcquisitionDate", "Unknown")
-
-                    
-                    logger.info(patient_name)
-                    logger.info("Patient ID: " + patientID)
-                    logger.info(specimenDescriptionSequence)
-                    logger.info("Acquisition: " + acquisitionDate)
-
-                    # **Extract Image Size**
-                    width = int(dicom_sample.Columns) if hasattr(dicom_sample, "Columns") else 1024
-                    height = int(dicom_sample.Rows) if hasattr(dicom_sample, "Rows") else 1024
-
-                    metadata = {
-                        "levels": 1,  # DICOM usually has only 1 level
-                        "tile_size": 256,
-                        "level_dimensions": [(width, height)],  # Fake single-level
-                        "max_width": width,
-                        "max_height": height,
-                        "metadata": filtered_metadata,  # Only safe metadata
-                    }
-
-                    return JSONResponse(metadata)
-
-                except Exception as e:
-                    logger.error(f"Error reading DICOM metadata for {slide_name}: {e}", exc_info=True)
-                    return JSONResponse(content={"error": str(e)}, status_code=500)
-
-        # **Standard Slide Handling (.svs, .tiff, etc.)**
-        try:
-            slide = openslide.OpenSlide(str(slide_path))
-            dzi_gen = openslide.deepzoom.DeepZoomGenerator(slide, tile_size=256, overlap=1, limit_bounds=True)
-
-            # Use the **highest resolution level** for size
-            max_level = dzi_gen.level_count - 1
-            max_size = dzi_gen.level_dimensions[max_level]
-
-            metadata = {
-                "levels": dzi_gen.level_count,
-                "tile_size": 256,
-                "level_dimensions": dzi_gen.level_dimensions,
-                "max_width": max_size[0],
-                "max_height": max_size[1],
-                "macroscopy": "Placeholder macroscopy data",
-                "microscopy": "Placeholder microscopy data",
-                "clinical": "Placeholder clinical details",
-                "diagnosis": "Placeholder diagnosis"
-            }
-            logger.info(f"Metadata retrieved successfully for: {slide_name}")
-            return JSONResponse(metadata)
-        
-        except Exception as e:
-            logger.error(f"Error retrieving metadata for {slide_name} : {str(e)}")
-            return JSONResponse(content={"error": f"Internal Server Error: {str(e)}"}, status_code=500)
-    
-    @application.get("/debug/files")
-    async def debug_files():
-        """Debugging route to list all files in the slides directory."""
-        files = [f.name for f in SLIDES_DIR.glob("*")]
-        return {"files_found": files}
-    
-    @application.get("/debug/check-file/{filename}")
-    async def debug_check_file(filename: str):
-        """Debugging route to check if FastAPI can access a specific file."""
-        file_path = SLIDES_DIR / filename
-        return {
-            "exists": file_path.exists(),
-            "is_file": file_path.is_file(),
-            "absolute_path": str(file_path),
-        }
+    # Viewer, DZI, tile, metadata, region and preview routes
+    application.include_router(viewer_router)
 
     if isinstance(settings, ClientSideCacheSettings):
         application.add_middleware(ClientCacheMiddleware, max_age=settings.CLIENT_CACHE_MAX_AGE)
@@ -0,0 +1,293 @@
+import math
+import os
+import shutil
+import struct
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+
+import openslide
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import JPEGBaseline8Bit, generate_uid
+
+from ..logger import logging
+from .dicom_wsi import VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE
+from .slide_regions import read_openslide_region
+
+logger = logging.getLogger(__name__)
+
+# Explicit VR little endian headers of the elements written after the pydicom-encoded part of the dataset.
+EXTENDED_OFFSET_TABLE_TAG = b"\xe0\x7f\x01\x00"
+EXTENDED_OFFSET_TABLE_LENGTHS_TAG = b"\xe0\x7f\x02\x00"
+PIXEL_DATA_TAG = b"\xe0\x7f\x10\x00"
+LONG_ELEMENT_HEADER = struct.Struct("<4s2sHI")
+ITEM_HEADER = struct.Struct("<HHI")
+UNDEFINED_LENGTH = 0xFFFFFFFF
+SEQUENCE_DELIMITER = ITEM_HEADER.pack(0xFFFE, 0xE0DD, 0)
+
+# PIL's 4:2:2 chroma subsampling, matching the YBR_FULL_422 photometric interpretation of the frames.
+JPEG_SUBSAMPLING = 1
+
+
+class ConversionLevel(NamedTuple):
+    """A native level of the source slide, written as one DICOM instance."""
+
+    level: int
+    width: int
+    height: int
+    downsample: float
+    columns: int
+    rows: int
+
+    @property
+    def frame_count(self) -> int:
+        return self.columns * self.rows
+
+
+class SeriesUIDs(NamedTuple):
+    study: str
+    series: str
+    frame_of_reference: str
+    specimen: str
+
+
+def plan_levels(slide: openslide.AbstractSlide, tile_size: int) -> list[ConversionLevel]:
+    return [
+        ConversionLevel(
+            level,
+            width,
+            height,
+            slide.level_downsamples[level],
+            math.ceil(width / tile_size),
+            math.ceil(height / tile_size),
+        )
+        for level, (width, height) in enumerate(slide.level_dimensions)
+    ]
+
+
+def build_dataset(
+    slide: openslide.AbstractSlide,
+    level: ConversionLevel,
+    tile_size: int,
+    uids: SeriesUIDs,
+    container_id: str,
+    instance_number: int,
+) -> Dataset:
+    """Build the header of a VL Whole Slide Microscopy instance for one level, without its pixel data."""
+    now = datetime.now()
+    dataset = Dataset()
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.MediaStorageSOPClassUID = VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE
+    dataset.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    dataset.file_meta.TransferSyntaxUID = JPEGBaseline8Bit
+
+    dataset.SOPClassUID = VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE
+    dataset.SOPInstanceUID = dataset.file_meta.MediaStorageSOPInstanceUID
+    dataset.StudyInstanceUID = uids.study
+    dataset.SeriesInstanceUID = uids.series
+    dataset.FrameOfReferenceUID = uids.frame_of_reference
+    dataset.Modality = "SM"
+    dataset.InstanceNumber = instance_number
+    dataset.SeriesNumber = 1
+    dataset.PatientName = ""
+    dataset.PatientID = ""
+    dataset.PatientBirthDate = ""
+    dataset.PatientSex = ""
+    dataset.StudyDate = now.strftime("%Y%m%d")
+    dataset.StudyTime = now.strftime("%H%M%S")
+    dataset.AcquisitionDateTime = now.strftime("%Y%m%d%H%M%S")
+    dataset.ContentDate = dataset.StudyDate
+    dataset.ContentTime = dataset.StudyTime
+    dataset.StudyID = ""
+    dataset.AccessionNumber = ""
+    dataset.ReferringPhysicianName = ""
+    dataset.PositionReferenceIndicator = "SLIDE_CORNER"
+    dataset.Manufacturer = slide.properties.get(openslide.PROPERTY_NAME_VENDOR, "")
+    dataset.ManufacturerModelName = ""
+    dataset.DeviceSerialNumber = ""
+    dataset.SoftwareVersions = "PathWay"
+    dataset.ContainerIdentifier = container_id
+    dataset.IssuerOfTheContainerIdentifierSequence = Sequence()
+    dataset.ContainerTypeCodeSequence = Sequence([_code("433466003", "SCT", "Microscope slide")])
+    specimen = Dataset()
+    specimen.SpecimenIdentifier = container_id
+    specimen.SpecimenUID = uids.specimen
+    specimen.IssuerOfTheSpecimenIdentifierSequence = Sequence()
+    specimen.SpecimenPreparationSequence = Sequence()
+    dataset.SpecimenDescriptionSequence = Sequence([specimen])
+
+    base = level.level == 0
+    dataset.ImageType = ["DERIVED", "PRIMARY", "VOLUME", "NONE" if base else "RESAMPLED"]
+    dataset.BurnedInAnnotation = "NO"
+    dataset.SpecimenLabelInImage = "NO"
+    dataset.FocusMethod = "AUTO"
+    dataset.ExtendedDepthOfField = "NO"
+    dataset.VolumetricProperties = "VOLUME"
+    dataset.LossyImageCompression = "01"
+    dataset.LossyImageCompressionMethod = "ISO_10918_1"
+    dataset.DimensionOrganizationType = "TILED_FULL"
+    dataset.ImageOrientationSlide = [0, -1, 0, -1, 0, 0]
+    origin = Dataset()
+    origin.XOffsetInSlideCoordinateSystem = 0
+    origin.YOffsetInSlideCoordinateSystem = 0
+    dataset.TotalPixelMatrixOriginSequence = Sequence([origin])
+
+    dataset.SamplesPerPixel = 3
+    dataset.PhotometricInterpretation = "YBR_FULL_422"
+    dataset.PlanarConfiguration = 0
+    dataset.BitsAllocated = 8
+    dataset.BitsStored = 8
+    dataset.HighBit = 7
+    dataset.PixelRepresentation = 0
+    dataset.Rows = tile_size
+    dataset.Columns = tile_size
+    dataset.NumberOfFrames = level.frame_count
+    dataset.TotalPixelMatrixColumns = level.width
+    dataset.TotalPixelMatrixRows = level.height
+    dataset.TotalPixelMatrixFocalPlanes = 1
+    dataset.NumberOfOpticalPaths = 1
+
+    optical_path = Dataset()
+    optical_path.OpticalPathIdentifier = "1"
+    optical_path.IlluminationColorCodeSequence = Sequence([_code("414298005", "SCT", "Full Spectrum")])
+    optical_path.IlluminationTypeCodeSequence = Sequence([_code("111744", "DCM", "Brightfield illumination")])
+    objective_power = slide.properties.get(openslide.PROPERTY_NAME_OBJECTIVE_POWER)
+    if objective_power:
+        optical_path.ObjectiveLensPower = objective_power
+    dataset.OpticalPathSequence = Sequence([optical_path])
+
+    frame_type = Dataset()
+    frame_type.FrameType = dataset.ImageType
+    shared = Dataset()
+    shared.WholeSlideMicroscopyImageFrameTypeSequence = Sequence([frame_type])
+    mpp_x = slide.properties.get(openslide.PROPERTY_NAME_MPP_X)
+    mpp_y = slide.properties.get(openslide.PROPERTY_NAME_MPP_Y)
+    if mpp_x and mpp_y:
+        # Pixel Spacing is row spacing then column spacing, in millimeters.
+        spacing = [float(mpp_y) * level.downsample / 1000, float(mpp_x) * level.downsample / 1000]
+        measures = Dataset()
+        measures.PixelSpacing = [f"{value:.10g}" for value in spacing]
+        measures.SliceThickness = 0
+        shared.PixelMeasuresSequence = Sequence([measures])
+        dataset.ImagedVolumeWidth = f"{level.width * spacing[1]:.10g}"
+        dataset.ImagedVolumeHeight = f"{level.height * spacing[0]:.10g}"
+        dataset.ImagedVolumeDepth = 0
+    dataset.SharedFunctionalGroupsSequence = Sequence([shared])
+    return dataset
+
+
+def _code(value: str, scheme: str, meaning: str) -> Dataset:
+    code = Dataset()
+    code.CodeValue = value
+    code.CodingSchemeDesignator = scheme
+    code.CodeMeaning = meaning
+    return code
+
+
+class FrameWriter:
+    """Write a multi-frame encapsulated DICOM file frame by frame, so only the frame in hand is in memory.
+
+    The header is written first with an Extended Offset Table of zeros, whose size only depends on the
+    frame count. Each frame goes into its own item as it arrives, and the table is filled in on `close`.
+
+    Parameters
+    ----------
+    fp: BinaryIO
+        Seekable output file.
+    dataset: Dataset
+        Header of the instance, whose `NumberOfFrames` frames are written next.
+    """
+
+    def __init__(self, fp: BinaryIO, dataset: Dataset) -> None:
+        self.fp = fp
+        self.frame_count = int(dataset.NumberOfFrames)
+        self.offsets: list[int] = []
+        self.lengths: list[int] = []
+
+        header = BytesIO()
+        dataset.save_as(header, enforce_file_format=True)
+        fp.write(header.getvalue())
+
+        table_length = 8 * self.frame_count
+        fp.write(LONG_ELEMENT_HEADER.pack(EXTENDED_OFFSET_TABLE_TAG, b"OV", 0, table_length))
+        self._offsets_position = fp.tell()
+        fp.write(bytes(table_length))
+        fp.write(LONG_ELEMENT_HEADER.pack(EXTENDED_OFFSET_TABLE_LENGTHS_TAG, b"OV", 0, table_length))
+        self._lengths_position = fp.tell()
+        fp.write(bytes(table_length))
+
+        # Encapsulated pixel data, opened by an empty Basic Offset Table item.
+        fp.write(LONG_ELEMENT_HEADER.pack(PIXEL_DATA_TAG, b"OB", 0, UNDEFINED_LENGTH))
+        fp.write(ITEM_HEADER.pack(0xFFFE, 0xE000, 0))
+        self._first_fragment = fp.tell()
+        self.bytes_written = fp.tell()
+
+    def write(self, frame: bytes) -> None:
+        if len(self.offsets) >= self.frame_count:
+            raise ValueError(f"All {self.frame_count} frames were already written")
+
+        # Items have an even length; JPEG decoders ignore the padding after the EOI marker.
+        padding = len(frame) % 2
+        self.offsets.append(self.fp.tell() - self._first_fragment)
+        self.lengths.append(len(frame))
+        self.fp.write(ITEM_HEADER.pack(0xFFFE, 0xE000, len(frame) + padding))
+        self.fp.write(frame)
+        if padding:
+            self.fp.write(b"\x00")
+        self.bytes_written += 8 + len(frame) + padding
+
+    def close(self) -> None:
+        if len(self.offsets) != self.frame_count:
+            raise ValueError(f"Wrote {len(self.offsets)} frames, expected {self.frame_count}")
+
+        self.fp.write(SEQUENCE_DELIMITER)
+        end = self.fp.tell()
+        self.fp.seek(self._offsets_position)
+        self.fp.write(struct.pack(f"<{self.frame_count}Q", *self.offsets))
+        self.fp.seek(self._lengths_position)
+        self.fp.write(struct.pack(f"<{self.frame_count}Q", *self.lengths))
+        self.fp.seek(end)
+
+
+def encode_frames(
+    slide_path: str, level: ConversionLevel, addresses: list[tuple[int, int]], tile_size: int, quality: int
+) -> list[bytes]:
+    """Read and JPEG-encode a batch of frames of one level, in row-major order of `addresses`.
+
+    Runs in a worker process, so it opens its own slide handle. Frames crossing the right or bottom edge
+    keep the full tile size, padded with the slide background, as TILED_FULL frames require.
+    """
+    slide = openslide.open_slide(slide_path)
+    try:
+        frames = []
+        for col, row in addresses:
+            location = (round(col * tile_size * level.downsample), round(row * tile_size * level.downsample))
+            tile = read_openslide_region(slide, location, level.downsample, (tile_size, tile_size))
+            buffer = BytesIO()
+            tile.save(buffer, format="JPEG", quality=quality, subsampling=JPEG_SUBSAMPLING)
+            frames.append(buffer.getvalue())
+    finally:
+        slide.close()
+
+    return frames
+
+
+def series_dir(root: Path | str, slide_name: str) -> Path:
+    return Path(root) / Path(slide_name).stem
+
+
+def staging_dir(root: Path | str, slide_name: str) -> Path:
+    """Directory the series is written to, renamed to `series_dir` once every instance is complete."""
+    return Path(root) / f".{Path(slide_name).stem}.{os.getpid()}.partial"
+
+
+def publish_series(staging: Path, target: Path) -> None:
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(staging, target)
+
+
+def new_series_uids() -> SeriesUIDs:
+    return SeriesUIDs(generate_uid(), generate_uid(), generate_uid(), generate_uid())
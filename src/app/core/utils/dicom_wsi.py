@@ -0,0 +1,636 @@
+import hashlib
+import json
+import math
+import mmap
+import struct
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+import pydicom
+from PIL import Image
+
+from ..logger import logging
+from .slide_cache import DeepZoomOptions, SeriesSignature, SlideGeometry, series_signature, series_signatures
+from .tile_store import write_atomic
+
+logger = logging.getLogger(__name__)
+
+VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE = "1.2.840.10008.5.1.4.1.1.77.1.6"
+JPEG_BASELINE = "1.2.840.10008.1.2.4.50"
+UNCOMPRESSED_TRANSFER_SYNTAXES = {"1.2.840.10008.1.2", "1.2.840.10008.1.2.1"}
+PYRAMID_IMAGE_TYPES = {"VOLUME", "THUMBNAIL"}
+
+PIXEL_DATA_TAG = b"\xe0\x7f\x10\x00"
+ITEM_TAG = (0xFFFE, 0xE000)
+ITEM_HEADER = struct.Struct("<HHI")
+JPEG_EOI = b"\xff\xd9"
+
+DEFAULT_TILE_SIZE = 256
+MAX_COMPOSED_FRAMES = 64
+MAX_THUMBNAIL_FRAMES = 4096
+INDEX_VERSION = 1
+
+FrameSpans = tuple[tuple[int, int], ...]
+
+
+class DicomInstance(NamedTuple):
+    """One pyramid level of a DICOM WSI series and the location of its frames in the file.
+
+    `frames` holds the (offset, length) of the fragments of each frame, so a frame is read with plain slices
+    of the file. `frame_positions` holds the (col, row) of each frame of a TILED_SPARSE instance and is None
+    for TILED_FULL instances, whose frames are in row-major tile order.
+    """
+
+    path: str
+    width: int
+    height: int
+    tile_width: int
+    tile_height: int
+    transfer_syntax: str
+    samples_per_pixel: int
+    frames: tuple[FrameSpans, ...]
+    frame_positions: tuple[tuple[int, int], ...] | None = None
+
+    @property
+    def columns(self) -> int:
+        return math.ceil(self.width / self.tile_width)
+
+
+def is_dicom_series(slide_path: Path) -> bool:
+    """Return whether a slide path is a DICOM series folder, from its recently read signature."""
+    return slide_path.is_dir() and bool(series_signatures.get(slide_path))
+
+
+def read_instance(path: Path | str, image_types: set[str] = PYRAMID_IMAGE_TYPES) -> DicomInstance | None:
+    """Read the header of a DICOM file and locate its frames, without decoding any pixel data.
+
+    Frame locations come from the Extended Offset Table when present, otherwise from walking the item
+    headers of the encapsulated pixel data, grouped by the Basic Offset Table if there is one.
+
+    Returns
+    -------
+    DicomInstance | None
+        The instance, or None if the file is not a whole slide image of one of `image_types`, by default a
+        tiled pyramid level.
+    """
+    with open(path, "rb") as fp:
+        dataset = pydicom.dcmread(fp, stop_before_pixels=True)
+        pixel_data_position = fp.tell()
+
+    image_type = set(dataset.get("ImageType", []))
+    if dataset.get("SOPClassUID") != VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE or not image_type & image_types:
+        return None
+    if "ConcatenationUID" in dataset:
+        logger.warning(f"Skipping {path}: concatenated DICOM instances are not supported")
+        return None
+
+    transfer_syntax = str(dataset.file_meta.TransferSyntaxUID)
+    frame_count = int(dataset.get("NumberOfFrames", 1))
+    tile_width, tile_height = int(dataset.Columns), int(dataset.Rows)
+    samples_per_pixel = int(dataset.get("SamplesPerPixel", 1))
+
+    with open(path, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data[pixel_data_position : pixel_data_position + 4] != PIXEL_DATA_TAG:
+            pixel_data_position = data.find(PIXEL_DATA_TAG, pixel_data_position)
+        if pixel_data_position < 0:
+            logger.warning(f"Skipping {path}: no pixel data")
+            return None
+
+        # Explicit VR: tag, VR, 2 reserved bytes, 4-byte length. Implicit VR: tag, 4-byte length.
+        if data[pixel_data_position + 4 : pixel_data_position + 6] in (b"OB", b"OW"):
+            value_start = pixel_data_position + 12
+        else:
+            value_start = pixel_data_position + 8
+
+        if transfer_syntax in UNCOMPRESSED_TRANSFER_SYNTAXES:
+            if int(dataset.get("BitsAllocated", 8)) != 8:
+                logger.warning(f"Skipping {path}: only 8-bit uncompressed pixel data is supported")
+                return None
+            frame_length = tile_width * tile_height * samples_per_pixel
+            frames = tuple(((value_start + index * frame_length, frame_length),) for index in range(frame_count))
+        else:
+            frames = _encapsulated_frames(
+                data,
+                value_start,
+                frame_count,
+                dataset.get("ExtendedOffsetTable"),
+                dataset.get("ExtendedOffsetTableLengths"),
+            )
+
+    return DicomInstance(
+        path=str(path),
+        width=int(dataset.get("TotalPixelMatrixColumns", tile_width)),
+        height=int(dataset.get("TotalPixelMatrixRows", tile_height)),
+        tile_width=tile_width,
+        tile_height=tile_height,
+        transfer_syntax=transfer_syntax,
+        samples_per_pixel=samples_per_pixel,
+        frames=frames,
+        frame_positions=_sparse_frame_positions(dataset, tile_width, tile_height),
+    )
+
+
+def _encapsulated_frames(
+    data: mmap.mmap,
+    value_start: int,
+    frame_count: int,
+    extended_offsets: bytes | None,
+    extended_lengths: bytes | None,
+) -> tuple[FrameSpans, ...]:
+    """Locate the fragments of each frame of encapsulated pixel data."""
+    _, _, offset_table_length = ITEM_HEADER.unpack_from(data, value_start)
+    first_fragment = value_start + 8 + offset_table_length
+
+    # Offsets in both offset tables are relative to the first fragment's item tag.
+    if extended_offsets and extended_lengths:
+        offsets = np.frombuffer(extended_offsets, dtype="<u8")
+        lengths = np.frombuffer(extended_lengths, dtype="<u8")
+        return tuple(((first_fragment + int(offset) + 8, int(length)),) for offset, length in zip(offsets, lengths))
+
+    fragments: list[tuple[int, int, int]] = []
+    position = first_fragment
+    while position + 8 <= len(data):
+        group, element, length = ITEM_HEADER.unpack_from(data, position)
+        if (group, element) != ITEM_TAG:
+            break
+        fragments.append((position - first_fragment, position + 8, length))
+        position += 8 + length
+
+    if len(fragments) == frame_count:
+        return tuple(((start, length),) for _, start, length in fragments)
+
+    frames: list[list[tuple[int, int]]] = []
+    if offset_table_length:
+        frame_starts = set(struct.unpack_from(f"<{offset_table_length // 4}I", data, value_start + 8))
+        for relative_position, start, length in fragments:
+            if relative_position in frame_starts or not frames:
+                frames.append([])
+            frames[-1].append((start, length))
+    elif frame_count == 1:
+        frames = [[(start, length) for _, start, length in fragments]]
+    else:
+        # No offset table and several fragments per frame: each JPEG frame ends with an EOI marker.
+        current: list[tuple[int, int]] = []
+        for _, start, length in fragments:
+            current.append((start, length))
+            if data[max(start, start + length - 3) : start + length].rstrip(b"\x00").endswith(JPEG_EOI):
+                frames.append(current)
+                current = []
+
+    if len(frames) != frame_count:
+        raise ValueError(f"Found {len(frames)} frames in encapsulated pixel data, expected {frame_count}")
+
+    return tuple(tuple(frame) for frame in frames)
+
+
+def _sparse_frame_positions(
+    dataset: pydicom.Dataset, tile_width: int, tile_height: int
+) -> tuple[tuple[int, int], ...] | None:
+    if dataset.get("DimensionOrganizationType", "TILED_FULL") == "TILED_FULL":
+        return None
+
+    positions = []
+    for frame in dataset.PerFrameFunctionalGroupsSequence:
+        plane = frame.PlanePositionSlideSequence[0]
+        positions.append(
+            (
+                (int(plane.ColumnPositionInTotalImagePixelMatrix) - 1) // tile_width,
+                (int(plane.RowPositionInTotalImagePixelMatrix) - 1) // tile_height,
+            )
+        )
+    return tuple(positions)
+
+
+class DicomSeriesIndex:
+    """Persistent header index of DICOM series folders, one JSON sidecar per folder.
+
+    Each file of a series is recorded with its modification time and size next to the parsed instance, so
+    reopening a series only stats its files and reads the headers of files that were added or changed.
+    Files that are not pyramid levels are recorded too, so they are not parsed again either::
+
+        {root}/{sha1 of the folder path}.json
+
+    Parameters
+    ----------
+    root: Path | str
+        Directory holding the sidecar files.
+    """
+
+    def __init__(self, root: Path | str) -> None:
+        self.root = Path(root)
+
+    def index_path(self, folder: Path | str) -> Path:
+        digest = hashlib.sha1(str(Path(folder).resolve()).encode()).hexdigest()[:16]
+        return self.root / f"{digest}.json"
+
+    def load(self, folder: Path | str) -> list[DicomInstance]:
+        """Return the pyramid levels of a series, bringing its index up to date first. Blocking."""
+        folder = Path(folder).resolve()
+        entries = self._read(folder)
+
+        updated: dict[str, dict[str, Any]] = {}
+        for name, mtime_ns, size in series_signature(folder):
+            path = folder / name
+            signature = [mtime_ns, size]
+            entry = entries.get(name)
+            if entry is None or entry["signature"] != signature:
+                try:
+                    instance = read_instance(path)
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable DICOM file {path}: {e}")
+                    instance = None
+                entry = {"signature": signature, "instance": _instance_to_json(instance)}
+            updated[name] = entry
+
+        if updated != entries:
+            logger.info(f"Updated DICOM index of {folder}: {len(updated)} files, {len(entries)} previously")
+            self._write(folder, updated)
+
+        return [
+            _instance_from_json(folder / name, entry["instance"])
+            for name, entry in updated.items()
+            if entry["instance"] is not None
+        ]
+
+    def _read(self, folder: Path) -> dict[str, dict[str, Any]]:
+        try:
+            index = json.loads(self.index_path(folder).read_text())
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Ignoring corrupt DICOM index of {folder}: {e}")
+            return {}
+
+        return index["files"] if index.get("version") == INDEX_VERSION else {}
+
+    def _write(self, folder: Path, entries: dict[str, dict[str, Any]]) -> None:
+        try:
+            index = {"version": INDEX_VERSION, "folder": str(folder), "files": entries}
+            write_atomic(self.index_path(folder), json.dumps(index, separators=(",", ":")).encode())
+        except OSError as e:
+            logger.warning(f"Could not write DICOM index of {folder}: {e}")
+
+
+def _instance_to_json(instance: DicomInstance | None) -> dict[str, Any] | None:
+    if instance is None:
+        return None
+
+    fields = instance._asdict()
+    del fields["path"]
+    return json.loads(json.dumps(fields))
+
+
+def _instance_from_json(path: Path, fields: dict[str, Any]) -> DicomInstance:
+    positions = fields["frame_positions"]
+    return DicomInstance(
+        **{
+            **fields,
+            "path": str(path),
+            "frames": tuple(tuple((offset, length) for offset, length in frame) for frame in fields["frames"]),
+            "frame_positions": tuple((col, row) for col, row in positions) if positions is not None else None,
+        }
+    )
+
+
+class DicomSlide:
+    """DeepZoom view of a DICOM WSI series that serves stored frames without transcoding.
+
+    The series is exposed with the same geometry attributes and `get_dzi`/`get_tile` methods the tile routes
+    use on `DeepZoomGenerator`, with the frame size of the base level as tile size and no overlap. A DeepZoom
+    level that matches a stored level maps one-to-one onto its frames, so `read_native_tile` can return
+    JPEG frames byte for byte. Other levels, and edge tiles whose stored frame is padded, are composed from
+    the closest finer stored level.
+
+    Frames are read through memory maps of the instance files, which are shared by all render threads and
+    closed by `close` once no frame read uses them.
+
+    Parameters
+    ----------
+    instances: list[DicomInstance]
+        The pyramid levels of the series.
+    """
+
+    def __init__(self, instances: list[DicomInstance]) -> None:
+        if not instances:
+            raise ValueError("No tiled whole slide image instances found")
+
+        levels: dict[tuple[int, int], DicomInstance] = {}
+        for instance in sorted(instances, key=lambda instance: (-instance.width, instance.path)):
+            levels.setdefault((instance.width, instance.height), instance)
+        self.instances = list(levels.values())
+
+        base = self.instances[0]
+        self.tile_size = base.tile_width if base.tile_width == base.tile_height else DEFAULT_TILE_SIZE
+        self.overlap = 0
+
+        dimensions = [(base.width, base.height)]
+        while dimensions[-1][0] > 1 or dimensions[-1][1] > 1:
+            dimensions.append(tuple(max(1, math.ceil(size / 2)) for size in dimensions[-1]))  # type: ignore
+        self.level_dimensions: tuple[tuple[int, int], ...] = tuple(reversed(dimensions))
+        self.level_count = len(self.level_dimensions)
+        self.level_tiles = tuple(
+            (math.ceil(width / self.tile_size), math.ceil(height / self.tile_size))
+            for width, height in self.level_dimensions
+        )
+
+        self._maps: dict[str, mmap.mmap] = {}
+        self._positions: dict[str, dict[tuple[int, int], int]] = {}
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._closing = False
+
+    @classmethod
+    def from_folder(cls, folder: Path | str, index: DicomSeriesIndex | None = None) -> "DicomSlide":
+        if index is not None:
+            return cls(index.load(folder))
+
+        instances = []
+        for path in sorted(Path(folder).glob("*.dcm")):
+            try:
+                instance = read_instance(path)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable DICOM file {path}: {e}")
+                continue
+            if instance is not None:
+                instances.append(instance)
+
+        return cls(instances)
+
+    def geometry(self) -> SlideGeometry:
+        options = DeepZoomOptions(self.tile_size, self.overlap, limit_bounds=False)
+        return SlideGeometry(self.level_count, self.level_dimensions, self.level_tiles, options)
+
+    def get_dzi(self, format: str) -> str:
+        width, height = self.level_dimensions[-1]
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{format}" '
+            f'Overlap="{self.overlap}" TileSize="{self.tile_size}"><Size Height="{height}" Width="{width}" /></Image>'
+        )
+
+    def read_native_tile(self, level: int, col: int, row: int) -> bytes | None:
+        """Return the stored JPEG frame of a tile as is, or None when the tile has to be composed."""
+        self._check_address(level, col, row)
+        instance, factor = self._source(level)
+        if factor != 1.0 or instance.transfer_syntax != JPEG_BASELINE:
+            return None
+        if (instance.tile_width, instance.tile_height) != (self.tile_size, self.tile_size):
+            return None
+
+        # Edge frames are padded to the full frame size, while DeepZoom edge tiles are cropped.
+        level_width, level_height = self.level_dimensions[level]
+        right, bottom = (col + 1) * self.tile_size, (row + 1) * self.tile_size
+        if right > min(instance.width, level_width) or bottom > min(instance.height, level_height):
+            return None
+
+        index = self._frame_index(instance, col, row)
+        return self._read_frame(instance, index) if index is not None else None
+
+    def get_tile(self, level: int, address: tuple[int, int]) -> Image.Image:
+        """Compose a tile from the decoded frames of the closest finer stored level."""
+        col, row = address
+        self._check_address(level, col, row)
+
+        level_width, level_height = self.level_dimensions[level]
+        x, y = col * self.tile_size, row * self.tile_size
+        return self.read_region(
+            level, (x, y), (min(self.tile_size, level_width - x), min(self.tile_size, level_height - y))
+        )
+
+    def read_region(self, level: int, location: tuple[int, int], size: tuple[int, int]) -> Image.Image:
+        """Compose a region of a DeepZoom level, which must lie within the level, in that level's pixels."""
+        x, y = location
+        width, height = size
+        instance, factor = self._source(level)
+
+        left, top = int(x * factor), int(y * factor)
+        right = max(left + 1, min(math.ceil((x + width) * factor), instance.width))
+        bottom = max(top + 1, min(math.ceil((y + height) * factor), instance.height))
+        first_col, last_col = left // instance.tile_width, (right - 1) // instance.tile_width
+        first_row, last_row = top // instance.tile_height, (bottom - 1) // instance.tile_height
+        frame_count = (last_col - first_col + 1) * (last_row - first_row + 1)
+        if frame_count > MAX_COMPOSED_FRAMES:
+            raise ValueError(f"Region {level}/{x},{y} would need {frame_count} frames, no stored level is close")
+
+        region = Image.new("RGB", (right - left, bottom - top), "white")
+        for frame_row in range(first_row, last_row + 1):
+            for frame_col in range(first_col, last_col + 1):
+                index = self._frame_index(instance, frame_col, frame_row)
+                if index is None:
+                    continue
+                frame = self._decode_frame(instance, index)
+                region.paste(frame, (frame_col * instance.tile_width - left, frame_row * instance.tile_height - top))
+
+        if region.size != (width, height):
+            region = region.resize((width, height), Image.Resampling.BOX)
+        return region
+
+    def get_thumbnail(self, size: tuple[int, int]) -> Image.Image:
+        """Compose the whole image from the smallest DeepZoom level covering `size`, scaled to fit within it.
+
+        When no stored level is close to that level, its tiles are composed from too many frames each, so a
+        finer level is composed and scaled down instead.
+
+        Raises
+        ------
+        ValueError
+            If the whole image would be composed from more than `MAX_THUMBNAIL_FRAMES` frames.
+        """
+        level = next(
+            (
+                level
+                for level, (width, height) in enumerate(self.level_dimensions)
+                if width >= size[0] or height >= size[1]
+            ),
+            self.level_count - 1,
+        )
+        while level < self.level_count - 1 and self._tile_frames(level) > MAX_COMPOSED_FRAMES:
+            level += 1
+
+        instance, factor = self._source(level)
+        width, height = self.level_dimensions[level]
+        frame_count = math.ceil(min(width * factor, instance.width) / instance.tile_width) * math.ceil(
+            min(height * factor, instance.height) / instance.tile_height
+        )
+        if frame_count > MAX_THUMBNAIL_FRAMES:
+            raise ValueError(f"A thumbnail would need {frame_count} frames, no stored level is small enough")
+
+        image = Image.new("RGB", self.level_dimensions[level], "white")
+        cols, rows = self.level_tiles[level]
+        for row in range(rows):
+            for col in range(cols):
+                image.paste(self.get_tile(level, (col, row)), (col * self.tile_size, row * self.tile_size))
+
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        return image
+
+    def close(self) -> None:
+        """Close the memory maps of the instance files, as soon as no frame read uses them."""
+        with self._lock:
+            self._closing = True
+            if self._readers == 0:
+                self._close_maps()
+
+    def _close_maps(self) -> None:
+        for data in self._maps.values():
+            data.close()
+        self._maps.clear()
+
+    def _tile_frames(self, level: int) -> int:
+        """Return how many stored frames a tile of a DeepZoom level is composed from, at most."""
+        instance, factor = self._source(level)
+        span = self.tile_size * factor
+        return (math.ceil(span / instance.tile_width) + 1) * (math.ceil(span / instance.tile_height) + 1)
+
+    def _check_address(self, level: int, col: int, row: int) -> None:
+        if not self.geometry().has_tile(level, col, row):
+            raise ValueError("Invalid address")
+
+    def source_scale(self, level: int) -> float:
+        """Return how many stored pixels are read per pixel of a DeepZoom level, 1.0 when a stored level matches."""
+        return self._source(level)[1]
+
+    def _source(self, level: int) -> tuple[DicomInstance, float]:
+        """Pick the coarsest stored level at least as detailed as a DeepZoom level, with the scale between them."""
+        scale = 2 ** (self.level_count - 1 - level)
+        base_width = self.instances[0].width
+        source, factor = self.instances[0], float(scale)
+        for instance in self.instances[1:]:
+            downsample = base_width / instance.width
+            if downsample > scale * 1.01:
+                break
+            source, factor = instance, scale / downsample
+
+        return source, 1.0 if abs(factor - 1.0) < 0.01 else factor
+
+    def _frame_index(self, instance: DicomInstance, col: int, row: int) -> int | None:
+        if instance.frame_positions is None:
+            if col >= instance.columns:
+                return None
+            index = row * instance.columns + col
+            return index if index < len(instance.frames) else None
+
+        positions = self._positions.get(instance.path)
+        if positions is None:
+            positions = {}
+            for index, position in enumerate(instance.frame_positions):
+                positions.setdefault(tuple(position), index)  # type: ignore
+            self._positions[instance.path] = positions
+        return positions.get((col, row))
+
+    def _read_frame(self, instance: DicomInstance, index: int) -> bytes:
+        with self._lock:
+            data = self._map(instance.path)
+            self._readers += 1
+        try:
+            return b"".join(data[offset : offset + length] for offset, length in instance.frames[index])
+        finally:
+            with self._lock:
+                self._readers -= 1
+                # A read that outlived `close` reopened the map, which is closed again once reads drain.
+                if self._closing and self._readers == 0:
+                    self._close_maps()
+
+    def _decode_frame(self, instance: DicomInstance, index: int) -> Image.Image:
+        data = self._read_frame(instance, index)
+        if instance.transfer_syntax in UNCOMPRESSED_TRANSFER_SYNTAXES:
+            pixels = np.frombuffer(data, dtype=np.uint8).reshape(
+                instance.tile_height, instance.tile_width, instance.samples_per_pixel
+            )
+            return Image.fromarray(pixels.squeeze(axis=2) if instance.samples_per_pixel == 1 else pixels).convert("RGB")
+
+        return Image.open(BytesIO(data)).convert("RGB")
+
+    def _map(self, path: str) -> mmap.mmap:
+        """Return the memory map of an instance file, opening it if needed. Called with the lock held."""
+        data = self._maps.get(path)
+        if data is None:
+            with open(path, "rb") as fp:
+                data = self._maps[path] = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return data
+
+
+class DicomSlideCache:
+    """Bounded LRU of opened DICOM WSI series, keyed by folder path and the signature of its files.
+
+    The signature holds the modification time and size of every instance file, as the series index records
+    them, so adding, removing or rewriting an instance re-reads the series once the signature read for
+    recent lookups expires (`SERIES_SIGNATURE_TTL`). Evicted and
+    replaced series are closed: their memory maps close once the last frame read using them finishes.
+
+    Parameters
+    ----------
+    max_slides: int, optional
+        Maximum number of series kept open. Defaults to 32.
+    index: DicomSeriesIndex | None, optional
+        Persistent index used to open series without parsing every header. Defaults to None.
+    """
+
+    def __init__(self, max_slides: int = 32, index: DicomSeriesIndex | None = None) -> None:
+        self.max_slides = max_slides
+        self.index = index
+        self._entries: OrderedDict[tuple[str, SeriesSignature], DicomSlide] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, folder: Path | str) -> DicomSlide:
+        """Return the series in a folder, reading its headers if it is not cached yet. Blocking."""
+        key = self._key(folder)
+        with self._lock:
+            slide = self._entries.get(key)
+            if slide is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return slide
+            self.misses += 1
+
+        slide = DicomSlide.from_folder(key[0], self.index)
+        evicted = []
+        with self._lock:
+            for stale in [other for other in self._entries if other[0] == key[0]]:
+                evicted.append(self._entries.pop(stale))
+            self._entries[key] = slide
+            while len(self._entries) > self.max_slides:
+                evicted.append(self._entries.popitem(last=False)[1])
+
+        for stale_slide in evicted:
+            stale_slide.close()
+        return slide
+
+    def cached(self, folder: Path | str) -> DicomSlide | None:
+        """Return the series in a folder if it is cached, without reading anything."""
+        key = self._key(folder)
+        with self._lock:
+            return self._entries.get(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            evicted = list(self._entries.values())
+            self._entries.clear()
+
+        for slide in evicted:
+            slide.close()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_slides": self.max_slides,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _key(folder: Path | str) -> tuple[str, SeriesSignature]:
+        path = Path(folder).resolve()
+        return (str(path), series_signatures.get(path))
+
+
+slides: DicomSlideCache | None = None
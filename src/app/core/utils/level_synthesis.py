@@ -0,0 +1,275 @@
+import json
+import math
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from io import BytesIO
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import openslide
+from PIL import Image
+
+from ..logger import logging
+from .dicom_wsi import DicomSeriesIndex, DicomSlide, is_dicom_series
+from .slide_cache import DeepZoomOptions, deepzoom_options
+from .slide_regions import read_openslide_region
+from .tile_store import write_atomic
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "levels.json"
+
+# Pixels of the source level read per block while building, so one read stays around 1024x1024.
+SOURCE_BLOCK_PIXELS = 1024
+
+# Reads output-pixel blocks (x, y, width, height) of the finest synthesized level.
+BlockReader = Callable[[int, int, int, int], Image.Image]
+
+
+class LevelSynthesisStore:
+    """Disk cache of synthesized low-resolution DeepZoom levels.
+
+    Each synthesized level is stored whole, as an uncompressed RGB array that is memory-mapped when served,
+    so any tile of it is a slice and costs the same whatever the zoom::
+
+        {root}/{slide_id}/levels.json
+        {root}/{slide_id}/{level}.npy
+
+    The manifest maps each synthesized level to its size and is written last, so its presence means the
+    levels of that slide version are complete. An empty manifest records a slide that needs no synthesis.
+
+    Parameters
+    ----------
+    root: Path | str
+        Directory holding the levels.
+    max_open: int, optional
+        Number of memory-mapped levels kept open. Defaults to 64.
+    """
+
+    def __init__(self, root: Path | str, max_open: int = 64) -> None:
+        self.root = Path(root)
+        self.max_open = max_open
+        self._manifests: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._arrays: OrderedDict[tuple[str, int], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.tiles_served = 0
+
+    def level_path(self, slide_id: str, level: int) -> Path:
+        return self.root / slide_id / f"{level}.npy"
+
+    def levels(self, slide_id: str) -> dict[int, tuple[int, int]] | None:
+        """Return the synthesized levels of a slide and their sizes, or None if they were not built yet."""
+        manifest = self._manifest(slide_id)
+        return manifest["levels"] if manifest is not None else None
+
+    def has_level(self, slide_id: str, level: int) -> bool:
+        levels = self.levels(slide_id)
+        return levels is not None and level in levels
+
+    def write(self, slide_id: str, levels: dict[int, np.ndarray], tile_size: int, overlap: int) -> None:
+        for level, pixels in levels.items():
+            buffer = BytesIO()
+            np.save(buffer, pixels)
+            write_atomic(self.level_path(slide_id, level), buffer.getvalue())
+
+        manifest = {
+            "tile_size": tile_size,
+            "overlap": overlap,
+            "levels": {level: [pixels.shape[1], pixels.shape[0]] for level, pixels in levels.items()},
+        }
+        write_atomic(self.root / slide_id / MANIFEST_FILE, json.dumps(manifest).encode())
+
+    def get_tile(self, slide_id: str, level: int, address: tuple[int, int]) -> Image.Image:
+        """Cut a DeepZoom tile, overlap included, out of a synthesized level. Blocking."""
+        manifest = self._manifest(slide_id)
+        if manifest is None or level not in manifest["levels"]:
+            raise ValueError(f"Level {level} of {slide_id} is not synthesized")
+
+        tile_size, overlap = manifest["tile_size"], manifest["overlap"]
+        pixels = self._array(slide_id, level)
+        height, width = pixels.shape[:2]
+        col, row = address
+        left = col * tile_size - (overlap if col > 0 else 0)
+        top = row * tile_size - (overlap if row > 0 else 0)
+        right = min(width, (col + 1) * tile_size + overlap)
+        bottom = min(height, (row + 1) * tile_size + overlap)
+        if left >= width or top >= height:
+            raise ValueError("Invalid address")
+
+        with self._lock:
+            self.tiles_served += 1
+        return Image.fromarray(np.ascontiguousarray(pixels[top:bottom, left:right]))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._manifests.clear()
+            self._arrays.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"open_levels": len(self._arrays), "max_open": self.max_open, "tiles_served": self.tiles_served}
+
+    def _manifest(self, slide_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            manifest = self._manifests.get(slide_id)
+            if manifest is not None:
+                self._manifests.move_to_end(slide_id)
+                return manifest
+
+        try:
+            manifest = json.loads((self.root / slide_id / MANIFEST_FILE).read_text())
+        except FileNotFoundError:
+            return None
+
+        manifest["levels"] = {int(level): tuple(size) for level, size in manifest["levels"].items()}
+        with self._lock:
+            self._manifests[slide_id] = manifest
+            while len(self._manifests) > self.max_open * 16:
+                self._manifests.popitem(last=False)
+        return manifest
+
+    def _array(self, slide_id: str, level: int) -> np.ndarray:
+        key = (slide_id, level)
+        with self._lock:
+            pixels = self._arrays.get(key)
+            if pixels is not None:
+                self._arrays.move_to_end(key)
+                return pixels
+
+        pixels = np.load(self.level_path(slide_id, level), mmap_mode="r")
+        with self._lock:
+            self._arrays[key] = pixels
+            while len(self._arrays) > self.max_open:
+                self._arrays.popitem(last=False)
+        return pixels
+
+
+def halve(pixels: np.ndarray) -> np.ndarray:
+    """Halve an RGB array with a 2x2 box filter, rounding odd sizes up as DeepZoom level sizes do."""
+    height, width = pixels.shape[:2]
+    if height % 2 or width % 2:
+        pixels = np.pad(pixels, ((0, height % 2), (0, width % 2), (0, 0)), mode="edge")
+
+    blocks = pixels.reshape(pixels.shape[0] // 2, 2, pixels.shape[1] // 2, 2, pixels.shape[2])
+    return ((blocks.sum(axis=(1, 3), dtype=np.uint16) + 2) // 4).astype(np.uint8)
+
+
+def synthesize_levels(
+    slide_path: Path,
+    store: LevelSynthesisStore,
+    slide_id: str,
+    min_ratio: float,
+    max_pixels: int,
+    dicom_index: DicomSeriesIndex | None = None,
+) -> dict[int, tuple[int, int]]:
+    """Build the DeepZoom levels of a slide that would otherwise be read from a much finer stored level.
+
+    A level is synthesized when rendering one of its pixels reads at least `min_ratio` pixels of the
+    closest stored level in each axis. The finest such level that fits in `max_pixels` is read once, in
+    bounded blocks, and every coarser level is reduced from it with 2x2 box filters. Blocking.
+
+    Returns
+    -------
+    dict[int, tuple[int, int]]
+        The size of each synthesized level.
+    """
+    if is_dicom_series(slide_path):
+        dicom_slide = DicomSlide.from_folder(slide_path, dicom_index)
+        dimensions = dicom_slide.level_dimensions
+        ratios = [dicom_slide.source_scale(level) for level in range(dicom_slide.level_count)]
+        top = _top_level(dimensions, ratios, min_ratio, max_pixels)
+        tile_size, overlap = dicom_slide.tile_size, dicom_slide.overlap
+        levels = {}
+        if top is not None:
+            levels = _build(
+                dimensions,
+                top,
+                ratios[top],
+                lambda x, y, width, height: dicom_slide.read_region(top, (x, y), (width, height)),
+            )
+    else:
+        slide = openslide.OpenSlide(str(slide_path))
+        try:
+            options = deepzoom_options(slide)
+            dimensions, ratios, offset = _openslide_geometry(slide, options)
+            top = _top_level(dimensions, ratios, min_ratio, max_pixels)
+            tile_size, overlap = options.tile_size, options.overlap
+            levels = {}
+            if top is not None:
+                downsample = 2 ** (len(dimensions) - 1 - top)
+                levels = _build(
+                    dimensions,
+                    top,
+                    ratios[top],
+                    lambda x, y, width, height: read_openslide_region(
+                        slide, (offset[0] + x * downsample, offset[1] + y * downsample), downsample, (width, height)
+                    ),
+                )
+        finally:
+            slide.close()
+
+    store.write(slide_id, levels, tile_size, overlap)
+    return {level: (pixels.shape[1], pixels.shape[0]) for level, pixels in levels.items()}
+
+
+def _openslide_geometry(
+    slide: openslide.OpenSlide, options: DeepZoomOptions
+) -> tuple[tuple[tuple[int, int], ...], list[float], tuple[int, int]]:
+    """Return the DeepZoom level sizes, read ratios and level-0 offset `DeepZoomGenerator` would use."""
+    width, height = slide.dimensions
+    offset = (0, 0)
+    if options.limit_bounds:
+        offset = (
+            int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_X, 0)),
+            int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_Y, 0)),
+        )
+        width = int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_WIDTH, width))
+        height = int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_HEIGHT, height))
+
+    dimensions = [(width, height)]
+    while dimensions[-1][0] > 1 or dimensions[-1][1] > 1:
+        dimensions.append(tuple(max(1, math.ceil(size / 2)) for size in dimensions[-1]))  # type: ignore
+    dimensions.reverse()
+
+    ratios = []
+    for level in range(len(dimensions)):
+        downsample = 2 ** (len(dimensions) - 1 - level)
+        ratios.append(downsample / slide.level_downsamples[slide.get_best_level_for_downsample(downsample)])
+
+    return tuple(dimensions), ratios, offset
+
+
+def _top_level(
+    dimensions: tuple[tuple[int, int], ...], ratios: list[float], min_ratio: float, max_pixels: int
+) -> int | None:
+    """Pick the finest level to synthesize: it needs synthesis and fits the pixel budget."""
+    candidates = [
+        level
+        for level, ((width, height), ratio) in enumerate(zip(dimensions, ratios))
+        if ratio >= min_ratio and width * height <= max_pixels
+    ]
+    return max(candidates, default=None)
+
+
+def _build(
+    dimensions: tuple[tuple[int, int], ...], top: int, ratio: float, read_block: BlockReader
+) -> dict[int, np.ndarray]:
+    width, height = dimensions[top]
+    block = max(16, min(512, int(SOURCE_BLOCK_PIXELS / ratio)))
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    for y in range(0, height, block):
+        for x in range(0, width, block):
+            size = (min(block, width - x), min(block, height - y))
+            pixels[y : y + size[1], x : x + size[0]] = np.asarray(read_block(x, y, *size).convert("RGB"))
+
+    levels = {top: pixels}
+    for level in range(top - 1, -1, -1):
+        pixels = halve(pixels)
+        levels[level] = pixels
+
+    return levels
+
+
+store: LevelSynthesisStore | None = None
@@ -1,3 +1,5 @@
 from arq.connections import ArqRedis
 
+JOB_PROGRESS_PREFIX = "job_progress:"
+
 pool: ArqRedis | None = None
@@ -0,0 +1,167 @@
+import asyncio
+import secrets
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, Generic, TypeVar
+
+from ..logger import logging
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LOCK_PREFIX = "single_flight:"
+
+# Deletes the lock only if this process still owns it, so an expired lock taken over by another
+# process is never released by its previous owner.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent identical work, so it runs once and every caller gets its result.
+
+    Within a process, the first caller for a key starts the work as a task and later callers await that
+    same task. The task is shielded, so a caller that goes away does not cancel the work for the others, but
+    once every caller went away the task is cancelled, so nobody waits on work that nobody will read.
+
+    With `redis_lock`, the work is also guarded by a Redis lock in the cache pool from `core/utils/cache.py`,
+    so other processes wait for its result instead of repeating it. They poll `peek`, which should read a
+    shared cache the work fills, until the result shows up or the lock goes away; then they do the work
+    themselves.
+
+    Parameters
+    ----------
+    redis_lock: bool, optional
+        Whether to coalesce across processes with a Redis lock. Defaults to False.
+    lock_timeout: float, optional
+        Expiration of the Redis lock in seconds, and how long other processes wait at most. Defaults to 10.
+    poll_interval: float, optional
+        Seconds between `peek` calls while another process holds the lock. Defaults to 0.02.
+
+    Note
+    ----
+        - Redis errors are logged and the work runs without the lock.
+    """
+
+    def __init__(self, redis_lock: bool = False, lock_timeout: float = 10.0, poll_interval: float = 0.02) -> None:
+        self.redis_lock = redis_lock
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._flights: dict[str, asyncio.Task[T]] = {}
+        self._callers: dict[asyncio.Task[T], int] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_coalesced = 0
+        self.remote_timeouts = 0
+        self.abandoned = 0
+
+    async def do(
+        self, key: str, func: Callable[[], Awaitable[T]], peek: Callable[[], Awaitable[T | None]] | None = None
+    ) -> T:
+        """Return the result of `func()`, sharing it with concurrent calls for the same key.
+
+        Parameters
+        ----------
+        key: str
+            Identifies the work.
+        func: Callable[[], Awaitable[T]]
+            The work.
+        peek: Callable[[], Awaitable[T | None]] | None, optional
+            Looks up a result another process produced, in Redis lock mode. Defaults to None.
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            flight = asyncio.ensure_future(self._run(key, func, peek))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._forget(key, done))
+
+        self._callers[flight] = self._callers.get(flight, 0) + 1
+        try:
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            if self._callers[flight] == 1 and not flight.done():
+                self.abandoned += 1
+                # Forgotten now, so a caller arriving while it winds down starts the work afresh.
+                self._forget(key, flight)
+                flight.cancel()
+            raise
+        finally:
+            callers = self._callers.pop(flight) - 1
+            if callers:
+                self._callers[flight] = callers
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "redis_lock": self.redis_lock,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "remote_coalesced": self.remote_coalesced,
+            "remote_timeouts": self.remote_timeouts,
+            "abandoned": self.abandoned,
+        }
+
+    def _forget(self, key: str, flight: asyncio.Task[T]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _run(
+        self, key: str, func: Callable[[], Awaitable[T]], peek: Callable[[], Awaitable[T | None]] | None
+    ) -> T:
+        if not self.redis_lock or cache.client is None:
+            return await func()
+
+        lock_key = f"{LOCK_PREFIX}{key}"
+        token = secrets.token_hex(8)
+        try:
+            locked, result = await self._acquire(lock_key, token, peek)
+        except Exception as e:
+            logger.warning(f"Redis single-flight lock failed: {e}")
+            locked, result = False, None
+
+        try:
+            return result if result is not None else await func()
+        finally:
+            if locked:
+                try:
+                    await cache.client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)  # type: ignore
+                except Exception as e:
+                    logger.warning(f"Redis single-flight unlock failed: {e}")
+
+    async def _acquire(
+        self, lock_key: str, token: str, peek: Callable[[], Awaitable[T | None]] | None
+    ) -> tuple[bool, T | None]:
+        """Take the Redis lock, or wait for the result of the process holding it.
+
+        Returns whether the lock was taken, and the result if another process produced it meanwhile.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        waited = False
+        while not await cache.client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)):  # type: ignore
+            waited = True
+            result = await peek() if peek is not None else None
+            if result is not None:
+                self.remote_coalesced += 1
+                return False, result
+            if time.monotonic() >= deadline:
+                self.remote_timeouts += 1
+                return False, None
+            await asyncio.sleep(self.poll_interval)
+
+        # The previous holder may have stored its result just before releasing the lock.
+        result = await peek() if waited and peek is not None else None
+        if result is not None:
+            self.remote_coalesced += 1
+        return True, result
+
+
+flights: SingleFlight | None = None
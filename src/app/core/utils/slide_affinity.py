@@ -0,0 +1,100 @@
+import re
+from collections.abc import Iterable
+
+SLIDE_PARAM = "slide_name"
+
+# Routes under these prefixes only queue worker jobs, so which process answers them does not matter.
+EXCLUDED_PREFIXES = ("/api/",)
+
+PATH_PARAM = re.compile(r"\{([^}:]+)(?::[^}]*)?\}")
+
+PROXY_HEADERS = """\
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;"""
+
+
+def parse_backends(spec: str) -> list[str]:
+    """Parse a `SLIDE_AFFINITY_BACKENDS` setting, a comma-separated list of host:port."""
+    backends = [backend.strip() for backend in spec.split(",") if backend.strip()]
+    if not backends:
+        raise ValueError("At least one backend is required")
+    return list(dict.fromkeys(backends))
+
+
+def slide_route_pattern(path: str) -> str | None:
+    """Return a regular expression matching a route path, capturing the slide name as its only group.
+
+    Returns None for routes without a slide, or whose slide does not need to stay on one process.
+    """
+    if path.startswith(EXCLUDED_PREFIXES) or not any(m.group(1) == SLIDE_PARAM for m in PATH_PARAM.finditer(path)):
+        return None
+
+    pattern, position = "^", 0
+    for match in PATH_PARAM.finditer(path):
+        pattern += re.escape(path[position : match.start()])
+        pattern += "([^/]+)" if match.group(1) == SLIDE_PARAM else "[^/]+"
+        position = match.end()
+    return pattern + re.escape(path[position:]) + "$"
+
+
+def slide_route_patterns(paths: Iterable[str]) -> list[str]:
+    return list(dict.fromkeys(pattern for pattern in map(slide_route_pattern, paths) if pattern is not None))
+
+
+def render_nginx_config(
+    backends: list[str],
+    patterns: list[str],
+    listen: int = 80,
+    tile_store: tuple[str, str] | None = None,
+) -> str:
+    """Render an nginx config that sends every request for a slide to the same app process.
+
+    Slide routes are proxied to an upstream that consistently hashes the slide name across `backends`,
+    so each process opens, and keeps warm handle and tile caches for, its own share of the slides instead
+    of all of them. Adding or removing a backend only moves the slides that hash to it. Other routes are
+    balanced across the same backends as usual.
+
+    Parameters
+    ----------
+    backends: list[str]
+        host:port of each app process. Each has to be its own server, such as one uvicorn process per
+        port, since nginx cannot pick a worker behind a shared gunicorn socket.
+    patterns: list[str]
+        Regular expressions of the slide routes, from `slide_route_patterns`.
+    listen: int, optional
+        Port nginx listens on. Defaults to 80.
+    tile_store: tuple[str, str] | None, optional
+        `TILE_STORE_ACCEL_PREFIX` and the directory nginx serves it from, to keep serving pre-rendered
+        tiles with X-Accel-Redirect. Defaults to None.
+
+    Returns
+    -------
+    str
+        The config, for `/etc/nginx/conf.d/default.conf`.
+    """
+    servers = "\n".join(f"    server {backend};" for backend in backends)
+    slide_map = "\n".join(f'    "~{pattern}" $1;' for pattern in patterns)
+    prefixes = sorted({pattern[2:].split("/", 1)[0] for pattern in patterns})
+
+    sections = [
+        "# Generated by `python -m src.scripts.generate_nginx_config`; regenerate it when routes or backends change.",
+        f"upstream pathway_app {{\n{servers}\n}}",
+        f"upstream pathway_slides {{\n    hash $slide_affinity_key consistent;\n{servers}\n}}",
+        f"map $uri $slide_affinity_key {{\n    default $uri;\n{slide_map}\n}}",
+    ]
+
+    locations = [
+        f"    location / {{\n        proxy_pass http://pathway_app;\n{PROXY_HEADERS}\n    }}",
+        f"    location ~ ^/(?:{'|'.join(prefixes)})/ {{\n"
+        f"        proxy_pass http://pathway_slides;\n{PROXY_HEADERS}\n"
+        f"        add_header X-Slide-Backend $upstream_addr always;\n    }}",
+    ]
+    if tile_store is not None:
+        prefix, directory = (part.rstrip("/") for part in tile_store)
+        locations.append(f"    location {prefix}/ {{\n        internal;\n        alias {directory}/;\n    }}")
+
+    server = "\n\n".join(locations)
+    sections.append(f"server {{\n    listen {listen};\n\n{server}\n}}")
+    return "\n\n".join(sections) + "\n"
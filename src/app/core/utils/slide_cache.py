@@ -0,0 +1,392 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import openslide
+from openslide.deepzoom import DeepZoomGenerator
+
+from ..logger import logging
+
+logger = logging.getLogger(__name__)
+
+DEEPZOOM_TILE_SIZE = 256
+DEEPZOOM_OVERLAP = 1
+DEEPZOOM_LIMIT_BOUNDS = True
+
+# Square native tile sizes DeepZoom tiles can be aligned to. Slides with other tiles keep the default geometry.
+MIN_NATIVE_TILE_SIZE = 128
+MAX_NATIVE_TILE_SIZE = 1024
+
+# Seconds the file listing of a series folder is reused before the folder is listed again
+SERIES_SIGNATURE_TTL = 5.0
+
+# Part of every slide identity, so tiles and everything derived from the DeepZoom grid under an older
+# geometry scheme are never served for the current one.
+DEEPZOOM_GEOMETRY_VERSION = 3
+
+
+class DeepZoomOptions(NamedTuple):
+    tile_size: int = DEEPZOOM_TILE_SIZE
+    overlap: int = DEEPZOOM_OVERLAP
+    limit_bounds: bool = DEEPZOOM_LIMIT_BOUNDS
+
+
+# Name, modification time and size of every file of a series, as recorded in its index.
+SeriesSignature = tuple[tuple[str, int, int], ...]
+
+# Path, modification time and the DeepZoom options, None when they are chosen from the slide itself.
+HandleKey = tuple[str, int, DeepZoomOptions | None]
+
+
+class SlideGeometry(NamedTuple):
+    level_count: int
+    level_dimensions: tuple[tuple[int, int], ...]
+    level_tiles: tuple[tuple[int, int], ...]
+    options: DeepZoomOptions = DeepZoomOptions()
+
+    def has_tile(self, level: int, col: int, row: int) -> bool:
+        if not 0 <= level < self.level_count:
+            return False
+        cols, rows = self.level_tiles[level]
+        return 0 <= col < cols and 0 <= row < rows
+
+
+def series_signature(folder: Path | str) -> SeriesSignature:
+    """Return the name, modification time and size of every file of a series, which change with any of them."""
+    signature = []
+    for path in sorted(Path(folder).glob("*.dcm")):
+        stat = path.stat()
+        signature.append((path.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class SeriesSignatureCache:
+    """Recently read signatures of DICOM series folders, so requests do not list a folder each time.
+
+    A folder is listed and its files stat'ed at most once every `ttl` seconds, so an instance added, removed
+    or rewritten in place is noticed within that time without a directory scan per tile on network storage.
+
+    Parameters
+    ----------
+    ttl: float, optional
+        Seconds a signature is reused. Defaults to 5.
+    max_folders: int, optional
+        Maximum number of folders remembered. Defaults to 4096.
+    """
+
+    def __init__(self, ttl: float = SERIES_SIGNATURE_TTL, max_folders: int = 4096) -> None:
+        self.ttl = ttl
+        self.max_folders = max_folders
+        self._entries: OrderedDict[str, tuple[float, SeriesSignature]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, folder: Path | str) -> SeriesSignature:
+        """Return the signature of a folder, empty if it holds no DICOM files. Blocking when it is listed."""
+        key = str(Path(folder).resolve())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        signature = series_signature(key)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, signature)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_folders:
+                self._entries.popitem(last=False)
+        return signature
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+series_signatures = SeriesSignatureCache()
+
+
+def slide_identity(slide_path: Path | str) -> str:
+    """Return a short identifier that changes whenever the slide is replaced or modified.
+
+    A DICOM series folder is identified by the signature of its files, since rewriting an instance in place
+    leaves the folder's modification time unchanged.
+    """
+    path = Path(slide_path).resolve()
+    signature = series_signatures.get(path) if path.is_dir() else ()
+    if signature:
+        version = repr(signature)
+    else:
+        stat = path.stat()
+        version = f"{stat.st_mtime_ns}:{stat.st_size}"
+    identity = f"{path}:{version}:{DEEPZOOM_GEOMETRY_VERSION}"
+    return hashlib.sha1(identity.encode()).hexdigest()[:16]
+
+
+def deepzoom_options(slide: openslide.AbstractSlide) -> DeepZoomOptions:
+    """Choose the DeepZoom tile geometry of a slide.
+
+    When every level is stored in the same square tiles, DeepZoom tiles take that size without overlap, so a
+    tile of a DeepZoom level matching a stored level is exactly one stored tile. The default geometry is kept
+    for untiled slides, odd tile shapes, and bounds offsets that would shift DeepZoom tiles off the grid.
+    Normalized copies are tiled on their own grid from the origin, so they always get the aligned geometry.
+    """
+    properties = slide.properties
+    try:
+        sizes = {
+            (
+                int(properties[f"openslide.level[{level}].tile-width"]),
+                int(properties[f"openslide.level[{level}].tile-height"]),
+            )
+            for level in range(slide.level_count)
+        }
+    except (KeyError, ValueError):
+        return DeepZoomOptions()
+
+    if len(sizes) != 1:
+        return DeepZoomOptions()
+    ((width, height),) = sizes
+    if width != height or not MIN_NATIVE_TILE_SIZE <= width <= MAX_NATIVE_TILE_SIZE:
+        return DeepZoomOptions()
+
+    if DEEPZOOM_LIMIT_BOUNDS:
+        x = int(properties.get(openslide.PROPERTY_NAME_BOUNDS_X, 0))
+        y = int(properties.get(openslide.PROPERTY_NAME_BOUNDS_Y, 0))
+        if any((x / downsample) % width or (y / downsample) % width for downsample in slide.level_downsamples):
+            return DeepZoomOptions()
+
+    return DeepZoomOptions(width, 0, DEEPZOOM_LIMIT_BOUNDS)
+
+
+@dataclass
+class _SlideHandle:
+    slide: openslide.OpenSlide
+    deepzoom: DeepZoomGenerator
+    geometry: SlideGeometry
+    leases: int = 0
+    evicted: bool = False
+
+
+class SlideHandleCache:
+    """Bounded, thread-safe LRU of opened OpenSlide handles and their DeepZoom generators.
+
+    Entries are keyed by resolved path, file modification time and tile geometry, so a slide that is
+    replaced on disk gets a fresh handle on its next lookup and the stale one is closed. Unless given, the
+    tile geometry is chosen from the slide with `deepzoom_options` when it is opened.
+
+    Parameters
+    ----------
+    max_handles: int, optional
+        Maximum number of idle slide handles (and therefore open files) kept around. Defaults to 32.
+    max_geometries: int, optional
+        Maximum number of remembered DeepZoom level geometries. Geometries outlive handle eviction so
+        tile-existence checks never need to reopen a slide. Defaults to 4096.
+
+    Note
+    ----
+        - Handles are handed out through `lease`. A handle evicted while leased is closed only once
+          its last lease is released, so tiles being rendered never see a closed slide.
+        - When every cached handle is leased the cache may briefly exceed `max_handles`; it shrinks back
+          as leases are released.
+    """
+
+    def __init__(self, max_handles: int = 32, max_geometries: int = 4096) -> None:
+        self.max_handles = max_handles
+        self.max_geometries = max_geometries
+        self._entries: OrderedDict[HandleKey, _SlideHandle] = OrderedDict()
+        self._geometries: OrderedDict[HandleKey, SlideGeometry] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @contextmanager
+    def lease(self, slide_path: Path | str, options: DeepZoomOptions | None = None) -> Iterator[DeepZoomGenerator]:
+        """Borrow the DeepZoom generator for a slide, opening it if it is not cached yet.
+
+        Parameters
+        ----------
+        slide_path: Path | str
+            Path to the slide file.
+        options: DeepZoomOptions | None, optional
+            DeepZoom tile geometry. Defaults to None, the geometry `deepzoom_options` picks for the slide.
+
+        Yields
+        ------
+        DeepZoomGenerator
+            The cached generator. It must not be used after the context exits.
+        """
+        handle = self._acquire(self._key(slide_path, options))
+        try:
+            yield handle.deepzoom
+        finally:
+            self._release(handle)
+
+    @contextmanager
+    def lease_slide(
+        self, slide_path: Path | str, options: DeepZoomOptions | None = None
+    ) -> Iterator[openslide.OpenSlide]:
+        """Borrow the OpenSlide handle behind a cached DeepZoom generator, for properties and associated images."""
+        handle = self._acquire(self._key(slide_path, options))
+        try:
+            yield handle.slide
+        finally:
+            self._release(handle)
+
+    def geometry(self, slide_path: Path | str, options: DeepZoomOptions | None = None) -> SlideGeometry:
+        """Return the DeepZoom level geometry of a slide and its tile options, opening the slide if needed."""
+        handle = self._acquire(self._key(slide_path, options))
+        try:
+            return handle.geometry
+        finally:
+            self._release(handle)
+
+    def cached_geometry(self, slide_path: Path | str, options: DeepZoomOptions | None = None) -> SlideGeometry | None:
+        """Return the remembered DeepZoom level geometry of a slide without opening it, if known."""
+        key = self._key(slide_path, options)
+        with self._lock:
+            geometry = self._geometries.get(key)
+            if geometry is not None:
+                self._geometries.move_to_end(key)
+            return geometry
+
+    def invalidate(self, slide_path: Path | str) -> int:
+        """Drop every cached handle of a slide, whatever its geometry or modification time.
+
+        Returns
+        -------
+        int
+            The number of entries removed.
+        """
+        path = str(Path(slide_path).resolve())
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == path]
+            to_close = [self._evict(key) for key in stale]
+            self.invalidations += len(stale)
+            for key in [key for key in self._geometries if key[0] == path]:
+                del self._geometries[key]
+
+        self._close_all(to_close)
+        return len(stale)
+
+    def clear(self) -> None:
+        """Close every idle handle and forget all entries."""
+        with self._lock:
+            to_close = [self._evict(key) for key in list(self._entries)]
+
+        self._close_all(to_close)
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit/miss counters and the current number of cached handles."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_handles": self.max_handles,
+                "geometries": len(self._geometries),
+                "leased": sum(1 for handle in self._entries.values() if handle.leases),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    @staticmethod
+    def _key(slide_path: Path | str, options: DeepZoomOptions | None) -> HandleKey:
+        path = str(Path(slide_path).resolve())
+        return (path, os.stat(path).st_mtime_ns, options)
+
+    def _acquire(self, key: HandleKey) -> _SlideHandle:
+        with self._lock:
+            handle = self._entries.get(key)
+            if handle is not None:
+                self._entries.move_to_end(key)
+                handle.leases += 1
+                self.hits += 1
+                return handle
+
+            self.misses += 1
+
+        # Opening a slide can take tens of milliseconds, so it happens outside the lock.
+        path, _, options = key
+        slide = openslide.OpenSlide(path)
+        options = options or deepzoom_options(slide)
+        deepzoom = DeepZoomGenerator(
+            slide, tile_size=options.tile_size, overlap=options.overlap, limit_bounds=options.limit_bounds
+        )
+        geometry = SlideGeometry(
+            deepzoom.level_count, tuple(deepzoom.level_dimensions), tuple(deepzoom.level_tiles), options
+        )
+        opened = _SlideHandle(slide=slide, deepzoom=deepzoom, geometry=geometry)
+
+        to_close: list[_SlideHandle | None] = []
+        with self._lock:
+            handle = self._entries.get(key)
+            if handle is None:
+                stale = [other for other in self._entries if other[0] == path and other[1] != key[1]]
+                to_close.extend(self._evict(other) for other in stale)
+                self.invalidations += len(stale)
+                self._entries[key] = handle = opened
+            else:
+                # Another thread opened the same slide meanwhile; keep its handle and drop ours.
+                to_close.append(opened)
+
+            handle.leases += 1
+            to_close.extend(self._trim())
+
+            self._geometries[key] = handle.geometry
+            while len(self._geometries) > self.max_geometries:
+                self._geometries.popitem(last=False)
+
+        self._close_all(to_close)
+        return handle
+
+    def _release(self, handle: _SlideHandle) -> None:
+        with self._lock:
+            handle.leases -= 1
+            to_close = [handle] if handle.evicted and handle.leases == 0 else []
+            to_close.extend(self._trim())
+
+        self._close_all(to_close)
+
+    def _trim(self) -> list[_SlideHandle | None]:
+        """Evict idle least-recently-used handles until the cache fits. Caller must hold the lock."""
+        to_close: list[_SlideHandle | None] = []
+        excess = len(self._entries) - self.max_handles
+        for key in list(self._entries):
+            if excess <= 0:
+                break
+            if self._entries[key].leases == 0:
+                to_close.append(self._evict(key))
+                self.evictions += 1
+                excess -= 1
+
+        return to_close
+
+    def _evict(self, key: HandleKey) -> _SlideHandle | None:
+        """Remove an entry and return it if it can be closed right away. Caller must hold the lock."""
+        handle = self._entries.pop(key)
+        handle.evicted = True
+        return handle if handle.leases == 0 else None
+
+    @staticmethod
+    def _close_all(handles: list[_SlideHandle | None]) -> None:
+        for handle in handles:
+            if handle is None:
+                continue
+            try:
+                handle.slide.close()
+            except Exception as e:
+                logger.warning(f"Error closing slide handle: {e}")
+
+
+handles: SlideHandleCache | None = None
@@ -0,0 +1,223 @@
+import asyncio
+import os
+from collections.abc import Awaitable, Callable, Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import NamedTuple
+
+import openslide
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from watchfiles import awatch
+
+from ...crud.crud_slide import crud_slides
+from ...models.slide import Slide
+from ...schemas.slide import SlideCreateInternal, SlideUpdateInternal
+from ..db.database import local_session
+from ..logger import logging
+from .dicom_wsi import DicomSeriesIndex
+
+logger = logging.getLogger(__name__)
+
+SLIDE_FORMATS = {".svs", ".tiff", ".ndpi", ".vms", ".vmu", ".scn", ".mrxs", ".bif"}
+
+
+class SlideEntry(NamedTuple):
+    name: str
+    format: str
+    size_bytes: int
+    mtime_ns: int
+
+
+class SlideDimensions(NamedTuple):
+    width: int | None = None
+    height: int | None = None
+    level_count: int | None = None
+
+
+def probe_entry(path: Path) -> SlideEntry | None:
+    """Classify a top-level entry of the slides directory from its stat and, for folders, one listing.
+
+    Returns
+    -------
+    SlideEntry | None
+        The slide, or None if the entry is not a supported slide file or slide folder.
+    """
+    try:
+        stat = path.stat()
+        if path.is_file():
+            suffix = path.suffix.lower()
+            if suffix not in SLIDE_FORMATS:
+                return None
+            return SlideEntry(path.name, suffix[1:], stat.st_size, stat.st_mtime_ns)
+
+        if not path.is_dir():
+            return None
+
+        with os.scandir(path) as children:
+            files = [child for child in children if child.is_file()]
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Cannot read slide entry {path}: {e}")
+        return None
+
+    # A folder's modification time changes when files are added or removed, which is what a series edit is.
+    suffixes = {Path(child.name).suffix.lower() for child in files}
+    if ".dcm" in suffixes:
+        size = sum(child.stat().st_size for child in files if child.name.lower().endswith(".dcm"))
+        return SlideEntry(path.name, "dicom", size, stat.st_mtime_ns)
+    if suffixes & {".dat", ".mrxs"}:
+        return SlideEntry(path.name, "mrxs", sum(child.stat().st_size for child in files), stat.st_mtime_ns)
+
+    return None
+
+
+def list_entries(slides_dir: Path, names: Iterable[str] | None = None) -> dict[str, SlideEntry]:
+    """Probe every top-level entry of the slides directory, or only the given ones. Blocking."""
+    if names is None:
+        with os.scandir(slides_dir) as children:
+            names = [child.name for child in children]
+
+    entries = (probe_entry(slides_dir / name) for name in names)
+    return {entry.name: entry for entry in entries if entry is not None}
+
+
+def read_dimensions(path: Path, format: str, dicom_index: DicomSeriesIndex | None = None) -> SlideDimensions:
+    """Read the full-resolution size and level count of a slide, or nothing if it cannot be opened. Blocking.
+
+    An MRXS folder is opened through the `.mrxs` file it holds. A folder holding only MRXS data files, such
+    as the companion folder of a top-level `.mrxs` file, cannot be opened on its own and has no dimensions.
+    """
+    try:
+        if format == "dicom":
+            instances = dicom_index.load(path) if dicom_index is not None else []
+            if not instances:
+                return SlideDimensions()
+            base = max(instances, key=lambda instance: instance.width)
+            return SlideDimensions(base.width, base.height, len(instances))
+
+        if format == "mrxs" and path.is_dir():
+            path = next(iter(sorted(path.glob("*.mrxs"))), path)
+
+        if path.is_file():
+            slide = openslide.OpenSlide(str(path))
+            try:
+                width, height = slide.dimensions
+                return SlideDimensions(width, height, slide.level_count)
+            finally:
+                slide.close()
+    except Exception as e:
+        logger.warning(f"Cannot read dimensions of {path}: {e}")
+
+    return SlideDimensions()
+
+
+async def scan_slides(
+    db: AsyncSession,
+    slides_dir: Path,
+    names: Iterable[str] | None = None,
+    dicom_index: DicomSeriesIndex | None = None,
+    on_change: Callable[[str], Awaitable[None]] | None = None,
+) -> dict[str, int]:
+    """Bring the slide catalog in line with the slides directory.
+
+    Unchanged slides cost a stat; slides are only opened to read their dimensions when they are new or
+    their size or modification time changed.
+
+    Parameters
+    ----------
+    db: AsyncSession
+        Database session.
+    slides_dir: Path
+        The slides directory.
+    names: Iterable[str] | None, optional
+        Top-level entries to rescan, for example the ones a filesystem event touched. Defaults to all.
+    dicom_index: DicomSeriesIndex | None, optional
+        Index used to read the dimensions of DICOM series. Defaults to None.
+    on_change: Callable[[str], Awaitable[None]] | None, optional
+        Called with the name of every added or updated slide, for example to enqueue ingest jobs.
+        Defaults to None.
+
+    Returns
+    -------
+    dict[str, int]
+        The number of slides added, updated, removed and left unchanged.
+    """
+    names = sorted(set(names)) if names is not None else None
+    entries = await asyncio.to_thread(list_entries, slides_dir, names)
+
+    query = select(Slide.name, Slide.size_bytes, Slide.mtime_ns)
+    if names is not None:
+        query = query.where(Slide.name.in_(names))
+    known = {name: (size_bytes, mtime_ns) for name, size_bytes, mtime_ns in (await db.execute(query)).all()}
+
+    counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    for name, entry in entries.items():
+        if known.get(name) == (entry.size_bytes, entry.mtime_ns):
+            counts["unchanged"] += 1
+            continue
+
+        dimensions = await asyncio.to_thread(read_dimensions, slides_dir / name, entry.format, dicom_index)
+        fields = {
+            "format": entry.format,
+            "size_bytes": entry.size_bytes,
+            "mtime_ns": entry.mtime_ns,
+            "modified_at": datetime.fromtimestamp(entry.mtime_ns / 1e9, UTC),
+            **dimensions._asdict(),
+        }
+        if name in known:
+            # A new slide version needs new previews and a new optimized copy, so both are unset until made.
+            values = SlideUpdateInternal(
+                **fields, thumbnail_path=None, optimized_path=None, updated_at=datetime.now(UTC)
+            )
+            await crud_slides.update(db=db, object=values, name=name)
+            counts["updated"] += 1
+        else:
+            await crud_slides.create(db=db, object=SlideCreateInternal(name=name, **fields))
+            counts["added"] += 1
+
+        if on_change is not None:
+            await on_change(name)
+
+    for name in known.keys() - entries.keys():
+        await crud_slides.db_delete(db=db, name=name)
+        counts["removed"] += 1
+
+    return counts
+
+
+async def watch_slides(
+    slides_dir: Path,
+    poll_seconds: int,
+    force_polling: bool = False,
+    dicom_index: DicomSeriesIndex | None = None,
+    on_change: Callable[[str], Awaitable[None]] | None = None,
+) -> None:
+    """Keep the slide catalog current until cancelled.
+
+    Runs a full scan first, then rescans only the top-level entries touched by each batch of filesystem
+    events, from inotify or, with `force_polling`, from `watchfiles` polling every `poll_seconds`.
+    `on_change` is passed on to `scan_slides`.
+    """
+    slides_dir = slides_dir.resolve()
+
+    async def scan(names: Iterable[str] | None = None) -> None:
+        try:
+            async with local_session() as db:
+                counts = await scan_slides(db, slides_dir, names, dicom_index, on_change)
+            if counts["added"] or counts["updated"] or counts["removed"]:
+                logger.info(f"Slide catalog updated: {counts}")
+        except Exception as e:
+            logger.error(f"Slide catalog scan failed: {e}")
+
+    await scan()
+
+    async for changes in awatch(slides_dir, force_polling=force_polling, poll_delay_ms=poll_seconds * 1000):
+        touched = set()
+        for _, path in changes:
+            parts = Path(path).relative_to(slides_dir).parts
+            if parts:
+                touched.add(parts[0])
+        if touched:
+            await scan(touched)
@@ -0,0 +1,218 @@
+import contextlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import openslide
+import pydicom
+from openslide.deepzoom import DeepZoomGenerator
+
+from ..logger import logging
+from . import cache, dicom_wsi, slide_cache
+
+logger = logging.getLogger(__name__)
+
+REDIS_PREFIX = "slide_metadata:"
+
+SKIPPED_DICOM_TAGS = {pydicom.tag.Tag(0x7FE00010), pydicom.tag.Tag(0x00420011)}  # pixel data, encapsulated PDFs
+DICOM_DEFER_SIZE = 1024
+MAX_DICOM_VALUE_LENGTH = 1000
+MAX_DICOM_SEQUENCE_ITEMS = 16
+
+
+def filtered_dicom_metadata(dataset: pydicom.Dataset) -> dict[str, str]:
+    """Return the printable header fields of a DICOM dataset.
+
+    Pixel data, encapsulated documents, large binary values and long sequences such as per-frame functional
+    groups are skipped. Values deferred by `dcmread` are skipped without being read from disk.
+    """
+    metadata = {}
+    for tag in dataset.keys():
+        if tag in SKIPPED_DICOM_TAGS:
+            continue
+
+        element = dataset.get_item(tag)
+        if isinstance(element, pydicom.dataelem.RawDataElement) and element.value is None and element.length:
+            continue
+
+        value = dataset[tag].value
+        if isinstance(value, bytes) and len(value) > MAX_DICOM_VALUE_LENGTH:
+            continue
+        if isinstance(value, pydicom.Sequence) and len(value) > MAX_DICOM_SEQUENCE_ITEMS:
+            continue
+
+        metadata[str(tag)] = str(value)
+
+    return metadata
+
+
+def read_slide_metadata(slide_path: Path, source: Path | None = None) -> dict[str, Any]:
+    """Collect what a viewer needs about a slide in one go: pyramid geometry, DZI and header fields.
+
+    Blocking, and meant to run once per slide version: the result only depends on the slide file, so it is
+    cached by slide identity.
+
+    Parameters
+    ----------
+    slide_path: Path
+        The slide, whose properties are reported.
+    source: Path | None, optional
+        The file tiles are served from, such as a normalized copy, whose DeepZoom geometry is reported.
+        Defaults to None, the slide itself.
+    """
+    if dicom_wsi.is_dicom_series(slide_path):
+        return _read_dicom_metadata(slide_path)
+
+    return _read_openslide_metadata(slide_path, source or slide_path)
+
+
+def _read_dicom_metadata(slide_path: Path) -> dict[str, Any]:
+    dicom_slide = dicom_wsi.slides.get(slide_path) if dicom_wsi.slides else dicom_wsi.DicomSlide.from_folder(slide_path)
+    dataset = pydicom.dcmread(dicom_slide.instances[0].path, stop_before_pixels=True, defer_size=DICOM_DEFER_SIZE)
+    width, height = dicom_slide.level_dimensions[-1]
+
+    return {
+        "format": "dicom",
+        "levels": dicom_slide.level_count,
+        "tile_size": dicom_slide.tile_size,
+        "overlap": dicom_slide.overlap,
+        "level_dimensions": dicom_slide.level_dimensions,
+        "max_width": width,
+        "max_height": height,
+        "dzi": dicom_slide.get_dzi("jpeg"),
+        "metadata": filtered_dicom_metadata(dataset),
+    }
+
+
+def _read_openslide_metadata(slide_path: Path, source: Path) -> dict[str, Any]:
+    if slide_cache.handles is not None:
+        options = slide_cache.handles.geometry(source).options
+        with slide_cache.handles.lease(source) as dzi_gen, slide_cache.handles.lease_slide(slide_path) as slide:
+            return _openslide_metadata(slide, dzi_gen, options)
+
+    with contextlib.ExitStack() as stack:
+        slide = stack.enter_context(contextlib.closing(openslide.OpenSlide(str(slide_path))))
+        tiled = slide
+        if source != slide_path:
+            tiled = stack.enter_context(contextlib.closing(openslide.OpenSlide(str(source))))
+        options = slide_cache.deepzoom_options(tiled)
+        dzi_gen = DeepZoomGenerator(
+            tiled, tile_size=options.tile_size, overlap=options.overlap, limit_bounds=options.limit_bounds
+        )
+        return _openslide_metadata(slide, dzi_gen, options)
+
+
+def _openslide_metadata(
+    slide: openslide.OpenSlide, dzi_gen: DeepZoomGenerator, options: slide_cache.DeepZoomOptions
+) -> dict[str, Any]:
+    properties = dict(slide.properties)
+    width, height = dzi_gen.level_dimensions[-1]
+    return {
+        "format": properties.get(openslide.PROPERTY_NAME_VENDOR, "openslide"),
+        "levels": dzi_gen.level_count,
+        "tile_size": options.tile_size,
+        "overlap": options.overlap,
+        "level_dimensions": dzi_gen.level_dimensions,
+        "max_width": width,
+        "max_height": height,
+        "dzi": dzi_gen.get_dzi("jpeg"),
+        "mpp_x": properties.get(openslide.PROPERTY_NAME_MPP_X),
+        "mpp_y": properties.get(openslide.PROPERTY_NAME_MPP_Y),
+        "associated_images": sorted(slide.associated_images),
+        "properties": properties,
+    }
+
+
+class SlideMetadataCache:
+    """In-process LRU of slide metadata backed by Redis, so each slide version is read once across workers.
+
+    Parameters
+    ----------
+    max_entries: int, optional
+        Number of slides kept in process memory. Defaults to 1024.
+    redis_ttl: int, optional
+        Expiration in seconds of metadata stored in the Redis cache pool from `core/utils/cache.py`.
+        Defaults to 86400.
+
+    Note
+    ----
+        - Keys are slide identities, which change with the file's mtime, so a modified slide is read again.
+        - Metadata is stored as it round-trips through JSON, so local and Redis hits look the same.
+        - Redis errors are logged and treated as misses.
+    """
+
+    def __init__(self, max_entries: int = 1024, redis_ttl: int = 86400) -> None:
+        self.max_entries = max_entries
+        self.redis_ttl = redis_ttl
+        self._entries: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get(self, slide_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            metadata = self._entries.get(slide_id)
+            if metadata is not None:
+                self._entries.move_to_end(slide_id)
+                self.hits += 1
+                return metadata
+
+        data = None
+        if cache.client is not None:
+            try:
+                data = await cache.client.get(f"{REDIS_PREFIX}{slide_id}")
+            except Exception as e:
+                logger.warning(f"Redis slide metadata lookup failed: {e}")
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.redis_hits += 1
+
+        metadata = json.loads(data)
+        self._put_local(slide_id, metadata)
+        return metadata
+
+    async def put(self, slide_id: str, metadata: dict[str, Any]) -> dict[str, Any]:
+        """Store metadata and return it in its cached, JSON round-tripped form."""
+        data = json.dumps(metadata)
+        metadata = json.loads(data)
+        self._put_local(slide_id, metadata)
+
+        if cache.client is not None:
+            try:
+                await cache.client.set(f"{REDIS_PREFIX}{slide_id}", data, ex=self.redis_ttl)
+            except Exception as e:
+                logger.warning(f"Redis slide metadata store failed: {e}")
+
+        return metadata
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+            }
+
+    def _put_local(self, slide_id: str, metadata: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[slide_id] = metadata
+            self._entries.move_to_end(slide_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+metadata: SlideMetadataCache | None = None
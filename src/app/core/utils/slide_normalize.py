@@ -0,0 +1,252 @@
+import itertools
+import math
+import os
+import shutil
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor
+from io import BytesIO
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import openslide
+import tifffile
+from PIL import Image
+
+from ..logger import logging
+from .level_synthesis import halve
+from .slide_cache import deepzoom_options
+from .slide_regions import read_openslide_region
+
+logger = logging.getLogger(__name__)
+
+NORMALIZED_SUFFIX = ".tiff"
+
+# Vendors whose files OpenSlide reads from strips or per-tile JPEG restart markers, slowly.
+SLOW_VENDORS = {"hamamatsu"}
+
+# Single-level slides up to this size are cheap enough to serve as they are.
+MAX_SINGLE_LEVEL_PIXELS = 4096 * 4096
+
+# Tile addresses (col, row) of one batch of a level.
+TileBatch = list[tuple[int, int]]
+
+
+class NormalizedSlideStore:
+    """Tiled pyramidal TIFF copies of slides, named after the slide version they were made from::
+
+        {root}/{slide_id}.tiff
+
+    A copy is written under a temporary name and renamed when complete, so an existing copy is always whole.
+
+    Parameters
+    ----------
+    root: Path | str
+        Directory holding the copies.
+    """
+
+    def __init__(self, root: Path | str) -> None:
+        self.root = Path(root)
+
+    def relative_path(self, slide_id: str) -> str:
+        return f"{slide_id}{NORMALIZED_SUFFIX}"
+
+    def path(self, slide_id: str) -> Path:
+        return self.root / self.relative_path(slide_id)
+
+    def existing_path(self, slide_id: str) -> Path | None:
+        path = self.path(slide_id)
+        return path if path.is_file() else None
+
+
+def normalization_reason(slide: openslide.AbstractSlide) -> str | None:
+    """Return why a slide is slow to serve from its native file, or None if it is served as it is."""
+    vendor = slide.properties.get(openslide.PROPERTY_NAME_VENDOR)
+    if vendor in SLOW_VENDORS:
+        return f"{vendor} format"
+    if "openslide.level[0].tile-width" not in slide.properties:
+        return "untiled base level"
+
+    width, height = slide.dimensions
+    if slide.level_count == 1 and width * height > MAX_SINGLE_LEVEL_PIXELS:
+        return "single-level slide"
+    return None
+
+
+def bounds(slide: openslide.AbstractSlide, limit_bounds: bool) -> tuple[int, int, int, int]:
+    """Return the level-0 region DeepZoom serves: the non-empty bounds with `limit_bounds`."""
+    width, height = slide.dimensions
+    if not limit_bounds:
+        return 0, 0, width, height
+
+    return (
+        int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_X, 0)),
+        int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_Y, 0)),
+        int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_WIDTH, width)),
+        int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_HEIGHT, height)),
+    )
+
+
+def level_sizes(width: int, height: int, tile_size: int) -> list[tuple[int, int]]:
+    """Sizes of the stored levels, each half the previous one as DeepZoom levels are, down to one tile."""
+    sizes = [(width, height)]
+    while sizes[-1][0] > tile_size or sizes[-1][1] > tile_size:
+        sizes.append((math.ceil(sizes[-1][0] / 2), math.ceil(sizes[-1][1] / 2)))
+    return sizes
+
+
+def encode_base_tiles(
+    slide_path: str, origin: tuple[int, int], addresses: TileBatch, tile_size: int, quality: int
+) -> list[bytes]:
+    """Read and JPEG-encode tiles of the full-resolution level from the original slide, in a worker process."""
+    slide = openslide.open_slide(slide_path)
+    try:
+        tiles = []
+        for col, row in addresses:
+            location = (origin[0] + col * tile_size, origin[1] + row * tile_size)
+            tiles.append(_encode(read_openslide_region(slide, location, 1, (tile_size, tile_size)), quality))
+        return tiles
+    finally:
+        slide.close()
+
+
+def encode_reduced_tiles(previous_path: str, addresses: TileBatch, tile_size: int, quality: int) -> list[bytes]:
+    """Build tiles of a level by halving 2x2 tiles of the level written before it. Runs in a worker process."""
+    slide = openslide.OpenSlide(previous_path)
+    try:
+        tiles = []
+        for col, row in addresses:
+            block = read_openslide_region(slide, (2 * col * tile_size, 2 * row * tile_size), 1, (2 * tile_size,) * 2)
+            tiles.append(_encode(Image.fromarray(halve(np.asarray(block))), quality))
+        return tiles
+    finally:
+        slide.close()
+
+
+def _encode(image: Image.Image, quality: int) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def ordered_results(
+    executor: Executor, func: Callable[..., Any], batches: Iterable[tuple], max_in_flight: int
+) -> Iterator[Any]:
+    """Yield `func(*batch)` for every batch in order, with at most `max_in_flight` batches submitted at once."""
+    batches = iter(batches)
+    pending = deque(executor.submit(func, *args) for args in itertools.islice(batches, max_in_flight))
+    while pending:
+        result = pending.popleft().result()
+        args = next(batches, None)
+        if args is not None:
+            pending.append(executor.submit(func, *args))
+        yield result
+
+
+def normalize_slide(
+    slide_path: Path,
+    target: Path,
+    executor: Executor,
+    quality: int = 90,
+    batch_size: int = 64,
+    max_in_flight: int = 2,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> dict[str, Any]:
+    """Rewrite a slide as a tiled, JPEG-compressed pyramidal TIFF on the DeepZoom tile grid. Blocking.
+
+    The full-resolution level covers the region DeepZoom serves, in tiles of the DeepZoom tile size chosen
+    for the original, so DeepZoom levels of the copy map onto stored levels without resampling, and the copy
+    is served with that tile size and no overlap, one stored tile per DeepZoom tile. Each level
+    is written to its own file in a staging folder, the next one being reduced from it, then the compressed
+    tiles of all levels are copied into `target`. The original slide is left untouched.
+
+    Returns
+    -------
+    dict[str, Any]
+        Summary of the copy.
+    """
+    slide = openslide.open_slide(str(slide_path))
+    try:
+        options = deepzoom_options(slide)
+        tile_size = options.tile_size
+        x, y, width, height = bounds(slide, options.limit_bounds)
+        mpp = (
+            slide.properties.get(openslide.PROPERTY_NAME_MPP_X),
+            slide.properties.get(openslide.PROPERTY_NAME_MPP_Y),
+        )
+    finally:
+        slide.close()
+
+    sizes = level_sizes(width, height, tile_size)
+    grids = [(math.ceil(size[0] / tile_size), math.ceil(size[1] / tile_size)) for size in sizes]
+    total = sum(cols * rows for cols, rows in grids)
+    done = 0
+
+    staging = target.with_name(f".{target.name}.{os.getpid()}.partial")
+    staging.mkdir(parents=True, exist_ok=True)
+    try:
+        level_paths = []
+        for level, ((level_width, level_height), (cols, rows)) in enumerate(zip(sizes, grids)):
+            addresses = [(col, row) for row in range(rows) for col in range(cols)]
+            chunks = [addresses[start : start + batch_size] for start in range(0, len(addresses), batch_size)]
+            if level == 0:
+                batches = ((str(slide_path), (x, y), chunk, tile_size, quality) for chunk in chunks)
+                encode = encode_base_tiles
+            else:
+                batches = ((str(level_paths[-1]), chunk, tile_size, quality) for chunk in chunks)
+                encode = encode_reduced_tiles
+
+            def tiles() -> Iterator[bytes]:
+                nonlocal done
+                for batch in ordered_results(executor, encode, batches, max_in_flight):
+                    yield from batch
+                    done += len(batch)
+                    if on_progress is not None:
+                        on_progress(done, total)
+
+            level_path = staging / f"{level}.tiff"
+            with tifffile.TiffWriter(level_path, bigtiff=True) as writer:
+                writer.write(tiles(), **_page_options(level_width, level_height, tile_size))
+            level_paths.append(level_path)
+
+        partial = staging / target.name
+        with tifffile.TiffWriter(partial, bigtiff=True) as writer:
+            for level, (level_path, (level_width, level_height)) in enumerate(zip(level_paths, sizes)):
+                options = _page_options(level_width, level_height, tile_size)
+                if level == 0 and mpp[0] and mpp[1]:
+                    # Pixels per centimeter, which OpenSlide reads back as the slide's microns per pixel.
+                    options["resolution"] = (1e4 / float(mpp[0]), 1e4 / float(mpp[1]))
+                    options["resolutionunit"] = "CENTIMETER"
+                if level > 0:
+                    options["subfiletype"] = 1
+                writer.write(_stored_tiles(level_path), **options)
+        os.replace(partial, target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    return {"width": width, "height": height, "levels": len(sizes), "tiles": total, "bytes": target.stat().st_size}
+
+
+def _page_options(width: int, height: int, tile_size: int) -> dict[str, Any]:
+    return {
+        "shape": (height, width, 3),
+        "dtype": "uint8",
+        "tile": (tile_size, tile_size),
+        "compression": "jpeg",
+        "photometric": "rgb",
+        "metadata": None,
+    }
+
+
+def _stored_tiles(path: Path) -> Iterator[bytes]:
+    """Yield the compressed tiles of a single-level TIFF as stored, one at a time."""
+    with tifffile.TiffFile(path) as tiff:
+        page = tiff.pages[0]
+        handle = tiff.filehandle
+        for offset, length in zip(page.dataoffsets, page.databytecounts):  # type: ignore
+            handle.seek(offset)
+            yield handle.read(length)
+
+
+store: NormalizedSlideStore | None = None
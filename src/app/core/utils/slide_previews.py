@@ -0,0 +1,142 @@
+import json
+from pathlib import Path
+
+import openslide
+from PIL import Image
+
+from ..logger import logging
+from .dicom_wsi import DicomSeriesIndex, DicomSlide, is_dicom_series, read_instance
+from .tile_encoding import TileEncoding, encode_tile
+from .tile_store import write_atomic
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_KINDS = ("thumbnail", "label", "macro")
+PREVIEW_SIZES = (128, 256, 512, 1024)
+DEFAULT_PREVIEW_SIZE = 256
+PREVIEW_ENCODING = TileEncoding("jpeg", 85)
+MANIFEST_FILE = "previews.json"
+
+# DICOM image types of the instances holding each associated image.
+DICOM_PREVIEW_IMAGE_TYPES = {"label": "LABEL", "macro": "OVERVIEW"}
+
+
+class PreviewStore:
+    """Disk layout of precomputed slide previews.
+
+    Each slide gets a directory named after its slide identity, with every preview kind rendered once at
+    each of the `PREVIEW_SIZES` (longest side, in pixels)::
+
+        {root}/{slide_id}/previews.json
+        {root}/{slide_id}/{kind}/{size}.jpeg
+
+    The manifest lists the sizes available for each kind and is written last, so its presence means the
+    previews of that slide version are complete.
+
+    Parameters
+    ----------
+    root: Path | str
+        Directory holding the previews.
+    """
+
+    def __init__(self, root: Path | str) -> None:
+        self.root = Path(root)
+
+    def relative_path(self, slide_id: str, kind: str, size: int) -> str:
+        return f"{slide_id}/{kind}/{size}.{PREVIEW_ENCODING.format}"
+
+    def path(self, slide_id: str, kind: str, size: int) -> Path:
+        return self.root / self.relative_path(slide_id, kind, size)
+
+    def read_manifest(self, slide_id: str) -> dict[str, list[int]] | None:
+        try:
+            return json.loads((self.root / slide_id / MANIFEST_FILE).read_text())
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, slide_id: str, manifest: dict[str, list[int]]) -> None:
+        write_atomic(self.root / slide_id / MANIFEST_FILE, json.dumps(manifest).encode())
+
+
+def best_size(sizes: list[int], size: int) -> int:
+    """Pick the smallest precomputed size at least as large as the requested one, or the largest there is."""
+    return min((candidate for candidate in sizes if candidate >= size), default=max(sizes))
+
+
+def read_preview_sources(slide_path: Path, dicom_index: DicomSeriesIndex | None = None) -> dict[str, Image.Image]:
+    """Read the images previews are made from: a thumbnail of the slide and its label and macro images.
+
+    The thumbnail is read from the smallest pyramid level covering the largest preview size, so the full
+    resolution level is never decoded. A DICOM series without a stored level small enough to compose it
+    from gets no thumbnail, and its thumbnail previews answer 404. Blocking.
+    """
+    largest = (PREVIEW_SIZES[-1], PREVIEW_SIZES[-1])
+
+    if is_dicom_series(slide_path):
+        sources = {}
+        dicom_slide = DicomSlide.from_folder(slide_path, dicom_index)
+        try:
+            sources["thumbnail"] = dicom_slide.get_thumbnail(largest)
+        except ValueError as e:
+            logger.warning(f"Skipping thumbnail of {slide_path}: {e}")
+        finally:
+            dicom_slide.close()
+
+        for kind, image_type in DICOM_PREVIEW_IMAGE_TYPES.items():
+            for path in sorted(slide_path.glob("*.dcm")):
+                try:
+                    instance = read_instance(path, {image_type})
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable DICOM file {path}: {e}")
+                    continue
+                if instance is not None:
+                    image_slide = DicomSlide([instance])
+                    try:
+                        sources[kind] = image_slide.get_thumbnail(largest)
+                    finally:
+                        image_slide.close()
+                    break
+        return sources
+
+    slide = openslide.OpenSlide(str(slide_path))
+    try:
+        sources = {"thumbnail": slide.get_thumbnail(largest)}
+        for kind in PREVIEW_KINDS[1:]:
+            if kind in slide.associated_images:
+                sources[kind] = slide.associated_images[kind]
+        return sources
+    finally:
+        slide.close()
+
+
+def generate_previews(
+    slide_path: Path, store: PreviewStore, slide_id: str, dicom_index: DicomSeriesIndex | None = None
+) -> dict[str, list[int]]:
+    """Render every preview of a slide to the preview store and write its manifest. Blocking.
+
+    Sizes above the source image's longest side are skipped, except the smallest one, so small label
+    images are not upscaled.
+
+    Returns
+    -------
+    dict[str, list[int]]
+        The sizes rendered for each preview kind.
+    """
+    manifest = {}
+    for kind, source in read_preview_sources(slide_path, dicom_index).items():
+        source = source.convert("RGB")
+        sizes = []
+        for size in PREVIEW_SIZES:
+            if sizes and size > max(source.size):
+                break
+            preview = source.copy()
+            preview.thumbnail((size, size), Image.Resampling.LANCZOS)
+            write_atomic(store.path(slide_id, kind, size), encode_tile(preview, PREVIEW_ENCODING))
+            sizes.append(size)
+        manifest[kind] = sizes
+
+    store.write_manifest(slide_id, manifest)
+    return manifest
+
+
+store: PreviewStore | None = None
@@ -0,0 +1,370 @@
+import abc
+import math
+import struct
+import zlib
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import openslide
+import pydicom
+from PIL import Image
+
+from ..logger import logging
+from . import dicom_wsi, slide_cache
+
+logger = logging.getLogger(__name__)
+
+REGION_FORMATS = ("raw", "png", "tiff")
+
+# Largest block read from a slide at once, and the memory budget of one band of raw or PNG scanlines.
+REGION_READ_SIZE = 512
+REGION_BAND_BYTES = 16 * 1024 * 1024
+REGION_TIFF_TILE_SIZE = 256
+MAX_TIFF_BYTES = 2**32 - 1
+
+Block = tuple[int, int, int, int]
+
+
+class RegionInfo(NamedTuple):
+    """Full-resolution size, native level downsamples and microns per pixel of a slide, and how it is read."""
+
+    width: int
+    height: int
+    level_downsamples: tuple[float, ...]
+    mpp: float | None
+    dicom: bool = False
+
+
+def read_region_info(slide_path: Path) -> RegionInfo:
+    """Read what region requests are validated against, without reading pixels. Blocking."""
+    if dicom_wsi.is_dicom_series(slide_path):
+        dicom_slide = _dicom_slide(slide_path)
+        base = dicom_slide.instances[0]
+        return RegionInfo(
+            base.width,
+            base.height,
+            tuple(base.width / instance.width for instance in dicom_slide.instances),
+            _dicom_mpp(pydicom.dcmread(base.path, stop_before_pixels=True)),
+            dicom=True,
+        )
+
+    with _lease_openslide(slide_path) as slide:
+        mpp = slide.properties.get(openslide.PROPERTY_NAME_MPP_X)
+        return RegionInfo(*slide.dimensions, tuple(slide.level_downsamples), float(mpp) if mpp else None)
+
+
+def read_region_block(
+    slide_path: Path, x: int, y: int, downsample: float, width: int, height: int, dicom: bool | None = None
+) -> np.ndarray:
+    """Read a block of a region as an RGB array, in `REGION_READ_SIZE` reads. Blocking.
+
+    Parameters
+    ----------
+    slide_path: Path
+        The slide.
+    x, y: int
+        Top-left corner of the block, in full-resolution pixels.
+    downsample: float
+        Output scale, in full-resolution pixels per output pixel.
+    width, height: int
+        Block size, in output pixels. Areas outside the slide are white.
+    dicom: bool | None, optional
+        Whether the slide is a DICOM series, as its `RegionInfo` tells, so it is resolved once per region.
+        Defaults to None, to check it here.
+    """
+    if dicom is None:
+        dicom = dicom_wsi.is_dicom_series(slide_path)
+
+    block = np.empty((height, width, 3), dtype=np.uint8)
+    for top in range(0, height, REGION_READ_SIZE):
+        for left in range(0, width, REGION_READ_SIZE):
+            size = (min(REGION_READ_SIZE, width - left), min(REGION_READ_SIZE, height - top))
+            location = (x + round(left * downsample), y + round(top * downsample))
+            image = _read(slide_path, dicom, location, downsample, size)
+            block[top : top + size[1], left : left + size[0]] = np.asarray(image)
+
+    return block
+
+
+def _read(
+    slide_path: Path, dicom: bool, location: tuple[int, int], downsample: float, size: tuple[int, int]
+) -> Image.Image:
+    if dicom:
+        return _read_dicom(_dicom_slide(slide_path), location, downsample, size)
+
+    with _lease_openslide(slide_path) as slide:
+        return read_openslide_region(slide, location, downsample, size)
+
+
+def read_openslide_region(
+    slide: openslide.OpenSlide, location: tuple[int, int], downsample: float, size: tuple[int, int]
+) -> Image.Image:
+    """Read a region at any downsample from the best native level, scaled to `size`. Blocking.
+
+    Transparent areas outside the slide bounds are composited on the slide background, as DeepZoom tiles are.
+    """
+    level = slide.get_best_level_for_downsample(downsample)
+    scale = downsample / slide.level_downsamples[level]
+    read_size = (max(1, math.ceil(size[0] * scale)), max(1, math.ceil(size[1] * scale)))
+    region = slide.read_region(location, level, read_size)
+
+    background = "#" + slide.properties.get(openslide.PROPERTY_NAME_BACKGROUND_COLOR, "ffffff")
+    image = Image.new("RGB", read_size, background)
+    image.paste(region, mask=region)
+    return image if image.size == size else image.resize(size, Image.Resampling.BOX)
+
+
+def _read_dicom(
+    dicom_slide: dicom_wsi.DicomSlide, location: tuple[int, int], downsample: float, size: tuple[int, int]
+) -> Image.Image:
+    # DeepZoom levels halve the resolution; read the coarsest one at least as detailed as the output.
+    level = max(0, dicom_slide.level_count - 1 - int(math.log2(max(downsample, 1.0))))
+    level_downsample = 2 ** (dicom_slide.level_count - 1 - level)
+    scale = downsample / level_downsample
+    level_width, level_height = dicom_slide.level_dimensions[level]
+
+    left, top = math.floor(location[0] / level_downsample), math.floor(location[1] / level_downsample)
+    read_size = (max(1, math.ceil(size[0] * scale)), max(1, math.ceil(size[1] * scale)))
+    image = Image.new("RGB", read_size, "white")
+
+    inner_left, inner_top = max(left, 0), max(top, 0)
+    inner_right, inner_bottom = min(left + read_size[0], level_width), min(top + read_size[1], level_height)
+    if inner_right > inner_left and inner_bottom > inner_top:
+        region = dicom_slide.read_region(
+            level, (inner_left, inner_top), (inner_right - inner_left, inner_bottom - inner_top)
+        )
+        image.paste(region, (inner_left - left, inner_top - top))
+
+    return image if image.size == size else image.resize(size, Image.Resampling.BOX)
+
+
+def _dicom_slide(slide_path: Path) -> dicom_wsi.DicomSlide:
+    return dicom_wsi.slides.get(slide_path) if dicom_wsi.slides else dicom_wsi.DicomSlide.from_folder(slide_path)
+
+
+def _dicom_mpp(dataset: pydicom.Dataset) -> float | None:
+    try:
+        spacing = dataset.SharedFunctionalGroupsSequence[0].PixelMeasuresSequence[0].PixelSpacing
+        return float(spacing[1]) * 1000
+    except (AttributeError, IndexError):
+        pass
+
+    if "ImagedVolumeWidth" in dataset and "TotalPixelMatrixColumns" in dataset:
+        return float(dataset.ImagedVolumeWidth) / int(dataset.TotalPixelMatrixColumns) * 1000
+    return None
+
+
+@contextmanager
+def _lease_openslide(slide_path: Path) -> Iterator[openslide.OpenSlide]:
+    """Borrow the cached OpenSlide handle of a slide, or open one if there is no handle cache."""
+    if slide_cache.handles is not None:
+        with slide_cache.handles.lease_slide(slide_path) as slide:
+            yield slide
+        return
+
+    slide = openslide.OpenSlide(str(slide_path))
+    try:
+        yield slide
+    finally:
+        slide.close()
+
+
+class RegionEncoder(abc.ABC):
+    """Incremental encoder of a region, fed with blocks in the order `blocks` lists them.
+
+    Parameters
+    ----------
+    width, height: int
+        Region size, in output pixels.
+    """
+
+    media_type = "application/octet-stream"
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+
+    @property
+    def content_length(self) -> int | None:
+        return None
+
+    def blocks(self) -> Iterator[Block]:
+        """Yield the (x, y, width, height) of the blocks to read, as horizontal bands of whole rows."""
+        band_height = max(1, min(REGION_READ_SIZE, REGION_BAND_BYTES // (self.width * 3)))
+        for y in range(0, self.height, band_height):
+            yield 0, y, self.width, min(band_height, self.height - y)
+
+    def header(self) -> bytes:
+        return b""
+
+    @abc.abstractmethod
+    def encode(self, block: np.ndarray) -> bytes:
+        """Encode the next block, returning the bytes to stream, if any."""
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class RawEncoder(RegionEncoder):
+    """Interleaved 8-bit RGB scanlines, with no header."""
+
+    @property
+    def content_length(self) -> int | None:
+        return self.width * self.height * 3
+
+    def encode(self, block: np.ndarray) -> bytes:
+        return block.tobytes()
+
+
+class PngEncoder(RegionEncoder):
+    """8-bit RGB PNG, compressed band by band into a stream of IDAT chunks."""
+
+    media_type = "image/png"
+
+    def __init__(self, width: int, height: int) -> None:
+        super().__init__(width, height)
+        self._compressor = zlib.compressobj(6)
+
+    def header(self) -> bytes:
+        # 8-bit truecolor, default compression and filtering, no interlacing.
+        ihdr = struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)
+        return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", ihdr)
+
+    def encode(self, block: np.ndarray) -> bytes:
+        # Every scanline starts with its filter type, 0 for none.
+        scanlines = np.zeros((block.shape[0], self.width * 3 + 1), dtype=np.uint8)
+        scanlines[:, 1:] = block.reshape(block.shape[0], -1)
+        data = self._compressor.compress(scanlines.tobytes())
+        return _png_chunk(b"IDAT", data) if data else b""
+
+    def finish(self) -> bytes:
+        return _png_chunk(b"IDAT", self._compressor.flush()) + _png_chunk(b"IEND", b"")
+
+
+class TiffEncoder(RegionEncoder):
+    """Uncompressed, tiled 8-bit RGB TIFF.
+
+    Every tile has the same size, so the offsets of all tiles are known up front and the directory is
+    written before the first tile. Blocks are read tile by tile, in row-major tile order.
+
+    Parameters
+    ----------
+    width, height: int
+        Region size, in output pixels.
+    mpp: float | None, optional
+        Microns per output pixel, written as the image resolution when known. Defaults to None.
+    """
+
+    media_type = "image/tiff"
+
+    def __init__(self, width: int, height: int, mpp: float | None = None) -> None:
+        super().__init__(width, height)
+        self.mpp = mpp
+        self.tile_size = REGION_TIFF_TILE_SIZE
+        self.tiles_across = math.ceil(width / self.tile_size)
+        self.tiles_down = math.ceil(height / self.tile_size)
+        self.tile_bytes = self.tile_size * self.tile_size * 3
+        self._header = self._build_header()
+
+    @property
+    def content_length(self) -> int | None:
+        return len(self._header) + self.tiles_across * self.tiles_down * self.tile_bytes
+
+    def blocks(self) -> Iterator[Block]:
+        for row in range(self.tiles_down):
+            for col in range(self.tiles_across):
+                x, y = col * self.tile_size, row * self.tile_size
+                yield x, y, min(self.tile_size, self.width - x), min(self.tile_size, self.height - y)
+
+    def header(self) -> bytes:
+        return self._header
+
+    def encode(self, block: np.ndarray) -> bytes:
+        if block.shape[:2] == (self.tile_size, self.tile_size):
+            return block.tobytes()
+
+        # Edge tiles are padded to the full tile size.
+        tile = np.full((self.tile_size, self.tile_size, 3), 255, dtype=np.uint8)
+        tile[: block.shape[0], : block.shape[1]] = block
+        return tile.tobytes()
+
+    def _build_header(self) -> bytes:
+        tile_count = self.tiles_across * self.tiles_down
+        entries: list[tuple[int, int, int, bytes]] = [
+            (256, 4, 1, struct.pack("<I", self.width)),
+            (257, 4, 1, struct.pack("<I", self.height)),
+            (258, 3, 3, struct.pack("<HHH", 8, 8, 8)),
+            (259, 3, 1, struct.pack("<H", 1)),
+            (262, 3, 1, struct.pack("<H", 2)),
+            (277, 3, 1, struct.pack("<H", 3)),
+            (284, 3, 1, struct.pack("<H", 1)),
+            (322, 4, 1, struct.pack("<I", self.tile_size)),
+            (323, 4, 1, struct.pack("<I", self.tile_size)),
+            (324, 4, tile_count, b""),
+            (325, 4, tile_count, struct.pack(f"<{tile_count}I", *[self.tile_bytes] * tile_count)),
+        ]
+        if self.mpp:
+            # Pixels per centimetre, as rationals with a fixed denominator.
+            resolution = struct.pack("<II", round(10000 / self.mpp * 1000), 1000)
+            entries += [(282, 5, 1, resolution), (283, 5, 1, resolution), (296, 3, 1, struct.pack("<H", 3))]
+        entries.sort()
+
+        directory_size = 2 + 12 * len(entries) + 4
+        values_size = sum(len(value) if len(value) > 4 else 0 for _, _, _, value in entries)
+        values_size += 4 * tile_count if tile_count > 1 else 0
+        first_tile = 8 + directory_size + values_size
+        if first_tile + tile_count * self.tile_bytes > MAX_TIFF_BYTES:
+            raise ValueError("Region is too large for a TIFF file")
+
+        offsets = struct.pack(f"<{tile_count}I", *(first_tile + index * self.tile_bytes for index in range(tile_count)))
+        directory = struct.pack("<H", len(entries))
+        values = b""
+        values_offset = 8 + directory_size
+        for tag, type_, count, value in entries:
+            value = offsets if tag == 324 else value
+            if len(value) > 4:
+                directory += struct.pack("<HHII", tag, type_, count, values_offset + len(values))
+                values += value
+            else:
+                directory += struct.pack("<HHI", tag, type_, count) + value.ljust(4, b"\0")
+        directory += struct.pack("<I", 0)
+
+        return b"II*\0" + struct.pack("<I", 8) + directory + values
+
+
+def region_encoder(format: str, width: int, height: int, mpp: float | None = None) -> RegionEncoder:
+    if format == "png":
+        return PngEncoder(width, height)
+    if format == "tiff":
+        return TiffEncoder(width, height, mpp)
+    return RawEncoder(width, height)
+
+
+async def stream_region(
+    encoder: RegionEncoder,
+    read_block: Callable[[int, int, int, int], Awaitable[np.ndarray]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> AsyncIterator[bytes]:
+    """Read and encode a region block by block, stopping as soon as the client goes away.
+
+    Only one block is held in memory at a time, whatever the region size.
+    """
+    yield encoder.header()
+
+    for x, y, width, height in encoder.blocks():
+        if await is_disconnected():
+            logger.info(f"Client disconnected, region stream stopped at block {x},{y}")
+            return
+
+        data = encoder.encode(await read_block(x, y, width, height))
+        if data:
+            yield data
+
+    yield encoder.finish()
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
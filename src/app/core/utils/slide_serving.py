@@ -0,0 +1,544 @@
+import asyncio
+import functools
+import struct
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from contextlib import AbstractContextManager
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from arq.constants import result_key_prefix
+from arq.jobs import Job, JobStatus
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+from openslide.deepzoom import DeepZoomGenerator
+
+from ..config import settings
+from ..exceptions.cache_exceptions import MissingClientError
+from ..exceptions.tile_exceptions import ClientDisconnectedError, TileQueueFullError
+from ..logger import logging
+from . import (
+    dicom_wsi,
+    level_synthesis,
+    queue,
+    single_flight,
+    slide_cache,
+    slide_metadata,
+    slide_normalize,
+    slide_staging,
+    tile_cache,
+    tile_prefetch,
+    tile_render,
+    tile_store,
+    tissue_mask,
+)
+from .tile_encoding import (
+    TileEncoding,
+    encode_tile,
+    parse_quality_profiles,
+    profiles_fingerprint,
+    select_encoding,
+)
+from .tile_render import RenderPriority
+
+logger = logging.getLogger(__name__)
+
+# Per-level tile quality, configurable through TILE_QUALITY_PROFILES
+TILE_QUALITY_PROFILES = parse_quality_profiles(settings.TILE_QUALITY_PROFILES)
+
+# Tile ETags have to be known before the slide is opened, so they name the requested format and a digest of
+# the quality settings instead of the per-level encoding, which also depends on the slide's level count.
+TILE_ENCODING_VERSION = profiles_fingerprint(TILE_QUALITY_PROFILES, settings.TILE_QUALITY)
+
+# Seconds between checks that a client waiting for a tile is still connected
+DISCONNECT_POLL_INTERVAL = 0.05
+
+
+# -------------- deepzoom --------------
+# Function to create DeepZoom tiles
+def get_deepzoom(slide_path: Path) -> AbstractContextManager[DeepZoomGenerator]:
+    """Lease the cached DeepZoom generator of an OpenSlide image, with the slide's own tile geometry."""
+    if slide_cache.handles is None:
+        raise MissingClientError("Slide handle cache is not initialized.")
+
+    return slide_cache.handles.lease(slide_path)
+
+
+def get_dicom_slide(slide_path: Path) -> dicom_wsi.DicomSlide:
+    """Return the cached DICOM WSI series of a slide folder, reading its headers if needed. Blocking."""
+    if dicom_wsi.slides is None:
+        raise MissingClientError("DICOM slide cache is not initialized.")
+
+    return dicom_wsi.slides.get(slide_path)
+
+
+def render_dicom_tile(slide_path: Path, level: int, col: int, row: int, encoding: TileEncoding) -> bytes:
+    """Return a DICOM tile, passing stored JPEG frames through untouched when the tile maps onto one."""
+    dicom_slide = get_dicom_slide(slide_path)
+    if encoding.format == "jpeg":
+        content = dicom_slide.read_native_tile(level, col, row)
+        if content is not None:
+            return content
+
+    return encode_tile(dicom_slide.get_tile(level, (col, row)), encoding)
+
+
+def render_tile(slide_path: Path, level: int, col: int, row: int, encoding: TileEncoding) -> bytes:
+    """Read a DeepZoom tile and encode it. Blocking, so it runs on the tile render executor."""
+    with get_deepzoom(slide_path) as dzi_gen:
+        tile = dzi_gen.get_tile(level, (col, row))
+
+    return encode_tile(tile, encoding)
+
+
+def local_path(slide_path: Path, slide_id: str) -> Path:
+    """Return the local disk copy of a slide version once staging completed, else the slide itself."""
+    if slide_staging.store is None:
+        return slide_path
+
+    return slide_staging.store.existing_path(slide_id, slide_path.name) or slide_path
+
+
+class ServedSlide(NamedTuple):
+    """A slide as the tile routes serve it."""
+
+    path: Path  # The slide in the slides directory
+    source: Path  # The file DeepZoom tiles are cut from: the slide, or its normalized copy
+    slide_id: str  # The served version, which keys tiles, DZI and metadata
+
+    @property
+    def normalized(self) -> bool:
+        return self.source != self.path
+
+
+def served_slide(slide_path: Path) -> ServedSlide:
+    """Resolve what the tile routes serve for a slide: its normalized tiled TIFF copy once ingest made one.
+
+    The copy is served with its own DeepZoom geometry, one stored tile per tile without overlap, so it is a
+    version of its own: tiles, DZI and metadata cut from the original are not reused for it.
+    """
+    slide_id = slide_cache.slide_identity(slide_path)
+    copy = slide_normalize.store.existing_path(slide_id) if slide_normalize.store is not None else None
+    if copy is None:
+        return ServedSlide(slide_path, slide_path, slide_id)
+
+    return ServedSlide(slide_path, copy, slide_cache.slide_identity(copy))
+
+
+# Seconds before this process looks at a slide job again, so every tile miss does not ask Redis about it
+SLIDE_JOB_RECHECK_SECONDS = 300.0
+
+# Slide jobs this process remembers looking at, least recently first
+SLIDE_JOB_MEMORY = 10_000
+
+_checked_jobs: OrderedDict[str, float] = OrderedDict()
+
+
+async def enqueue_slide_job(function: str, slide_path: Path, job_id: str) -> None:
+    """Queue a per-slide-version background job unless it is already queued or running.
+
+    Callers ask for a job whenever what it makes is missing, so a job that finished or failed is queued
+    again, replacing the result arq keeps under its id: a failed job is retried, and a staged copy evicted
+    since is staged anew. This process looks at each job at most once every `SLIDE_JOB_RECHECK_SECONDS`.
+    """
+    if queue.pool is None:
+        return
+
+    now = time.monotonic()
+    if _checked_jobs.get(job_id, 0.0) > now:
+        return
+
+    _checked_jobs[job_id] = now + SLIDE_JOB_RECHECK_SECONDS
+    _checked_jobs.move_to_end(job_id)
+    while len(_checked_jobs) > SLIDE_JOB_MEMORY:
+        _checked_jobs.popitem(last=False)
+
+    status = await Job(job_id, queue.pool).status()
+    if status in (JobStatus.deferred, JobStatus.queued, JobStatus.in_progress):
+        return
+    if status == JobStatus.complete:
+        await queue.pool.delete(result_key_prefix + job_id)
+    await queue.pool.enqueue_job(function, slide_path.name, _job_id=job_id)
+
+
+async def request_staging(slide_path: Path, slide_id: str) -> None:
+    """Queue a copy of a slide version to the local disk while it is rendered without one.
+
+    A copy evicted from the staging cache, or whose staging job failed, is queued again.
+    """
+    if slide_staging.store is not None and slide_staging.store.existing_path(slide_id, slide_path.name) is None:
+        await enqueue_slide_job("stage_slide", slide_path, f"stage:{slide_id}")
+
+
+def render_synthesized_tile(slide_id: str, level: int, col: int, row: int, encoding: TileEncoding) -> bytes:
+    """Cut a tile out of a synthesized low-resolution level and encode it. Blocking."""
+    return encode_tile(level_synthesis.store.get_tile(slide_id, level, (col, row)), encoding)  # type: ignore
+
+
+async def synthesized_level(slide_path: Path, key: tile_cache.TileKey) -> bool:
+    """Return whether a tile's level is served from the level synthesis store.
+
+    Slides whose levels were never synthesized are queued for it, and served from the slide meanwhile.
+    """
+    if level_synthesis.store is None:
+        return False
+
+    levels = await asyncio.to_thread(level_synthesis.store.levels, key.slide_id)
+    if levels is None:
+        await enqueue_slide_job("synthesize_slide_levels", slide_path, f"synthesize:{key.slide_id}")
+        return False
+
+    return key.level in levels
+
+
+async def get_tissue_mask(slide_path: Path, slide_id: str) -> tissue_mask.TissueMask | None:
+    """Return the tissue mask of a slide version, queueing its computation if it is missing."""
+    if tissue_mask.store is None:
+        return None
+
+    mask = tissue_mask.store.cached(slide_id) or await asyncio.to_thread(tissue_mask.store.get, slide_id)
+    if mask is None:
+        await enqueue_slide_job("generate_slide_tissue_mask", slide_path, f"tissue:{slide_id}")
+
+    return mask
+
+
+async def background_tile(slide_path: Path, key: tile_cache.TileKey) -> bytes | None:
+    """Return the shared blank tile if the tissue mask puts a tile entirely on glass, without slide I/O."""
+    mask = await get_tissue_mask(slide_path, key.slide_id)
+    if mask is None or not mask.is_background(key.level, key.col, key.row):
+        return None
+
+    tissue_mask.store.background_tiles += 1  # type: ignore
+    return tissue_mask.blank_tile(mask.tile_size_at(key.level, key.col, key.row), mask.background, key.encoding)
+
+
+def read_slide_geometry(slide_path: Path) -> slide_cache.SlideGeometry:
+    """Return the DeepZoom level geometry of a slide, opening it if needed."""
+    if dicom_wsi.is_dicom_series(slide_path):
+        return get_dicom_slide(slide_path).geometry()
+
+    if slide_cache.handles is None:
+        raise MissingClientError("Slide handle cache is not initialized.")
+
+    return slide_cache.handles.geometry(slide_path)
+
+
+async def run_tile_job(
+    slide_path: Path,
+    func: Callable[..., Any],
+    *args: Any,
+    priority: RenderPriority = RenderPriority.INTERACTIVE,
+    user: str = "",
+    work_key: str | None = None,
+) -> Any:
+    """Run blocking slide work on the tile render executor instead of the event loop, in its priority class."""
+    if tile_render.renderer is None:
+        raise MissingClientError("Tile renderer is not initialized.")
+
+    return await tile_render.renderer.run(str(slide_path), func, *args, priority=priority, user=user, work_key=work_key)
+
+
+async def get_slide_geometry(slide_path: Path) -> slide_cache.SlideGeometry:
+    """Return the level geometry of a slide from the handle cache, without any pixel read."""
+    if dicom_wsi.is_dicom_series(slide_path):
+        dicom_slide = dicom_wsi.slides.cached(slide_path) if dicom_wsi.slides else None
+        geometry = dicom_slide.geometry() if dicom_slide is not None else None
+    else:
+        geometry = slide_cache.handles.cached_geometry(slide_path) if slide_cache.handles else None
+
+    if geometry is None:
+        geometry = await run_tile_job(slide_path, read_slide_geometry, slide_path)
+
+    return geometry
+
+
+async def get_slide_metadata(slide: ServedSlide) -> dict[str, Any]:
+    """Return the metadata of a served slide from the slide metadata cache, reading its headers on a miss."""
+    if slide_metadata.metadata is not None:
+        metadata = await slide_metadata.metadata.get(slide.slide_id)
+        if metadata is not None:
+            return metadata
+
+    metadata = await run_tile_job(slide.path, slide_metadata.read_slide_metadata, slide.path, slide.source)
+    if slide_metadata.metadata is not None:
+        metadata = await slide_metadata.metadata.put(slide.slide_id, metadata)
+
+    return metadata
+
+
+def tile_key(slide_id: str, level: int, col: int, row: int, format: str, level_count: int) -> tile_cache.TileKey:
+    """Build the cache key of a tile, with the encoding the quality profile of its level asks for."""
+    encoding = select_encoding(format, level, level_count, TILE_QUALITY_PROFILES, settings.TILE_QUALITY)
+    return tile_cache.TileKey(slide_id, level, col, row, encoding)
+
+
+async def get_tile_bytes(
+    slide: ServedSlide,
+    key: tile_cache.TileKey,
+    priority: RenderPriority = RenderPriority.INTERACTIVE,
+    user: str = "",
+) -> bytes:
+    """Return an encoded tile from the tile cache, rendering and caching it on a miss.
+
+    Concurrent misses for the same tile share a single render, which is moved up to the most urgent class
+    among them while it waits for a render thread.
+    """
+    if tile_cache.tiles is not None:
+        content = await tile_cache.tiles.get(key)
+        if content is not None:
+            return content
+
+    slide_path = slide.path
+    # Tissue masks and synthesized levels are cut on the original's tile grid, not on the normalized copy's.
+    if not slide.normalized:
+        content = await background_tile(slide_path, key)
+        if content is not None:
+            return content
+
+    schedule = {"priority": priority, "user": user, "work_key": key.redis_key()}
+
+    async def render() -> bytes:
+        if slide.normalized:
+            content = await run_tile_job(
+                slide_path, render_tile, slide.source, key.level, key.col, key.row, key.encoding, **schedule
+            )
+        elif await synthesized_level(slide_path, key):
+            content = await run_tile_job(
+                slide_path,
+                render_synthesized_tile,
+                key.slide_id,
+                key.level,
+                key.col,
+                key.row,
+                key.encoding,
+                **schedule,
+            )
+        elif dicom_wsi.is_dicom_series(slide_path):
+            source = local_path(slide_path, key.slide_id)
+            if source == slide_path:
+                await request_staging(slide_path, key.slide_id)
+            content = await run_tile_job(
+                slide_path, render_dicom_tile, source, key.level, key.col, key.row, key.encoding, **schedule
+            )
+        else:
+            source = local_path(slide_path, key.slide_id)
+            if source == slide_path:
+                await request_staging(slide_path, key.slide_id)
+            content = await run_tile_job(
+                slide_path, render_tile, source, key.level, key.col, key.row, key.encoding, **schedule
+            )
+        if tile_cache.tiles is not None:
+            # Processes coalescing on the Redis lock wait for the tile in Redis, not for an eviction.
+            shared = single_flight.flights is not None and single_flight.flights.redis_lock
+            await tile_cache.tiles.put(key, content, shared)
+        return content
+
+    async def peek() -> bytes | None:
+        return await tile_cache.tiles.get(key) if tile_cache.tiles is not None else None
+
+    if single_flight.flights is None:
+        return await render()
+
+    if tile_render.renderer is not None:
+        tile_render.renderer.promote(key.redis_key(), priority)
+    return await single_flight.flights.do(key.redis_key(), render, peek)
+
+
+def viewer_session(request: Request) -> str:
+    """Identify the viewer behind a tile request, by the session the viewer sends or else its address."""
+    session = request.headers.get("x-viewer-session")
+    if session:
+        return session
+    return request.client.host if request.client else "anonymous"
+
+
+def request_priority(request: Request) -> RenderPriority:
+    """Return the render class a tile request asks for with `X-Tile-Priority`, interactive by default.
+
+    Bulk and export clients should send `batch`, so they are shed before viewers under overload.
+    """
+    name = request.headers.get("x-tile-priority", "").upper()
+    return RenderPriority.__members__.get(name, RenderPriority.INTERACTIVE)
+
+
+async def prefetch_tile(
+    session: str, slide: ServedSlide, format: str, level_count: int, level: int, col: int, row: int
+) -> None:
+    """Render a tile into the tile cache ahead of its request, unless the tile store already has it."""
+    key = tile_key(slide.slide_id, level, col, row, format, level_count)
+    if stored_tile_path(key) is None:
+        await get_tile_bytes(slide, key, RenderPriority.PREFETCH, session)
+
+
+def schedule_prefetch(
+    session: str,
+    priority: RenderPriority,
+    slide: ServedSlide,
+    format: str,
+    geometry: slide_cache.SlideGeometry,
+    level: int,
+    col: int,
+    row: int,
+) -> None:
+    """Prefetch the neighbours and children of a served tile, if prefetching is enabled.
+
+    Only tiles a viewer is waiting for are followed up: bulk and export requests rank below prefetches, so
+    they must not start speculative work ahead of themselves.
+    """
+    if tile_prefetch.prefetcher is None or priority != RenderPriority.INTERACTIVE:
+        return
+
+    fetch = functools.partial(prefetch_tile, session, slide, format, geometry.level_count)
+    tile_prefetch.prefetcher.schedule(session, slide.slide_id, geometry, (level, col, row), fetch)
+
+
+def stored_tile_path(key: tile_cache.TileKey) -> Path | None:
+    """Return the path of a pre-rendered tile in the tile store, if it exists."""
+    if tile_store.store is None:
+        return None
+
+    path = tile_store.store.tile_path(key.slide_id, key.level, key.col, key.row, key.encoding)
+    return path if path.is_file() else None
+
+
+def stored_tile_response(key: tile_cache.TileKey, headers: dict[str, str]) -> Response | None:
+    """Serve a pre-rendered tile from the tile store, through nginx if X-Accel-Redirect is configured."""
+    path = stored_tile_path(key)
+    if path is None:
+        return None
+
+    headers = dict(headers)
+    if settings.TILE_STORE_ACCEL_PREFIX:
+        relative_path = tile_store.store.relative_tile_path(  # type: ignore
+            key.slide_id, key.level, key.col, key.row, key.encoding
+        )
+        headers["X-Accel-Redirect"] = f"{settings.TILE_STORE_ACCEL_PREFIX.rstrip('/')}/{relative_path}"
+        return Response(headers=headers, media_type=key.encoding.media_type)
+
+    return FileResponse(path, headers=headers, media_type=key.encoding.media_type)
+
+
+def tile_etag(slide_id: str, level: int, col: int, row: int, format: str) -> str:
+    """Return the strong ETag of a tile. It changes whenever the slide file or the quality settings change."""
+    return f'"{slide_id}-{level}-{col}-{row}-{format}-{TILE_ENCODING_VERSION}"'
+
+
+def dzi_etag(slide_id: str) -> str:
+    return f'"{slide_id}-dzi"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Check an `If-None-Match` header against an ETag, with the weak comparison RFC 9110 asks for."""
+    if not if_none_match:
+        return False
+
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def slide_cache_headers(request: Request, etag: str, slide_id: str, vary_accept: bool = False) -> dict[str, str]:
+    """Build the caching headers of a tile or DZI response.
+
+    Responses are cacheable for a year and marked `immutable` when the URL pins the slide identity with a
+    `v` query parameter, since a replaced slide then gets new URLs. Unpinned URLs keep the same address
+    across slide replacements, so they get the regular client cache lifetime and rely on ETag revalidation.
+    """
+    if request.query_params.get("v") == slide_id:
+        cache_control = f"public, max-age={settings.TILE_CLIENT_CACHE_MAX_AGE}, immutable"
+    else:
+        cache_control = f"public, max-age={settings.CLIENT_CACHE_MAX_AGE}"
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary_accept:
+        headers["Vary"] = "Accept"
+    return headers
+
+
+def not_modified_response(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+# Batch tile frames: level, col, row (int32), HTTP status (uint16) and payload length (uint32), big-endian,
+# followed by the payload (the encoded tile, or a UTF-8 error message).
+TILE_FRAME_HEADER = struct.Struct(">iiiHI")
+
+
+def encode_tile_frame(level: int, col: int, row: int, status: int, payload: bytes) -> bytes:
+    return TILE_FRAME_HEADER.pack(level, col, row, status, len(payload)) + payload
+
+
+async def render_tile_frame(
+    session: str, priority: RenderPriority, slide: ServedSlide, format: str, level: int, col: int, row: int
+) -> bytes:
+    """Fetch one tile of a batch and wrap it, or the reason it is missing, in a frame."""
+    try:
+        geometry = await get_slide_geometry(slide.source)
+        if not geometry.has_tile(level, col, row):
+            return encode_tile_frame(level, col, row, 404, b"Invalid tile coordinates")
+
+        key = tile_key(slide.slide_id, level, col, row, format, geometry.level_count)
+        stored_path = stored_tile_path(key)
+        if stored_path is not None:
+            content = stored_path.read_bytes()
+        else:
+            content = await get_tile_bytes(slide, key, priority, session)
+        schedule_prefetch(session, priority, slide, format, geometry, level, col, row)
+        return encode_tile_frame(level, col, row, 200, content)
+    except TileQueueFullError as e:
+        return encode_tile_frame(level, col, row, 503, e.message.encode())
+    except Exception as e:
+        logger.error(f"Error rendering batch tile {level}/{col}_{row} of {slide.path.name}: {e}")
+        return encode_tile_frame(level, col, row, 500, str(e).encode())
+
+
+async def stream_tile_frames(
+    session: str, priority: RenderPriority, slide_path: Path, tiles: list[tuple[int, int, int]], format: str
+) -> AsyncGenerator[bytes, None]:
+    """Yield tile frames in completion order, so fast tiles are not held back by slow ones."""
+    slide = served_slide(slide_path)
+    tasks = [
+        asyncio.ensure_future(render_tile_frame(session, priority, slide, format, *tile))
+        for tile in dict.fromkeys(tiles)
+    ]
+    try:
+        for next_frame in asyncio.as_completed(tasks):
+            yield await next_frame
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def unless_disconnected(request: Request, work: Awaitable[bytes]) -> bytes:
+    """Await tile work while the client is connected, cancelling it as soon as the client goes away.
+
+    Viewers abandon many tile requests while panning. Cancelling drops the work from the render queue
+    if it has not started yet, instead of rendering a tile nobody will read.
+
+    Raises
+    ------
+    ClientDisconnectedError
+        If the client went away before the work was done.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnectedError()
+    finally:
+        task.cancel()
+
+
+def client_disconnected_response() -> Response:
+    # Nginx's code for a request closed by the client; only access logs ever see it.
+    return Response(status_code=499)
+
+
+def tile_queue_full_response(error: TileQueueFullError) -> JSONResponse:
+    return JSONResponse(
+        content={"error": error.message}, status_code=503, headers={"Retry-After": str(error.retry_after)}
+    )
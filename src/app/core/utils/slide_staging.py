@@ -0,0 +1,190 @@
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any
+
+from ..logger import logging
+from .slide_cache import slide_identity
+
+logger = logging.getLogger(__name__)
+
+# Multi-file formats whose companion files cannot be found from the slide path alone, so they are not staged.
+UNSTAGED_SUFFIXES = {".vms"}
+
+PARTIAL_PREFIX = "."
+
+
+def slide_members(slide_path: Path) -> list[Path] | None:
+    """Return the files and folders making up a slide, or None if they cannot be told from its path.
+
+    A DICOM series or MRXS folder is its own folder, and an MRXS file comes with the folder of the same name
+    holding its data files.
+    """
+    if slide_path.is_dir():
+        return [slide_path]
+    if slide_path.suffix.lower() in UNSTAGED_SUFFIXES:
+        return None
+    if slide_path.suffix.lower() == ".mrxs":
+        companion = slide_path.with_suffix("")
+        return [slide_path, companion] if companion.is_dir() else [slide_path]
+    return [slide_path]
+
+
+def tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+
+
+class SlideStagingCache:
+    """Local copies of slides kept on network storage, named after the slide version they were copied from::
+
+        {root}/{slide_id}/{slide name}
+
+    Tile routes read a slide's copy once it is complete, as OpenSlide's many small reads are much faster from
+    a local disk. Copies are made under a temporary name and renamed when complete, and are evicted least
+    recently used first to keep them within `max_bytes`. The modification time of a copy's folder records
+    when it was last used, so the web processes reading copies and the worker making them share it.
+
+    Parameters
+    ----------
+    root: Path | str
+        Directory holding the copies, on the local disk.
+    max_bytes: int
+        Size budget of all copies.
+    touch_interval: float, optional
+        Seconds between updates of a copy's last use time. Defaults to 60.
+    min_idle: float, optional
+        Copies used within this many seconds are never evicted, as renders may still be reading them.
+        Defaults to 600.
+
+    Note
+    ----
+        - A slide that does not fit the budget once idle copies are evicted is not staged, and keeps being
+          read from network storage.
+    """
+
+    def __init__(self, root: Path | str, max_bytes: int, touch_interval: float = 60.0, min_idle: float = 600.0) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.min_idle = min_idle
+        self._touched: dict[str, float] = {}
+
+    def path(self, slide_id: str, slide_name: str) -> Path:
+        return self.root / slide_id / slide_name
+
+    def existing_path(self, slide_id: str, slide_name: str) -> Path | None:
+        """Return the complete copy of a slide version, if any, recording that it is in use."""
+        path = self.path(slide_id, slide_name)
+        if not path.exists():
+            return None
+
+        now = time.monotonic()
+        if now - self._touched.get(slide_id, 0.0) >= self.touch_interval:
+            self._touched[slide_id] = now
+            try:
+                os.utime(self.root / slide_id)
+            except OSError:
+                return None
+        return path
+
+    def entries(self) -> list[tuple[float, str, int]]:
+        """Return the last use time, slide version and size of every complete copy, least recently used first."""
+        if not self.root.is_dir():
+            return []
+
+        entries = []
+        for folder in self.root.iterdir():
+            if folder.name.startswith(PARTIAL_PREFIX) or not folder.is_dir():
+                continue
+            try:
+                entries.append((folder.stat().st_mtime, folder.name, tree_size(folder)))
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def stage(self, slide_path: Path, slide_id: str) -> dict[str, Any]:
+        """Copy a slide version to the local disk, evicting idle copies to make room. Blocking.
+
+        Returns
+        -------
+        dict[str, Any]
+            Summary of the copy, or why it was skipped.
+        """
+        if self.existing_path(slide_id, slide_path.name) is not None:
+            return {"skipped": "already staged"}
+
+        members = slide_members(slide_path)
+        if members is None:
+            return {"skipped": f"{slide_path.suffix} slides are not staged"}
+
+        size = sum(tree_size(member) for member in members)
+        evicted = self.make_room(size)
+        if evicted is None:
+            return {"skipped": "slide does not fit the staging budget", "bytes": size}
+
+        started = time.monotonic()
+        partial = self.root / f"{PARTIAL_PREFIX}{slide_id}.{os.getpid()}.partial"
+        shutil.rmtree(partial, ignore_errors=True)
+        partial.mkdir(parents=True)
+        try:
+            for member in members:
+                if member.is_dir():
+                    shutil.copytree(member, partial / member.name)
+                else:
+                    shutil.copy2(member, partial / member.name)
+
+            # A slide replaced while it was copied is a new version, which gets its own copy when viewed.
+            if slide_identity(slide_path) != slide_id:
+                return {"skipped": "slide changed while it was copied"}
+
+            try:
+                os.rename(partial, self.root / slide_id)
+            except OSError:
+                if self.existing_path(slide_id, slide_path.name) is None:
+                    raise
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+
+        elapsed = time.monotonic() - started
+        logger.info(f"Staged {slide_path.name} ({size / 1e6:.0f} MB) in {elapsed:.1f}s, evicted {len(evicted)}")
+        return {"bytes": size, "seconds": round(elapsed, 2), "evicted": evicted}
+
+    def make_room(self, size: int) -> list[str] | None:
+        """Evict idle copies, least recently used first, until `size` more bytes fit the budget.
+
+        Returns
+        -------
+        list[str] | None
+            The evicted slide versions, or None if the budget cannot be met, in which case nothing is evicted.
+        """
+        entries = self.entries()
+        used = sum(entry_size for _, _, entry_size in entries)
+        idle_before = time.time() - self.min_idle
+
+        evict = []
+        for last_used, slide_id, entry_size in entries:
+            if used + size <= self.max_bytes or last_used > idle_before:
+                break
+            evict.append(slide_id)
+            used -= entry_size
+        if used + size > self.max_bytes:
+            return None
+
+        for slide_id in evict:
+            shutil.rmtree(self.root / slide_id, ignore_errors=True)
+            self._touched.pop(slide_id, None)
+        return evict
+
+    def stats(self) -> dict[str, Any]:
+        entries = self.entries()
+        return {
+            "slides": len(entries),
+            "bytes": sum(entry_size for _, _, entry_size in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+store: SlideStagingCache | None = None
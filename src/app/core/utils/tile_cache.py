@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+from ..logger import logging
+from . import cache
+from .tile_encoding import TileEncoding
+
+logger = logging.getLogger(__name__)
+
+
+class TileKey(NamedTuple):
+    slide_id: str
+    level: int
+    col: int
+    row: int
+    encoding: TileEncoding
+
+    def redis_key(self) -> str:
+        return f"tile:{self.slide_id}:{self.level}:{self.col}_{self.row}:{self.encoding.label}"
+
+
+class TileCache:
+    """Size-aware LRU of encoded tile bytes with an optional Redis second tier.
+
+    Parameters
+    ----------
+    max_bytes: int
+        Memory budget for the in-process tier. Least recently used tiles are evicted to stay under it.
+    spill_to_redis: bool, optional
+        Whether to move tiles evicted from memory to the Redis cache pool from `core/utils/cache.py`, and
+        look them up there on local misses. Defaults to False.
+    redis_ttl: int, optional
+        Expiration in seconds of tiles stored in Redis. Defaults to 3600.
+
+    Note
+    ----
+        - Keys include the slide identity, which changes with the file's mtime, so modified slides never
+          serve stale tiles; their old entries simply age out.
+        - Hot tiles stay in memory and are only written to Redis once evicted, so a render costs no Redis
+          write unless the tile leaves the in-process tier. Tiles too large for it go to Redis directly.
+        - Redis errors are logged and treated as misses; the cache never fails a tile request.
+    """
+
+    def __init__(self, max_bytes: int, spill_to_redis: bool = False, redis_ttl: int = 3600) -> None:
+        self.max_bytes = max_bytes
+        self.spill_to_redis = spill_to_redis
+        self.redis_ttl = redis_ttl
+        self._entries: OrderedDict[TileKey, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.spilled = 0
+
+    async def get(self, key: TileKey) -> bytes | None:
+        """Return the cached tile from memory, falling back to Redis if spilling is enabled."""
+        data = self.get_local(key)
+        if data is not None:
+            return data
+
+        if self.spill_to_redis and cache.client is not None:
+            try:
+                data = await cache.client.get(key.redis_key())
+            except Exception as e:
+                logger.warning(f"Redis tile cache lookup failed: {e}")
+                data = None
+
+            if data is not None:
+                with self._lock:
+                    self.redis_hits += 1
+                    self.misses -= 1
+                await self._spill(self.put_local(key, data))
+                return data
+
+        return None
+
+    async def put(self, key: TileKey, data: bytes, shared: bool = False) -> None:
+        """Store a tile in memory, spilling the tiles it evicts to Redis if spilling is enabled.
+
+        Parameters
+        ----------
+        key: TileKey
+            The tile.
+        data: bytes
+            The encoded tile.
+        shared: bool, optional
+            Whether to also write the tile to Redis right away, for other processes waiting on it.
+            Defaults to False.
+        """
+        spilled = self.put_local(key, data)
+        if shared and all(spilled_key != key for spilled_key, _ in spilled):
+            spilled.append((key, data))
+        await self._spill(spilled)
+
+    async def _spill(self, entries: list[tuple[TileKey, bytes]]) -> None:
+        if not entries or not self.spill_to_redis or cache.client is None:
+            return
+
+        try:
+            async with cache.client.pipeline(transaction=False) as pipe:
+                for key, data in entries:
+                    pipe.set(key.redis_key(), data, ex=self.redis_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Redis tile cache store failed: {e}")
+            return
+
+        with self._lock:
+            self.spilled += len(entries)
+
+    def get_local(self, key: TileKey) -> bytes | None:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def peek_local(self, key: TileKey) -> bytes | None:
+        """Return a cached tile without counting a lookup or refreshing its recency."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put_local(self, key: TileKey, data: bytes) -> list[tuple[TileKey, bytes]]:
+        """Store a tile in memory, returning the tiles that did not fit, least recently used first."""
+        # A single tile larger than a quarter of the budget would flush most of the cache; skip it.
+        if len(data) > self.max_bytes // 4:
+            return [(key, data)]
+
+        evicted_entries = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous)
+
+            self._entries[key] = data
+            self.size_bytes += len(data)
+
+            while self.size_bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                evicted_entries.append((evicted_key, evicted))
+                self.size_bytes -= len(evicted)
+                self.evictions += 1
+                self.evicted_bytes += len(evicted)
+
+        return evicted_entries
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Return hit ratio, eviction and memory usage counters."""
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "spilled": self.spilled,
+                "spill_to_redis": self.spill_to_redis,
+            }
+
+
+tiles: TileCache | None = None
@@ -0,0 +1,116 @@
+import hashlib
+from io import BytesIO
+from typing import NamedTuple
+
+from PIL import Image
+
+DEFAULT_TILE_FORMAT = "jpeg"
+DEFAULT_TILE_QUALITY = 75
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+FORMAT_ALIASES = {"jpg": "jpeg", "jpeg": "jpeg", "webp": "webp", "png": "png"}
+
+
+class TileEncoding(NamedTuple):
+    format: str
+    quality: int
+    subsampling: int = -1  # JPEG chroma subsampling: 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0, -1 = encoder default
+
+    @property
+    def label(self) -> str:
+        if self.format == "png":
+            return "png"
+        if self.format == "webp":
+            return f"webp-q{self.quality}"
+        return f"jpeg-q{self.quality}" + (f"-s{self.subsampling}" if self.subsampling >= 0 else "")
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+
+class QualityProfile(NamedTuple):
+    min_depth: int
+    quality: int
+    subsampling: int = -1
+
+
+def parse_quality_profiles(spec: str) -> list[QualityProfile]:
+    """Parse a `TILE_QUALITY_PROFILES` setting.
+
+    The setting is a comma-separated list of `depth:quality[:subsampling]` entries, where depth counts
+    DeepZoom levels below full resolution (0 is full resolution). Each entry applies from its depth down
+    to the next entry, so `"0:85:0,3:70,6:55"` encodes the three most detailed levels at quality 85 with
+    4:4:4 chroma, the next three at 70 and everything more zoomed out at 55.
+
+    Parameters
+    ----------
+    spec: str
+        The setting value. An empty string means a single default profile.
+
+    Returns
+    -------
+    list[QualityProfile]
+        Profiles sorted by increasing depth.
+    """
+    profiles = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        fields = [int(field) for field in entry.split(":")]
+        if not 2 <= len(fields) <= 3:
+            raise ValueError(f"Invalid tile quality profile: {entry!r}")
+        profiles.append(QualityProfile(*fields))
+
+    return sorted(profiles)
+
+
+def select_encoding(
+    format: str, level: int, level_count: int, profiles: list[QualityProfile], default_quality: int
+) -> TileEncoding:
+    """Pick the encoding of a tile from its format and the quality profile covering its level."""
+    if format == "png":
+        return TileEncoding("png", 0)
+
+    depth = level_count - 1 - level
+    profile = QualityProfile(0, default_quality)
+    for candidate in profiles:
+        if candidate.min_depth <= depth:
+            profile = candidate
+
+    subsampling = profile.subsampling if format == "jpeg" else -1
+    return TileEncoding(format, profile.quality, subsampling)
+
+
+def profiles_fingerprint(profiles: list[QualityProfile], default_quality: int) -> str:
+    """Return a short digest of the quality settings, which together with the level count of a slide
+    determine the encoding of every tile."""
+    return hashlib.sha1(repr((default_quality, sorted(profiles))).encode()).hexdigest()[:8]
+
+
+def negotiate_format(extension: str, accept: str | None, negotiate: bool = True) -> str | None:
+    """Choose the tile format from the URL extension and the `Accept` header.
+
+    Explicit `.png`/`.webp` URLs are honoured as is. The default `.jpeg` URL used by DeepZoom viewers is
+    upgraded to WebP when negotiation is enabled and the client advertises `image/webp`.
+
+    Returns
+    -------
+    str | None
+        The format, or None for an unsupported extension.
+    """
+    format = FORMAT_ALIASES.get(extension.lower())
+    if format == "jpeg" and negotiate and accept and "image/webp" in accept:
+        return "webp"
+
+    return format
+
+
+def encode_tile(image: Image.Image, encoding: TileEncoding) -> bytes:
+    buffer = BytesIO()
+    if encoding.format == "jpeg":
+        image.save(buffer, format="JPEG", quality=encoding.quality, subsampling=encoding.subsampling)
+    elif encoding.format == "webp":
+        image.save(buffer, format="WEBP", quality=encoding.quality)
+    else:
+        image.save(buffer, format="PNG")
+
+    return buffer.getvalue()
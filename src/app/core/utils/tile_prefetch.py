@@ -0,0 +1,225 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from ..logger import logging
+from .slide_cache import SlideGeometry
+
+logger = logging.getLogger(__name__)
+
+# A tile address: DeepZoom level, column and row.
+TileAddress = tuple[int, int, int]
+
+# Requests remembered per session, enough for a full screen of tiles.
+MAX_VIEWPORT_REQUESTS = 128
+
+
+def prefetch_candidates(geometry: SlideGeometry, level: int, col: int, row: int) -> list[TileAddress]:
+    """Return the tiles worth fetching after a tile: its ring of neighbours, then its children one level down."""
+    ring = [(level, col + dx, row + dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+    children = [(level + 1, 2 * col + dx, 2 * row + dy) for dy in (0, 1) for dx in (0, 1)]
+    return [address for address in ring + children if geometry.has_tile(*address)]
+
+
+def is_near(target: TileAddress, request: TileAddress) -> bool:
+    """Whether a tile is within one tile, at its own level, of a requested tile one level up, down or alike."""
+    target_level, target_col, target_row = target
+    level, col, row = request
+    shift = target_level - level
+    if abs(shift) > 1:
+        return False
+
+    if shift >= 0:
+        cols, rows = (col << shift, ((col + 1) << shift) - 1), (row << shift, ((row + 1) << shift) - 1)
+    else:
+        cols, rows = (col >> -shift,) * 2, (row >> -shift,) * 2
+    return cols[0] - 1 <= target_col <= cols[1] + 1 and rows[0] - 1 <= target_row <= rows[1] + 1
+
+
+@dataclass
+class _Session:
+    slide_key: str = ""
+    requests: deque[tuple[float, TileAddress]] = field(default_factory=lambda: deque(maxlen=MAX_VIEWPORT_REQUESTS))
+    tasks: dict[TileAddress, asyncio.Task] = field(default_factory=dict)
+    window_started: float = 0.0
+    spent: int = 0
+
+
+class TilePrefetcher:
+    """Speculatively fetch the tiles a viewer is likely to ask for next, at low priority.
+
+    After a tile is served, its ring of neighbours and its children at the next level are fetched into the
+    tile cache in the background. Each viewer session has a budget of prefetched tiles per time window, and
+    its pending prefetches are cancelled as soon as they are no longer near the tiles it recently asked for,
+    that is when the viewport moved elsewhere or to another slide.
+
+    Parameters
+    ----------
+    budget: int, optional
+        Tiles a session may prefetch per window. Defaults to 64.
+    window: float, optional
+        Length of the budget window in seconds. Defaults to 10.
+    max_concurrent: int, optional
+        Prefetches running at once across all sessions. Defaults to 2.
+    max_sessions: int, optional
+        Sessions tracked at once; the least recently active ones are dropped first. Defaults to 1024.
+    viewport_seconds: float, optional
+        The tiles a session asked for within this many seconds make up its viewport. Defaults to 1.
+    busy: Callable[[], bool] | None, optional
+        Reports whether requested tiles are waiting to render, in which case prefetches are skipped.
+
+    Note
+    ----
+        - Prefetches wait for a free slot, so they never pile up in front of the renderer. Waiting ones are
+          the ones cancelled when the viewport moves.
+        - Bookkeeping happens on the event loop, so it needs no locking.
+    """
+
+    def __init__(
+        self,
+        budget: int = 64,
+        window: float = 10.0,
+        max_concurrent: int = 2,
+        max_sessions: int = 1024,
+        viewport_seconds: float = 1.0,
+        busy: Callable[[], bool] | None = None,
+    ) -> None:
+        self.budget = budget
+        self.window = window
+        self.max_concurrent = max_concurrent
+        self.max_sessions = max_sessions
+        self.viewport_seconds = viewport_seconds
+        self.busy = busy
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.scheduled = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.skipped = 0
+        self.failed = 0
+        self.over_budget = 0
+
+    def schedule(
+        self,
+        session_id: str,
+        slide_key: str,
+        geometry: SlideGeometry,
+        address: TileAddress,
+        fetch: Callable[[int, int, int], Awaitable[Any]],
+    ) -> int:
+        """Record a served tile and prefetch around it.
+
+        Parameters
+        ----------
+        session_id: str
+            Identifies the viewer.
+        slide_key: str
+            Identifies the slide version the tile belongs to.
+        geometry: SlideGeometry
+            DeepZoom geometry of the slide, to keep prefetches within its levels.
+        address: TileAddress
+            The served tile.
+        fetch: Callable[[int, int, int], Awaitable[Any]]
+            Fetches a tile of the slide into the tile cache.
+
+        Returns
+        -------
+        int
+            Number of prefetches started.
+        """
+        now = time.monotonic()
+        session = self._session(session_id)
+        if session.slide_key != slide_key:
+            self._cancel(session, list(session.tasks))
+            session.requests.clear()
+            session.slide_key = slide_key
+
+        session.requests.append((now, address))
+        while session.requests[0][0] < now - self.viewport_seconds:
+            session.requests.popleft()
+        viewport = [request for _, request in session.requests]
+
+        self._cancel(
+            session, [target for target in session.tasks if not any(is_near(target, seen) for seen in viewport)]
+        )
+
+        if now - session.window_started >= self.window:
+            session.window_started, session.spent = now, 0
+
+        started = 0
+        requested = set(viewport)
+        for target in prefetch_candidates(geometry, *address):
+            if target in session.tasks or target in requested:
+                continue
+            if session.spent >= self.budget:
+                self.over_budget += 1
+                break
+
+            session.spent += 1
+            session.tasks[target] = asyncio.ensure_future(self._prefetch(session, target, fetch))
+            started += 1
+
+        self.scheduled += started
+        return started
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "pending": sum(len(session.tasks) for session in self._sessions.values()),
+            "budget": self.budget,
+            "window": self.window,
+            "max_concurrent": self.max_concurrent,
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "over_budget": self.over_budget,
+        }
+
+    def cancel_all(self) -> None:
+        for session in self._sessions.values():
+            self._cancel(session, list(session.tasks))
+        self._sessions.clear()
+
+    def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            return session
+
+        self._sessions[session_id] = session = _Session()
+        while len(self._sessions) > self.max_sessions:
+            _, dropped = self._sessions.popitem(last=False)
+            self._cancel(dropped, list(dropped.tasks))
+        return session
+
+    def _cancel(self, session: _Session, targets: list[TileAddress]) -> None:
+        for target in targets:
+            session.tasks.pop(target).cancel()
+            self.cancelled += 1
+
+    async def _prefetch(
+        self, session: _Session, target: TileAddress, fetch: Callable[[int, int, int], Awaitable[Any]]
+    ) -> None:
+        try:
+            async with self._slots:
+                if self.busy is not None and self.busy():
+                    self.skipped += 1
+                    return
+                await fetch(*target)
+                self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.debug(f"Prefetch of tile {target} failed: {e}")
+        finally:
+            if session.tasks.get(target) is asyncio.current_task():
+                del session.tasks[target]
+
+
+prefetcher: TilePrefetcher | None = None
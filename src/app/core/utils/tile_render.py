@@ -0,0 +1,365 @@
+import asyncio
+import functools
+import math
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, TypeVar
+
+from ..exceptions.tile_exceptions import TileQueueFullError
+from ..logger import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class RenderPriority(IntEnum):
+    """Classes of render work, most urgent first."""
+
+    INTERACTIVE = 0
+    PREFETCH = 1
+    BATCH = 2
+
+
+# Share of the queue depth a class may fill before its new work is shed, so the lowest classes go first.
+ADMISSION_SHARES = {RenderPriority.INTERACTIVE: 1.0, RenderPriority.PREFETCH: 0.75, RenderPriority.BATCH: 0.5}
+
+# Upper bounds, in seconds, of the wait time histogram buckets.
+WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass(eq=False)
+class _Waiter:
+    slide_key: str
+    user: str
+    priority: RenderPriority
+    work_key: str | None
+    future: asyncio.Future
+    enqueued: float
+
+
+@dataclass
+class _ClassStats:
+    admitted: int = 0
+    completed: int = 0
+    rejected: int = 0
+    promoted: int = 0
+    cancelled: int = 0
+    abandoned: int = 0
+    wait_seconds: float = 0.0
+    waits: int = 0
+    wait_buckets: list[int] = field(default_factory=lambda: [0] * len(WAIT_BUCKETS))
+
+    def observe_wait(self, seconds: float) -> None:
+        self.wait_seconds += seconds
+        self.waits += 1
+        for index, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.wait_buckets[index] += 1
+
+
+class TileRenderer:
+    """Run blocking tile work on a dedicated executor, scheduled by priority class and fairly across users.
+
+    OpenSlide reads and Pillow encodes release the GIL, so a thread pool keeps them off the event loop
+    without the cost of shipping pixels between processes. The pool is separate from the anyio
+    threadpool used by Starlette for sync endpoints, so tile load cannot starve the API.
+
+    Work only reaches the pool when a render thread is free. Until then it waits in a queue per priority
+    class, where users take turns, so an interactive viewport is served before prefetches and bulk
+    clients, and a user pulling thousands of tiles does not hold back other users of the same class.
+
+    Parameters
+    ----------
+    max_workers: int
+        Number of render threads.
+    per_slide_limit: int
+        Maximum number of concurrent renders for a single slide.
+    max_queue_depth: int
+        Maximum number of renders admitted (running or waiting) before new work is rejected. Lower classes
+        are rejected earlier, at their share of it in `ADMISSION_SHARES`.
+
+    Note
+    ----
+        - Admission and scheduling happen on the event loop, so they need no locking.
+        - Rejected work raises `TileQueueFullError`, with a `retry_after` estimated from the work ahead of
+          its class, which the routes turn into a 503 with `Retry-After`.
+        - Waiting work whose caller is cancelled, for instance because the client disconnected, is dropped
+          from its queue. Work already on a render thread cannot be interrupted: it is handed back only when
+          done, even if the caller went away, and counted as abandoned.
+    """
+
+    def __init__(self, max_workers: int, per_slide_limit: int, max_queue_depth: int) -> None:
+        self.max_workers = max_workers
+        self.per_slide_limit = per_slide_limit
+        self.max_queue_depth = max_queue_depth
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tile-render")
+        self._queues: dict[RenderPriority, OrderedDict[str, deque[_Waiter]]] = {
+            priority: OrderedDict() for priority in RenderPriority
+        }
+        self._by_key: dict[str, _Waiter] = {}
+        self._free_slots = max_workers
+        self._running_slides: dict[str, int] = {}
+        self._slides: dict[str, int] = {}
+        self._classes = {priority: _ClassStats() for priority in RenderPriority}
+        self._render_seconds = 0.05
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(
+        self,
+        slide_key: str,
+        func: Callable[..., T],
+        *args: Any,
+        priority: RenderPriority = RenderPriority.INTERACTIVE,
+        user: str = "",
+        work_key: str | None = None,
+    ) -> T:
+        """Run `func(*args)` on the render executor once it is this work's turn.
+
+        Parameters
+        ----------
+        slide_key: str
+            Identifies the slide the work belongs to, for the per-slide limit.
+        func: Callable
+            The blocking callable to run.
+        priority: RenderPriority, optional
+            Class of the work. Defaults to interactive.
+        user: str, optional
+            Identifies who the work is for, to take turns with other users of the same class.
+        work_key: str | None, optional
+            Identifies the work, so `promote` can move it up a class while it waits.
+
+        Returns
+        -------
+        T
+            Whatever `func` returns.
+
+        Raises
+        ------
+        TileQueueFullError
+            If the queue depth limit of the class is reached.
+        """
+        stats = self._classes[priority]
+        if self.pending >= self.max_queue_depth * ADMISSION_SHARES[priority]:
+            stats.rejected += 1
+            self.rejected += 1
+            raise TileQueueFullError(retry_after=self.retry_after(priority))
+
+        stats.admitted += 1
+        self.pending += 1
+        self._slides[slide_key] = self._slides.get(slide_key, 0) + 1
+        try:
+            granted = await self._wait_for_slot(slide_key, user, priority, work_key)
+            return await self._execute(slide_key, granted, func, *args)
+        finally:
+            self._exit_slide(slide_key)
+            self.pending -= 1
+
+    def promote(self, work_key: str, priority: RenderPriority) -> bool:
+        """Move waiting work to a more urgent class, when a more urgent caller is waiting for its result."""
+        waiter = self._by_key.get(work_key)
+        if waiter is None or waiter.priority <= priority:
+            return False
+
+        self._dequeue(waiter)
+        waiter.priority = priority
+        self._enqueue(waiter)
+        self._classes[priority].promoted += 1
+        return True
+
+    def retry_after(self, priority: RenderPriority) -> int:
+        """Estimate in seconds when work of a class could be admitted again, from the work ahead of it."""
+        ahead = self.running + sum(self.queued(other) for other in RenderPriority if other <= priority)
+        return max(1, math.ceil(ahead * self._render_seconds / self.max_workers))
+
+    def queued(self, priority: RenderPriority) -> int:
+        return sum(len(waiters) for waiters in self._queues[priority].values())
+
+    def stats(self) -> dict[str, Any]:
+        """Return current queue depth and render counters, overall and per priority class."""
+        return {
+            "max_workers": self.max_workers,
+            "per_slide_limit": self.per_slide_limit,
+            "max_queue_depth": self.max_queue_depth,
+            "pending": self.pending,
+            "running": self.running,
+            "active_slides": len(self._slides),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "mean_render_ms": round(1000 * self._render_seconds, 2),
+            "classes": {
+                priority.name.lower(): {
+                    "queued": self.queued(priority),
+                    "admitted": stats.admitted,
+                    "completed": stats.completed,
+                    "rejected": stats.rejected,
+                    "promoted": stats.promoted,
+                    "cancelled": stats.cancelled,
+                    "abandoned": stats.abandoned,
+                    "mean_wait_ms": round(1000 * stats.wait_seconds / stats.waits, 2) if stats.waits else 0.0,
+                }
+                for priority, stats in self._classes.items()
+            },
+        }
+
+    def metrics(self) -> str:
+        """Return queue depth, admission and wait time counters per class in the Prometheus text format."""
+        lines = [
+            "# HELP tile_render_queue_depth Renders waiting for a render thread.",
+            "# TYPE tile_render_queue_depth gauge",
+            *(f'tile_render_queue_depth{{class="{p.name.lower()}"}} {self.queued(p)}' for p in RenderPriority),
+            "# HELP tile_render_running Renders running on a render thread.",
+            "# TYPE tile_render_running gauge",
+            f"tile_render_running {self.running}",
+        ]
+        for name, attribute, description in (
+            ("admitted", "admitted", "Renders admitted to the queue."),
+            ("completed", "completed", "Renders completed."),
+            ("rejected", "rejected", "Renders shed with a 503 because the queue was full for their class."),
+            ("promoted", "promoted", "Waiting renders moved up to this class."),
+            ("cancelled", "cancelled", "Waiting renders dropped because their caller went away."),
+            ("abandoned", "abandoned", "Running renders whose caller went away before they finished."),
+        ):
+            lines.append(f"# HELP tile_render_{name}_total {description}")
+            lines.append(f"# TYPE tile_render_{name}_total counter")
+            lines.extend(
+                f'tile_render_{name}_total{{class="{p.name.lower()}"}} {getattr(self._classes[p], attribute)}'
+                for p in RenderPriority
+            )
+
+        lines.append("# HELP tile_render_wait_seconds Time from admission to a render thread.")
+        lines.append("# TYPE tile_render_wait_seconds histogram")
+        for priority, stats in self._classes.items():
+            label = f'class="{priority.name.lower()}"'
+            for bound, count in zip(WAIT_BUCKETS, stats.wait_buckets):
+                lines.append(f'tile_render_wait_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'tile_render_wait_seconds_bucket{{{label},le="+Inf"}} {stats.waits}')
+            lines.append(f"tile_render_wait_seconds_sum{{{label}}} {stats.wait_seconds:.6f}")
+            lines.append(f"tile_render_wait_seconds_count{{{label}}} {stats.waits}")
+
+        return "\n".join(lines) + "\n"
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _wait_for_slot(
+        self, slide_key: str, user: str, priority: RenderPriority, work_key: str | None
+    ) -> RenderPriority:
+        """Wait for a render thread and return the class the work was granted it in."""
+        if self._free_slots > 0 and self._has_capacity(slide_key):
+            self._take_slot(slide_key)
+            self._classes[priority].observe_wait(0.0)
+            return priority
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(slide_key, user, priority, work_key, loop.create_future(), time.monotonic())
+        self._enqueue(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.cancelled():
+                self._dequeue(waiter)
+                self._classes[waiter.priority].cancelled += 1
+            else:
+                # The thread was handed over just as the caller went away, so pass it on.
+                self._release_slot(slide_key)
+            raise
+        return waiter.priority
+
+    async def _execute(self, slide_key: str, priority: RenderPriority, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self.executor, functools.partial(func, *args))
+        except BaseException:
+            self._release_slot(slide_key)
+            raise
+
+        self.running += 1
+        started = time.monotonic()
+        future.add_done_callback(lambda done: self._finish(slide_key, priority, started, done))
+        # Shielded, so a caller that goes away does not hand the thread back while it still works.
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.done():
+                self._classes[priority].abandoned += 1
+            raise
+
+    def _finish(self, slide_key: str, priority: RenderPriority, started: float, future: asyncio.Future) -> None:
+        if not future.cancelled():
+            future.exception()  # Retrieved, so work whose caller went away does not log an unretrieved error.
+        self.running -= 1
+        self.completed += 1
+        self._classes[priority].completed += 1
+        self._render_seconds = 0.9 * self._render_seconds + 0.1 * (time.monotonic() - started)
+        self._release_slot(slide_key)
+
+    def _has_capacity(self, slide_key: str) -> bool:
+        return self._running_slides.get(slide_key, 0) < self.per_slide_limit
+
+    def _take_slot(self, slide_key: str) -> None:
+        self._free_slots -= 1
+        self._running_slides[slide_key] = self._running_slides.get(slide_key, 0) + 1
+
+    def _release_slot(self, slide_key: str) -> None:
+        self._free_slots += 1
+        running = self._running_slides[slide_key] - 1
+        if running:
+            self._running_slides[slide_key] = running
+        else:
+            del self._running_slides[slide_key]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free render threads to waiting work: most urgent class first, users taking turns within it."""
+        now = time.monotonic()
+        while self._free_slots > 0:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+
+            self._dequeue(waiter)
+            users = self._queues[waiter.priority]
+            if waiter.user in users:
+                users.move_to_end(waiter.user)
+            self._take_slot(waiter.slide_key)
+            self._classes[waiter.priority].observe_wait(now - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> _Waiter | None:
+        for priority in RenderPriority:
+            for waiters in self._queues[priority].values():
+                for waiter in waiters:
+                    if self._has_capacity(waiter.slide_key):
+                        return waiter
+        return None
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        self._queues[waiter.priority].setdefault(waiter.user, deque()).append(waiter)
+        if waiter.work_key is not None:
+            self._by_key[waiter.work_key] = waiter
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        users = self._queues[waiter.priority]
+        users[waiter.user].remove(waiter)
+        if not users[waiter.user]:
+            del users[waiter.user]
+        if waiter.work_key is not None and self._by_key.get(waiter.work_key) is waiter:
+            del self._by_key[waiter.work_key]
+
+    def _exit_slide(self, slide_key: str) -> None:
+        users = self._slides[slide_key]
+        if users == 1:
+            del self._slides[slide_key]
+        else:
+            self._slides[slide_key] = users - 1
+
+
+renderer: TileRenderer | None = None
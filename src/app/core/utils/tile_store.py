@@ -0,0 +1,115 @@
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import openslide
+from openslide.deepzoom import DeepZoomGenerator
+
+from ..logger import logging
+from .tile_encoding import TileEncoding, encode_tile
+
+logger = logging.getLogger(__name__)
+
+COMPLETE_MARKER = "complete-{format}"
+MANIFEST_FILE = "manifest.json"
+DZI_FILE = "slide.dzi"
+
+
+class TileStore:
+    """Disk layout of pre-rendered DeepZoom pyramids.
+
+    Each slide gets a directory named after its slide identity, so a modified slide never serves tiles
+    rendered from its previous contents::
+
+        {root}/{slide_id}/slide.dzi
+        {root}/{slide_id}/manifest.json
+        {root}/{slide_id}/{encoding}/{level}/{col}_{row}.{format}
+        {root}/{slide_id}/complete-{format}
+
+    The encoding label (format, quality and subsampling) is part of the path, so tiles rendered under a
+    previous quality profile are never served for the current one.
+
+    Parameters
+    ----------
+    root: Path | str
+        Directory holding the pyramids.
+    """
+
+    def __init__(self, root: Path | str) -> None:
+        self.root = Path(root)
+
+    def slide_dir(self, slide_id: str) -> Path:
+        return self.root / slide_id
+
+    def relative_tile_path(self, slide_id: str, level: int, col: int, row: int, encoding: TileEncoding) -> str:
+        return f"{slide_id}/{encoding.label}/{level}/{col}_{row}.{encoding.format}"
+
+    def tile_path(self, slide_id: str, level: int, col: int, row: int, encoding: TileEncoding) -> Path:
+        return self.root / self.relative_tile_path(slide_id, level, col, row, encoding)
+
+    def dzi_path(self, slide_id: str) -> Path:
+        return self.slide_dir(slide_id) / DZI_FILE
+
+    def is_complete(self, slide_id: str, format: str) -> bool:
+        return (self.slide_dir(slide_id) / COMPLETE_MARKER.format(format=format)).exists()
+
+    def mark_complete(self, slide_id: str, format: str) -> None:
+        write_atomic(self.slide_dir(slide_id) / COMPLETE_MARKER.format(format=format), b"")
+
+    def read_manifest(self, slide_id: str) -> dict[str, Any] | None:
+        try:
+            return json.loads((self.slide_dir(slide_id) / MANIFEST_FILE).read_text())
+        except FileNotFoundError:
+            return None
+
+    def write_manifest(self, slide_id: str, manifest: dict[str, Any]) -> None:
+        write_atomic(self.slide_dir(slide_id) / MANIFEST_FILE, json.dumps(manifest).encode())
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write a file so readers never observe it half-written, even if the writer is killed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def render_pyramid_chunk(
+    slide_path: str,
+    store_root: str,
+    slide_id: str,
+    level: int,
+    addresses: list[tuple[int, int]],
+    tile_size: int,
+    overlap: int,
+    limit_bounds: bool,
+    encoding: TileEncoding,
+) -> int:
+    """Render a batch of tiles of one level to the tile store, skipping tiles that already exist.
+
+    Runs in a worker process, so it opens its own slide handle. Skipping existing tiles is what makes an
+    interrupted pyramid job resumable.
+
+    Returns
+    -------
+    int
+        The number of tiles handled, rendered or skipped.
+    """
+    store = TileStore(store_root)
+    slide = openslide.OpenSlide(slide_path)
+    try:
+        dzi_gen = DeepZoomGenerator(slide, tile_size=tile_size, overlap=overlap, limit_bounds=limit_bounds)
+        for col, row in addresses:
+            path = store.tile_path(slide_id, level, col, row, encoding)
+            if path.exists():
+                continue
+
+            write_atomic(path, encode_tile(dzi_gen.get_tile(level, (col, row)), encoding))
+    finally:
+        slide.close()
+
+    return len(addresses)
+
+
+store: TileStore | None = None
@@ -0,0 +1,283 @@
+import json
+import math
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import openslide
+from openslide.deepzoom import DeepZoomGenerator
+from PIL import Image
+
+from ..logger import logging
+from .dicom_wsi import DicomSeriesIndex, DicomSlide, is_dicom_series
+from .level_synthesis import LevelSynthesisStore
+from .slide_cache import deepzoom_options
+from .tile_encoding import TileEncoding, encode_tile
+from .tile_store import write_atomic
+
+logger = logging.getLogger(__name__)
+
+MASK_FILE = "mask.png"
+MANIFEST_FILE = "mask.json"
+
+# Glass is bright and grey: a pixel is background when it is close to the brightest pixels of the slide
+# and its channels differ by little. Anything darker or more colorful is kept as tissue.
+MIN_BACKGROUND_LUMINANCE = 200
+BACKGROUND_LUMINANCE_MARGIN = 20
+MAX_BACKGROUND_SATURATION = 18
+
+# Reads a DeepZoom tile (level, (col, row)) of the slide.
+TileReader = Callable[[int, tuple[int, int]], Image.Image]
+
+
+class TissueMask:
+    """Low-resolution tissue mask of a slide, answering whether a DeepZoom tile is all background.
+
+    Parameters
+    ----------
+    mask: np.ndarray
+        Boolean array, True on tissue, covering the whole DeepZoom image.
+    level_dimensions: list[tuple[int, int]]
+        Size of each DeepZoom level of the slide.
+    tile_size: int
+        DeepZoom tile size.
+    overlap: int
+        DeepZoom tile overlap.
+    background: tuple[int, int, int]
+        Colour of the glass, used for blank tiles.
+    """
+
+    def __init__(
+        self,
+        mask: np.ndarray,
+        level_dimensions: list[tuple[int, int]],
+        tile_size: int,
+        overlap: int,
+        background: tuple[int, int, int],
+    ) -> None:
+        self.height, self.width = mask.shape
+        self.level_dimensions = level_dimensions
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.background = background
+        # Summed-area table, so the tissue pixels under any tile are counted in constant time.
+        self._counts = np.pad(mask.astype(np.int32).cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+
+    def tile_size_at(self, level: int, col: int, row: int) -> tuple[int, int]:
+        left, top, right, bottom = self._tile_bounds(level, col, row)
+        return right - left, bottom - top
+
+    def is_background(self, level: int, col: int, row: int) -> bool:
+        if not 0 <= level < len(self.level_dimensions):
+            return False
+
+        level_width, level_height = self.level_dimensions[level]
+        left, top, right, bottom = self._tile_bounds(level, col, row)
+        if left >= right or top >= bottom:
+            return False
+
+        scale_x, scale_y = self.width / level_width, self.height / level_height
+        x0, y0 = min(self.width - 1, math.floor(left * scale_x)), min(self.height - 1, math.floor(top * scale_y))
+        x1 = min(self.width, max(x0 + 1, math.ceil(right * scale_x)))
+        y1 = min(self.height, max(y0 + 1, math.ceil(bottom * scale_y)))
+        counts = self._counts
+        return counts[y1, x1] - counts[y0, x1] - counts[y1, x0] + counts[y0, x0] == 0
+
+    def _tile_bounds(self, level: int, col: int, row: int) -> tuple[int, int, int, int]:
+        level_width, level_height = self.level_dimensions[level]
+        left = col * self.tile_size - (self.overlap if col > 0 else 0)
+        top = row * self.tile_size - (self.overlap if row > 0 else 0)
+        right = min(level_width, (col + 1) * self.tile_size + self.overlap)
+        bottom = min(level_height, (row + 1) * self.tile_size + self.overlap)
+        return left, top, right, bottom
+
+
+class TissueMaskStore:
+    """Disk store of slide tissue masks, with the masks in use kept loaded::
+
+        {root}/{slide_id}/mask.png
+        {root}/{slide_id}/mask.json
+
+    The manifest holds the DeepZoom geometry the mask was computed for, the glass color and the tissue
+    fraction, and is written last.
+
+    Parameters
+    ----------
+    root: Path | str
+        Directory holding the masks.
+    max_loaded: int, optional
+        Number of masks kept in memory. Defaults to 256.
+    """
+
+    def __init__(self, root: Path | str, max_loaded: int = 256) -> None:
+        self.root = Path(root)
+        self.max_loaded = max_loaded
+        self._masks: OrderedDict[str, TissueMask] = OrderedDict()
+        self._lock = threading.Lock()
+        self.background_tiles = 0
+
+    def read_manifest(self, slide_id: str) -> dict[str, Any] | None:
+        try:
+            return json.loads((self.root / slide_id / MANIFEST_FILE).read_text())
+        except FileNotFoundError:
+            return None
+
+    def write(self, slide_id: str, mask: np.ndarray, manifest: dict[str, Any]) -> None:
+        buffer = BytesIO()
+        Image.fromarray(mask).save(buffer, format="PNG")
+        write_atomic(self.root / slide_id / MASK_FILE, buffer.getvalue())
+        write_atomic(self.root / slide_id / MANIFEST_FILE, json.dumps(manifest).encode())
+
+    def get(self, slide_id: str) -> TissueMask | None:
+        """Return the tissue mask of a slide version, or None if it was not computed yet. Blocking on a miss."""
+        with self._lock:
+            mask = self._masks.get(slide_id)
+            if mask is not None:
+                self._masks.move_to_end(slide_id)
+                return mask
+
+        manifest = self.read_manifest(slide_id)
+        if manifest is None:
+            return None
+
+        with Image.open(self.root / slide_id / MASK_FILE) as image:
+            pixels = np.asarray(image) > 0
+        mask = TissueMask(
+            pixels,
+            [tuple(size) for size in manifest["level_dimensions"]],  # type: ignore
+            manifest["tile_size"],
+            manifest["overlap"],
+            tuple(manifest["background"]),  # type: ignore
+        )
+        with self._lock:
+            self._masks[slide_id] = mask
+            while len(self._masks) > self.max_loaded:
+                self._masks.popitem(last=False)
+        return mask
+
+    def cached(self, slide_id: str) -> TissueMask | None:
+        with self._lock:
+            return self._masks.get(slide_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._masks.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": len(self._masks),
+                "max_loaded": self.max_loaded,
+                "background_tiles": self.background_tiles,
+            }
+
+
+def compute_tissue_mask(pixels: np.ndarray) -> tuple[np.ndarray, tuple[int, int, int]]:
+    """Threshold an RGB thumbnail into a tissue mask, and estimate the color of the glass.
+
+    The mask is grown by one pixel, so tiles only touching tissue at the mask resolution are kept.
+    """
+    pixels = pixels.astype(np.int32)
+    luminance = (pixels[..., 0] * 299 + pixels[..., 1] * 587 + pixels[..., 2] * 114) // 1000
+    saturation = pixels.max(axis=2) - pixels.min(axis=2)
+
+    glass = max(MIN_BACKGROUND_LUMINANCE, int(np.percentile(luminance, 95)) - BACKGROUND_LUMINANCE_MARGIN)
+    background = (luminance >= glass) & (saturation <= MAX_BACKGROUND_SATURATION)
+
+    tissue = ~background
+    grown = tissue.copy()
+    grown[1:] |= tissue[:-1]
+    grown[:-1] |= tissue[1:]
+    grown[:, 1:] |= tissue[:, :-1]
+    grown[:, :-1] |= tissue[:, 1:]
+    grown[1:, 1:] |= tissue[:-1, :-1]
+    grown[:-1, :-1] |= tissue[1:, 1:]
+    grown[1:, :-1] |= tissue[:-1, 1:]
+    grown[:-1, 1:] |= tissue[1:, :-1]
+
+    color = np.median(pixels[background], axis=0) if background.any() else np.array([255, 255, 255])
+    return grown, tuple(int(channel) for channel in color)  # type: ignore
+
+
+def read_level(
+    read_tile: TileReader, size: tuple[int, int], tiles: tuple[int, int], tile_size: int, overlap: int, level: int
+) -> np.ndarray:
+    """Stitch a whole DeepZoom level from its tiles, dropping their overlap."""
+    image = Image.new("RGB", size, "white")
+    cols, rows = tiles
+    for row in range(rows):
+        for col in range(cols):
+            tile = read_tile(level, (col, row)).convert("RGB")
+            crop_left, crop_top = (overlap if col > 0 else 0), (overlap if row > 0 else 0)
+            tile = tile.crop((crop_left, crop_top, crop_left + tile_size, crop_top + tile_size))
+            image.paste(tile, (col * tile_size, row * tile_size))
+    return np.asarray(image)
+
+
+def generate_tissue_mask(
+    slide_path: Path,
+    store: TissueMaskStore,
+    slide_id: str,
+    max_size: int,
+    dicom_index: DicomSeriesIndex | None = None,
+    levels: LevelSynthesisStore | None = None,
+) -> dict[str, Any]:
+    """Compute the tissue mask of a slide from its largest DeepZoom level within `max_size`. Blocking.
+
+    The level is read from synthesized levels when they hold it, otherwise from the slide.
+
+    Returns
+    -------
+    dict[str, Any]
+        The manifest of the mask.
+    """
+    slide = None
+    if is_dicom_series(slide_path):
+        source: DicomSlide | DeepZoomGenerator = DicomSlide.from_folder(slide_path, dicom_index)
+        tile_size, overlap = source.tile_size, source.overlap  # type: ignore
+    else:
+        slide = openslide.OpenSlide(str(slide_path))
+        options = deepzoom_options(slide)
+        source = DeepZoomGenerator(slide, options.tile_size, options.overlap, limit_bounds=options.limit_bounds)
+        tile_size, overlap = options.tile_size, options.overlap
+
+    try:
+        level_dimensions = [tuple(size) for size in source.level_dimensions]
+        level = max(
+            (level for level, size in enumerate(level_dimensions) if max(size) <= max_size),
+            default=0,
+        )
+        read_tile: TileReader = source.get_tile
+        if levels is not None and levels.has_level(slide_id, level):
+            read_tile = lambda level, address: levels.get_tile(slide_id, level, address)  # noqa: E731
+
+        pixels = read_level(read_tile, level_dimensions[level], source.level_tiles[level], tile_size, overlap, level)
+    finally:
+        if slide is not None:
+            slide.close()
+
+    mask, background = compute_tissue_mask(pixels)
+    manifest = {
+        "level": level,
+        "level_dimensions": level_dimensions,
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "background": list(background),
+        "tissue_fraction": round(float(mask.mean()), 4),
+    }
+    store.write(slide_id, mask, manifest)
+    return manifest
+
+
+@lru_cache(maxsize=256)
+def blank_tile(size: tuple[int, int], color: tuple[int, int, int], encoding: TileEncoding) -> bytes:
+    """Encode a plain tile once per size, color and encoding, shared by every background tile."""
+    return encode_tile(Image.new("RGB", size, color), encoding)
+
+
+store: TissueMaskStore | None = None
@@ -1,13 +1,53 @@
 import asyncio
+import itertools
+import json
 import logging
+import shutil
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
 
+import openslide
 import uvloop
 from arq.worker import Worker
+from openslide.deepzoom import DeepZoomGenerator
+
+from ...crud.crud_slide import crud_slides
+from ...schemas.slide import SlideUpdate
+from ..config import settings
+from ..db.database import local_session
+from ..utils.dicom_convert import (
+    FrameWriter,
+    build_dataset,
+    encode_frames,
+    new_series_uids,
+    plan_levels,
+    publish_series,
+    series_dir,
+    staging_dir,
+)
+from ..utils.dicom_wsi import DicomSeriesIndex, is_dicom_series
+from ..utils.level_synthesis import LevelSynthesisStore, synthesize_levels
+from ..utils.queue import JOB_PROGRESS_PREFIX
+from ..utils.slide_cache import deepzoom_options, slide_identity
+from ..utils.slide_catalog import watch_slides
+from ..utils.slide_normalize import NormalizedSlideStore, normalization_reason, normalize_slide
+from ..utils.slide_previews import DEFAULT_PREVIEW_SIZE, PreviewStore, best_size, generate_previews
+from ..utils.slide_staging import SlideStagingCache
+from ..utils.tile_encoding import DEFAULT_TILE_FORMAT, parse_quality_profiles, select_encoding
+from ..utils.tile_store import TileStore, render_pyramid_chunk, write_atomic
+from ..utils.tissue_mask import TissueMaskStore, generate_tissue_mask
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 
+JOB_PROGRESS_EXPIRATION = 86400
+
 
 # -------- background tasks --------
 async def sample_background_task(ctx: Worker, name: str) -> str:
@@ -15,10 +55,386 @@ async def sample_background_task(ctx: Worker, name: str) -> str:
     return f"Task {name} is complete!"
 
 
+async def publish_progress(ctx: Worker, done: int, total: int, started: float, **extra: Any) -> None:
+    """Store job progress in Redis so `/api/v1/tasks/task/{task_id}` can report it with an ETA."""
+    elapsed = time.monotonic() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    progress = {
+        "done": done,
+        "total": total,
+        "percent": round(100 * done / total, 1) if total else 100.0,
+        "elapsed_seconds": round(elapsed, 1),
+        "eta_seconds": round((total - done) / rate, 1) if rate > 0 else None,
+        **extra,
+    }
+    await ctx["redis"].set(f"{JOB_PROGRESS_PREFIX}{ctx['job_id']}", json.dumps(progress), ex=JOB_PROGRESS_EXPIRATION)
+
+
+@contextmanager
+def process_pool(max_workers: int) -> Iterator[ProcessPoolExecutor]:
+    """Run a job's work on its own process pool, dropping the queued work if the job stops early.
+
+    `with ProcessPoolExecutor()` waits for every submitted task on exit, so a cancelled or timed-out job
+    would block the worker's event loop until all its queued batches had run.
+    """
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        yield executor
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
+
+async def generate_pyramid(ctx: Worker, slide_name: str, format: str = DEFAULT_TILE_FORMAT) -> dict[str, Any]:
+    """Pre-render the full DeepZoom pyramid of a slide into the tile store.
+
+    Tiles are rendered in chunks across `PYRAMID_WORKERS` processes, encoded with the per-level quality
+    profiles the tile routes use. Existing tiles are skipped, so re-enqueuing an interrupted job resumes it
+    where it stopped.
+    """
+    slide_path = Path(settings.SLIDES_DIR) / slide_name
+    slide_id = slide_identity(slide_path)
+    store = TileStore(settings.TILE_STORE_DIR)
+
+    if store.is_complete(slide_id, format):
+        logging.info(f"Pyramid for {slide_name} already complete")
+        return {"slide_name": slide_name, "slide_id": slide_id, "tiles": 0}
+
+    slide = openslide.OpenSlide(str(slide_path))
+    try:
+        options = deepzoom_options(slide)
+        dzi_gen = DeepZoomGenerator(
+            slide, tile_size=options.tile_size, overlap=options.overlap, limit_bounds=options.limit_bounds
+        )
+        dzi = dzi_gen.get_dzi(DEFAULT_TILE_FORMAT)
+        level_tiles = dzi_gen.level_tiles
+    finally:
+        slide.close()
+
+    profiles = parse_quality_profiles(settings.TILE_QUALITY_PROFILES)
+    encodings = [
+        select_encoding(format, level, len(level_tiles), profiles, settings.TILE_QUALITY)
+        for level in range(len(level_tiles))
+    ]
+
+    write_atomic(store.dzi_path(slide_id), dzi.encode())
+    store.write_manifest(
+        slide_id,
+        {
+            "slide_name": slide_name,
+            "encodings": [encoding.label for encoding in encodings],
+            "tile_size": options.tile_size,
+            "overlap": options.overlap,
+            "limit_bounds": options.limit_bounds,
+            "level_tiles": level_tiles,
+        },
+    )
+
+    chunks: list[tuple[int, list[tuple[int, int]]]] = []
+    for level, (cols, rows) in enumerate(level_tiles):
+        addresses = [(col, row) for row in range(rows) for col in range(cols)]
+        for start in range(0, len(addresses), settings.PYRAMID_CHUNK_SIZE):
+            chunks.append((level, addresses[start : start + settings.PYRAMID_CHUNK_SIZE]))
+
+    total = sum(cols * rows for cols, rows in level_tiles)
+    done = 0
+    started = time.monotonic()
+    await publish_progress(ctx, done, total, started, slide_name=slide_name)
+
+    loop = asyncio.get_running_loop()
+    with process_pool(settings.PYRAMID_WORKERS) as executor:
+        futures = [
+            loop.run_in_executor(
+                executor,
+                render_pyramid_chunk,
+                str(slide_path),
+                str(store.root),
+                slide_id,
+                level,
+                addresses,
+                options.tile_size,
+                options.overlap,
+                options.limit_bounds,
+                encodings[level],
+            )
+            for level, addresses in chunks
+        ]
+        for future in asyncio.as_completed(futures):
+            done += await future
+            await publish_progress(ctx, done, total, started, slide_name=slide_name)
+
+    store.mark_complete(slide_id, format)
+    logging.info(f"Pyramid for {slide_name} complete: {total} tiles in {time.monotonic() - started:.1f}s")
+    return {"slide_name": slide_name, "slide_id": slide_id, "tiles": total}
+
+
+async def index_dicom_series(ctx: Worker, slide_name: str) -> dict[str, Any]:
+    """Build or refresh the persistent header index of a DICOM series folder, reading no pixel data."""
+    index = DicomSeriesIndex(settings.DICOM_INDEX_DIR)
+    instances = await asyncio.to_thread(index.load, Path(settings.SLIDES_DIR) / slide_name)
+    return {
+        "slide_name": slide_name,
+        "levels": len(instances),
+        "frames": sum(len(instance.frames) for instance in instances),
+    }
+
+
+async def generate_slide_previews(ctx: Worker, slide_name: str) -> dict[str, Any]:
+    """Render the thumbnail, label and macro previews of a slide once per slide version.
+
+    The catalog row of the slide gets the stored path of its default-size thumbnail.
+    """
+    slide_path = Path(settings.SLIDES_DIR) / slide_name
+    slide_id = slide_identity(slide_path)
+    store = PreviewStore(settings.SLIDE_PREVIEW_DIR)
+
+    manifest = store.read_manifest(slide_id)
+    if manifest is None:
+        dicom_index = DicomSeriesIndex(settings.DICOM_INDEX_DIR)
+        manifest = await asyncio.to_thread(generate_previews, slide_path, store, slide_id, dicom_index)
+        logging.info(f"Previews for {slide_name} generated: {manifest}")
+
+    if "thumbnail" in manifest:
+        size = best_size(manifest["thumbnail"], DEFAULT_PREVIEW_SIZE)
+        thumbnail = SlideUpdate(thumbnail_path=store.relative_path(slide_id, "thumbnail", size))
+        async with local_session() as db:
+            await crud_slides.update(db=db, object=thumbnail, name=slide_name)
+
+    return {"slide_name": slide_name, "slide_id": slide_id, "previews": manifest}
+
+
+async def synthesize_slide_levels(ctx: Worker, slide_name: str) -> dict[str, Any]:
+    """Build the low-resolution levels of a slide that has too few stored levels, once per slide version."""
+    slide_path = Path(settings.SLIDES_DIR) / slide_name
+    slide_id = slide_identity(slide_path)
+    store = LevelSynthesisStore(settings.LEVEL_SYNTHESIS_DIR)
+
+    levels = store.levels(slide_id)
+    if levels is None:
+        started = time.monotonic()
+        levels = await asyncio.to_thread(
+            synthesize_levels,
+            slide_path,
+            store,
+            slide_id,
+            settings.LEVEL_SYNTHESIS_MIN_RATIO,
+            settings.LEVEL_SYNTHESIS_MAX_PIXELS,
+            DicomSeriesIndex(settings.DICOM_INDEX_DIR),
+        )
+        logging.info(f"Synthesized {len(levels)} levels for {slide_name} in {time.monotonic() - started:.1f}s")
+
+    levels = {level: list(size) for level, size in levels.items()}
+    return {"slide_name": slide_name, "slide_id": slide_id, "levels": levels}
+
+
+async def generate_slide_tissue_mask(ctx: Worker, slide_name: str) -> dict[str, Any]:
+    """Compute the tissue mask of a slide once per slide version, so tiles on glass are never rendered.
+
+    Synthesized levels are used when the slide has them, so sparse-level slides are not read at full resolution.
+    """
+    slide_path = Path(settings.SLIDES_DIR) / slide_name
+    slide_id = slide_identity(slide_path)
+    store = TissueMaskStore(settings.TISSUE_MASK_DIR)
+
+    manifest = store.read_manifest(slide_id)
+    if manifest is None:
+        manifest = await asyncio.to_thread(
+            generate_tissue_mask,
+            slide_path,
+            store,
+            slide_id,
+            settings.TISSUE_MASK_SIZE,
+            DicomSeriesIndex(settings.DICOM_INDEX_DIR),
+            LevelSynthesisStore(settings.LEVEL_SYNTHESIS_DIR),
+        )
+        logging.info(f"Tissue mask for {slide_name} computed: {manifest['tissue_fraction']:.0%} tissue")
+
+    return {"slide_name": slide_name, "slide_id": slide_id, "tissue_fraction": manifest["tissue_fraction"]}
+
+
+async def convert_slide_to_dicom(ctx: Worker, slide_name: str) -> dict[str, Any]:
+    """Convert an OpenSlide-readable slide into a DICOM VL Whole Slide Microscopy series, one instance per level.
+
+    Frames are read and JPEG-encoded in batches across `DICOM_CONVERT_WORKERS` processes and written in
+    order as they come back, with at most two batches per process in flight, so memory does not grow with
+    the slide. The series is written to a staging folder and moved into `DICOM_CONVERT_DIR` once complete.
+    """
+    slide_path = Path(settings.SLIDES_DIR) / slide_name
+    if is_dicom_series(slide_path):
+        raise ValueError(f"{slide_name} is already a DICOM series")
+
+    tile_size = settings.DICOM_CONVERT_TILE_SIZE
+    slide = openslide.open_slide(str(slide_path))
+    try:
+        levels = plan_levels(slide, tile_size)
+        uids = new_series_uids()
+        datasets = [
+            build_dataset(slide, level, tile_size, uids, slide_path.stem, instance_number)
+            for instance_number, level in enumerate(levels, start=1)
+        ]
+    finally:
+        slide.close()
+
+    staging = staging_dir(settings.DICOM_CONVERT_DIR, slide_name)
+    staging.mkdir(parents=True, exist_ok=True)
+    total = sum(level.frame_count for level in levels)
+    done = 0
+    bytes_written = 0
+    started = time.monotonic()
+    await publish_progress(ctx, done, total, started, slide_name=slide_name)
+
+    def throughput() -> dict[str, Any]:
+        elapsed = max(time.monotonic() - started, 1e-6)
+        return {
+            "frames_per_second": round(done / elapsed, 1),
+            "megabytes_written": round(bytes_written / 2**20, 1),
+            "megabytes_per_second": round(bytes_written / 2**20 / elapsed, 2),
+        }
+
+    loop = asyncio.get_running_loop()
+    batch_size, quality = settings.DICOM_CONVERT_BATCH_SIZE, settings.DICOM_CONVERT_QUALITY
+    max_in_flight = 2 * settings.DICOM_CONVERT_WORKERS
+    try:
+        with process_pool(settings.DICOM_CONVERT_WORKERS) as executor:
+            for level, dataset in zip(levels, datasets):
+                addresses = [(col, row) for row in range(level.rows) for col in range(level.columns)]
+                batches = (addresses[start : start + batch_size] for start in range(0, len(addresses), batch_size))
+
+                def submit(batch: list[tuple[int, int]]) -> asyncio.Future:
+                    args = (str(slide_path), level, batch, tile_size, quality)
+                    return loop.run_in_executor(executor, encode_frames, *args)
+
+                pending = deque(submit(batch) for batch in itertools.islice(batches, max_in_flight))
+                written_before = bytes_written
+                with open(staging / f"level-{level.level}.dcm", "wb") as fp:
+                    writer = FrameWriter(fp, dataset)
+                    while pending:
+                        frames = await pending.popleft()
+                        batch = next(batches, None)
+                        if batch is not None:
+                            pending.append(submit(batch))
+
+                        for frame in frames:
+                            writer.write(frame)
+                        done += len(frames)
+                        bytes_written = written_before + writer.bytes_written
+                        await publish_progress(
+                            ctx, done, total, started, slide_name=slide_name, level=level.level, **throughput()
+                        )
+                    writer.close()
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    target = series_dir(settings.DICOM_CONVERT_DIR, slide_name)
+    publish_series(staging, target)
+    logging.info(f"Converted {slide_name} to DICOM: {total} frames in {time.monotonic() - started:.1f}s")
+    return {"slide_name": slide_name, "series": str(target), "instances": len(levels), "frames": total, **throughput()}
+
+
+async def normalize_slide_copy(ctx: Worker, slide_name: str, force: bool = False) -> dict[str, Any]:
+    """Write a tiled pyramidal TIFF copy of a slow-to-serve slide, on the DeepZoom tile grid, for the tile routes.
+
+    Slides that are already tiled with a pyramid are skipped unless `force`. The original is kept, and the
+    copy, named after the slide version, is recorded as the slide's optimized path in the catalog.
+    """
+    slide_path = Path(settings.SLIDES_DIR) / slide_name
+    slide_id = slide_identity(slide_path)
+    store = NormalizedSlideStore(settings.NORMALIZED_SLIDES_DIR)
+    result: dict[str, Any] = {"slide_name": slide_name, "slide_id": slide_id}
+
+    if is_dicom_series(slide_path):
+        return {**result, "skipped": "DICOM series are served from their own tiles"}
+
+    if store.existing_path(slide_id) is None:
+        slide = openslide.open_slide(str(slide_path))
+        try:
+            reason = normalization_reason(slide)
+        finally:
+            slide.close()
+        if reason is None and not force:
+            return {**result, "skipped": "slide is tiled and pyramidal"}
+
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+
+        def on_progress(done: int, total: int) -> None:
+            asyncio.run_coroutine_threadsafe(publish_progress(ctx, done, total, started, slide_name=slide_name), loop)
+
+        store.root.mkdir(parents=True, exist_ok=True)
+        with process_pool(settings.SLIDE_NORMALIZE_WORKERS) as executor:
+            summary = await asyncio.to_thread(
+                normalize_slide,
+                slide_path,
+                store.path(slide_id),
+                executor,
+                quality=settings.SLIDE_NORMALIZE_QUALITY,
+                batch_size=settings.SLIDE_NORMALIZE_BATCH_SIZE,
+                max_in_flight=2 * settings.SLIDE_NORMALIZE_WORKERS,
+                on_progress=on_progress,
+            )
+        result.update(summary, reason=reason or "forced")
+        logging.info(f"Normalized {slide_name} ({result['reason']}) in {time.monotonic() - started:.1f}s")
+
+    async with local_session() as db:
+        await crud_slides.update(
+            db=db, object=SlideUpdate(optimized_path=store.relative_path(slide_id)), name=slide_name
+        )
+
+    return {**result, "optimized_path": store.relative_path(slide_id)}
+
+
+async def stage_slide(ctx: Worker, slide_name: str) -> dict[str, Any]:
+    """Copy a slide from network storage to the local staging cache, which the tile routes then read instead.
+
+    Idle copies are evicted, least recently used first, to keep the cache within `SLIDE_STAGING_MAX_BYTES`.
+    """
+    slide_path = Path(settings.SLIDES_DIR) / slide_name
+    slide_id = slide_identity(slide_path)
+    store = SlideStagingCache(settings.SLIDE_STAGING_DIR, settings.SLIDE_STAGING_MAX_BYTES)
+
+    summary = await asyncio.to_thread(store.stage, slide_path, slide_id)
+    return {"slide_name": slide_name, "slide_id": slide_id, **summary}
+
+
 # -------- base functions --------
 async def startup(ctx: Worker) -> None:
     logging.info("Worker Started")
 
+    async def enqueue_ingest_jobs(slide_name: str) -> None:
+        if settings.SLIDE_PREVIEW_ON_INGEST:
+            await ctx["redis"].enqueue_job("generate_slide_previews", slide_name)
+        if settings.LEVEL_SYNTHESIS_ON_INGEST:
+            await ctx["redis"].enqueue_job("synthesize_slide_levels", slide_name)
+        if settings.TISSUE_MASK_ON_INGEST:
+            await ctx["redis"].enqueue_job("generate_slide_tissue_mask", slide_name)
+        if settings.SLIDE_NORMALIZE_ON_INGEST:
+            await ctx["redis"].enqueue_job("normalize_slide_copy", slide_name)
+
+    ingest_jobs = (
+        settings.SLIDE_PREVIEW_ON_INGEST
+        or settings.LEVEL_SYNTHESIS_ON_INGEST
+        or settings.TISSUE_MASK_ON_INGEST
+        or settings.SLIDE_NORMALIZE_ON_INGEST
+    )
+
+    # A single worker keeps the slide catalog current, so web processes never scan the slides directory.
+    if settings.SLIDE_CATALOG_WATCH:
+        ctx["slide_catalog_watcher"] = asyncio.create_task(
+            watch_slides(
+                Path(settings.SLIDES_DIR),
+                poll_seconds=settings.SLIDE_CATALOG_POLL_SECONDS,
+                force_polling=settings.SLIDE_CATALOG_FORCE_POLLING,
+                dicom_index=DicomSeriesIndex(settings.DICOM_INDEX_DIR),
+                on_change=enqueue_ingest_jobs if ingest_jobs else None,
+            )
+        )
+
 
 async def shutdown(ctx: Worker) -> None:
+    watcher = ctx.get("slide_catalog_watcher")
+    if watcher is not None:
+        watcher.cancel()
+
     logging.info("Worker end")
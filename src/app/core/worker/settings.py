@@ -1,14 +1,37 @@
 from arq.connections import RedisSettings
+from arq.worker import func
 
 from ...core.config import settings
-from .functions import sample_background_task, shutdown, startup
+from .functions import (
+    convert_slide_to_dicom,
+    generate_pyramid,
+    generate_slide_previews,
+    generate_slide_tissue_mask,
+    index_dicom_series,
+    normalize_slide_copy,
+    sample_background_task,
+    shutdown,
+    stage_slide,
+    startup,
+    synthesize_slide_levels,
+)
 
 REDIS_QUEUE_HOST = settings.REDIS_QUEUE_HOST
 REDIS_QUEUE_PORT = settings.REDIS_QUEUE_PORT
 
 
 class WorkerSettings:
-    functions = [sample_background_task]
+    functions = [
+        sample_background_task,
+        func(generate_pyramid, timeout=settings.PYRAMID_JOB_TIMEOUT),
+        index_dicom_series,
+        generate_slide_previews,
+        synthesize_slide_levels,
+        generate_slide_tissue_mask,
+        func(convert_slide_to_dicom, timeout=settings.DICOM_CONVERT_JOB_TIMEOUT),
+        func(normalize_slide_copy, timeout=settings.SLIDE_NORMALIZE_JOB_TIMEOUT),
+        func(stage_slide, timeout=settings.SLIDE_STAGING_JOB_TIMEOUT),
+    ]
     redis_settings = RedisSettings(host=REDIS_QUEUE_HOST, port=REDIS_QUEUE_PORT)
     on_startup = startup
     on_shutdown = shutdown
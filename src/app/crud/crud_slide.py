@@ -0,0 +1,7 @@
+from fastcrud import FastCRUD
+
+from ..models.slide import Slide
+from ..schemas.slide import SlideCreateInternal, SlideDelete, SlideUpdate, SlideUpdateInternal
+
+CRUDSlide = FastCRUD[Slide, SlideCreateInternal, SlideUpdate, SlideUpdateInternal, SlideDelete]
+crud_slides = CRUDSlide(Slide)
@@ -3,7 +3,7 @@ from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoin
 
 
 class ClientCacheMiddleware(BaseHTTPMiddleware):
-    """Middleware to set the `Cache-Control` header for client-side caching on all responses.
+    """Middleware to set a default `Cache-Control` header for client-side caching.
 
     Parameters
     ----------
@@ -26,6 +26,9 @@ class ClientCacheMiddleware(BaseHTTPMiddleware):
     ----
         - The `Cache-Control` header instructs clients (e.g., browsers)
         to cache the response for the specified duration.
+        - Responses that already carry a `Cache-Control` header, such as tiles with their own long-lived
+        policy, are left untouched.
+        - JSON responses are API data and are marked `no-store` instead.
     """
 
     def __init__(self, app: FastAPI, max_age: int = 60) -> None:
@@ -45,12 +48,18 @@ class ClientCacheMiddleware(BaseHTTPMiddleware):
         Returns
         -------
         Response
-            The response object with the `Cache-Control` header set.
+            The response object with the `Cache-Control` header set, unless the route already set one.
 
         Note
         ----
             - This method is automatically called by Starlette for processing the request-response cycle.
         """
         response: Response = await call_next(request)
-        response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
+        if "cache-control" in response.headers:
+            return response
+
+        if response.headers.get("content-type", "").startswith("application/json"):
+            response.headers["Cache-Control"] = "no-store"
+        else:
+            response.headers["Cache-Control"] = f"public, max-age={self.max_age}"
         return response
@@ -1,4 +1,5 @@
 from .post import Post
 from .rate_limit import RateLimit
+from .slide import Slide
 from .tier import Tier
 from .user import User
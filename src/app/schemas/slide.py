@@ -0,0 +1,73 @@
+from datetime import datetime
+from typing import Annotated
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from ..core.schemas import TimestampSchema
+
+SLIDE_STAGE_MAX_SLIDES = 1000
+
+
+class SlideBase(BaseModel):
+    name: Annotated[str, Field(examples=["CMU-1.svs"])]
+    format: Annotated[str, Field(examples=["svs"])]
+    size_bytes: int
+    modified_at: datetime
+    width: int | None = None
+    height: int | None = None
+    level_count: int | None = None
+    thumbnail_path: str | None = None
+    optimized_path: str | None = None
+
+
+class Slide(TimestampSchema, SlideBase):
+    mtime_ns: int
+
+
+class SlideRead(SlideBase):
+    id: int
+
+
+class SlideCreate(SlideBase):
+    pass
+
+
+class SlideCreateInternal(SlideCreate):
+    mtime_ns: int
+
+
+class SlideUpdate(BaseModel):
+    format: str | None = None
+    size_bytes: int | None = None
+    modified_at: datetime | None = None
+    width: int | None = None
+    height: int | None = None
+    level_count: int | None = None
+    thumbnail_path: str | None = None
+    optimized_path: str | None = None
+
+
+class SlideUpdateInternal(SlideUpdate):
+    mtime_ns: int | None = None
+    updated_at: datetime
+
+
+class SlideDelete(BaseModel):
+    pass
+
+
+class SlideStageRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    names: Annotated[
+        list[str] | None, Field(min_length=1, max_length=SLIDE_STAGE_MAX_SLIDES, examples=[["CMU-1.svs"]])
+    ] = None
+    format: str | None = None
+    modified_since: datetime | None = None
+    limit: Annotated[int, Field(ge=1, le=SLIDE_STAGE_MAX_SLIDES)] = 100
+
+
+class SlideStageJobs(BaseModel):
+    jobs: dict[str, str | None]
+    over_budget: list[str]
+    missing: list[str]
@@ -0,0 +1,15 @@
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+
+TILE_BATCH_MAX_TILES = 256
+
+
+class TileBatchRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    tiles: Annotated[
+        list[tuple[int, int, int]],
+        Field(min_length=1, max_length=TILE_BATCH_MAX_TILES, examples=[[[12, 0, 0], [12, 1, 0], [13, 2, 1]]]),
+    ]
+    format: Literal["jpeg", "png", "webp"] = "jpeg"
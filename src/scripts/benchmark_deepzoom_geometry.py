@@ -0,0 +1,91 @@
+import argparse
+import logging
+import math
+import random
+import time
+
+import openslide
+from openslide.deepzoom import DeepZoomGenerator
+
+from ..app.core.utils.slide_cache import DeepZoomOptions, deepzoom_options
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def native_tiles_read(
+    slide: openslide.OpenSlide, dzi_gen: DeepZoomGenerator, level: int, address: tuple[int, int]
+) -> int:
+    """Count the stored tiles OpenSlide has to decode to render one DeepZoom tile."""
+    # DeepZoomGenerator keeps the region it reads for a tile private, but it is what OpenSlide decodes.
+    (l0_location, slide_level, l_size), _ = dzi_gen._get_tile_info(level, address)
+    tile_width = int(slide.properties[f"openslide.level[{slide_level}].tile-width"])
+    tile_height = int(slide.properties[f"openslide.level[{slide_level}].tile-height"])
+    downsample = slide.level_downsamples[slide_level]
+    x, y = l0_location[0] / downsample, l0_location[1] / downsample
+    cols = math.ceil((x + l_size[0]) / tile_width) - math.floor(x / tile_width)
+    rows = math.ceil((y + l_size[1]) / tile_height) - math.floor(y / tile_height)
+    return cols * rows
+
+
+def benchmark(slide_path: str, samples: int, levels: int, seed: int) -> None:
+    """Compare the default DeepZoom geometry with the one chosen from the slide's native tiles.
+
+    For the same sample of level-0 regions, taken from the `levels` most detailed DeepZoom levels, report
+    the stored tiles read per served tile and the time to render each tile, for both geometries.
+    """
+    slide = openslide.OpenSlide(slide_path)
+    try:
+        if "openslide.level[0].tile-width" not in slide.properties:
+            raise SystemExit(f"{slide_path} is not tiled, so every geometry reads the same strips")
+
+        native = deepzoom_options(slide)
+        geometries = {"default": DeepZoomOptions(), "native": native}
+        logger.info(f"{slide_path}: native tiles {slide.properties['openslide.level[0].tile-width']}px")
+        logger.info(f"{'geometry':<10}{'tile':>6}{'overlap':>9}{'tiles':>8}{'reads/tile':>12}{'ms/tile':>10}")
+
+        rng = random.Random(seed)
+        width, height = slide.dimensions
+        points = [(rng.random() * width, rng.random() * height) for _ in range(samples)]
+
+        for name, options in geometries.items():
+            dzi_gen = DeepZoomGenerator(
+                slide, tile_size=options.tile_size, overlap=options.overlap, limit_bounds=options.limit_bounds
+            )
+            # The same level-0 points land in different tiles under each geometry.
+            sample = set()
+            for level in range(max(0, dzi_gen.level_count - levels), dzi_gen.level_count):
+                scale = 2 ** (dzi_gen.level_count - 1 - level)
+                cols, rows = dzi_gen.level_tiles[level]
+                for x, y in points:
+                    col = min(cols - 1, int(x / scale) // options.tile_size)
+                    row = min(rows - 1, int(y / scale) // options.tile_size)
+                    sample.add((level, (col, row)))
+
+            reads = sum(native_tiles_read(slide, dzi_gen, level, address) for level, address in sample)
+            started = time.perf_counter()
+            for level, address in sample:
+                dzi_gen.get_tile(level, address)
+            elapsed_ms = 1000 * (time.perf_counter() - started)
+
+            logger.info(
+                f"{name:<10}{options.tile_size:>6}{options.overlap:>9}{len(sample):>8}"
+                f"{reads / len(sample):>12.2f}{elapsed_ms / len(sample):>10.2f}"
+            )
+    finally:
+        slide.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Count native tile reads per DeepZoom tile for each geometry.")
+    parser.add_argument("slide_path", help="Path of the slide to sample tiles from.")
+    parser.add_argument("--samples", type=int, default=200, help="Number of level-0 points sampled per level.")
+    parser.add_argument("--levels", type=int, default=3, help="Number of most detailed levels to sample.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sample.")
+    args = parser.parse_args()
+
+    benchmark(args.slide_path, args.samples, args.levels, args.seed)
+
+
+if __name__ == "__main__":
+    main()
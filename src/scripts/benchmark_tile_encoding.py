@@ -0,0 +1,99 @@
+import argparse
+import logging
+import random
+import time
+
+import openslide
+from openslide.deepzoom import DeepZoomGenerator
+from PIL import Image
+
+from ..app.core.config import settings
+from ..app.core.utils.slide_cache import deepzoom_options
+from ..app.core.utils.tile_encoding import (
+    DEFAULT_TILE_QUALITY,
+    TileEncoding,
+    encode_tile,
+    parse_quality_profiles,
+    select_encoding,
+)
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+BASELINE = TileEncoding("jpeg", DEFAULT_TILE_QUALITY)
+FORMATS = ("jpeg", "webp", "png")
+
+
+def benchmark(slide_path: str, samples: int, levels: int, seed: int, profiles_spec: str, quality: int) -> None:
+    """Encode the same sample of tiles with every encoding the quality settings use, and report size and
+    encode time against JPEG at the default quality.
+
+    Tiles are drawn from the `levels` most detailed DeepZoom levels, where nearly all tile traffic is, and
+    rendered once up front so only the encoder is timed.
+    """
+    profiles = parse_quality_profiles(profiles_spec)
+    slide = openslide.OpenSlide(slide_path)
+    try:
+        options = deepzoom_options(slide)
+        dzi_gen = DeepZoomGenerator(
+            slide, tile_size=options.tile_size, overlap=options.overlap, limit_bounds=options.limit_bounds
+        )
+        rng = random.Random(seed)
+        addresses = [
+            (level, col, row)
+            for level in range(max(0, dzi_gen.level_count - levels), dzi_gen.level_count)
+            for col in range(dzi_gen.level_tiles[level][0])
+            for row in range(dzi_gen.level_tiles[level][1])
+        ]
+        sample = rng.sample(addresses, min(samples, len(addresses)))
+        images = [dzi_gen.get_tile(level, (col, row)).convert("RGB") for level, col, row in sample]
+    finally:
+        slide.close()
+
+    # Every encoding the settings pick for some level of this slide, in each format, most detailed first.
+    encodings = dict.fromkeys(
+        select_encoding(format, level, dzi_gen.level_count, profiles, quality)
+        for format in FORMATS
+        for level in reversed(range(dzi_gen.level_count))
+    )
+
+    logger.info(f"{len(images)} tiles from the {levels} most detailed levels of {slide_path}")
+    logger.info(f"{'encoding':<14}{'bytes/tile':>12}{'ms/tile':>10}{f'vs {BASELINE.label}':>13}")
+
+    # The baseline is measured first, so every row can be compared with it.
+    results = {BASELINE: measure(images, BASELINE)}
+    baseline, _ = results[BASELINE]
+    for encoding in encodings:
+        mean_bytes, mean_ms = results.get(encoding) or measure(images, encoding)
+        logger.info(f"{encoding.label:<14}{mean_bytes:>12.0f}{mean_ms:>10.2f}{mean_bytes / baseline:>12.2f}x")
+
+
+def measure(images: list[Image.Image], encoding: TileEncoding) -> tuple[float, float]:
+    """Return the mean size in bytes and encode time in milliseconds of the images in an encoding."""
+    started = time.perf_counter()
+    total_bytes = sum(len(encode_tile(image, encoding)) for image in images)
+    elapsed_ms = 1000 * (time.perf_counter() - started)
+    return total_bytes / len(images), elapsed_ms / len(images)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare tile size and encode time across the configured encodings.")
+    parser.add_argument("slide_path", help="Path of the slide to sample tiles from.")
+    parser.add_argument("--samples", type=int, default=200, help="Number of tiles to encode per encoding.")
+    parser.add_argument("--levels", type=int, default=3, help="Number of most detailed levels to sample.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the tile sample.")
+    parser.add_argument(
+        "--profiles",
+        default=settings.TILE_QUALITY_PROFILES,
+        help="Per-level quality profiles. Defaults to TILE_QUALITY_PROFILES.",
+    )
+    parser.add_argument(
+        "--quality", type=int, default=settings.TILE_QUALITY, help="Default quality. Defaults to TILE_QUALITY."
+    )
+    args = parser.parse_args()
+
+    benchmark(args.slide_path, args.samples, args.levels, args.seed, args.profiles, args.quality)
+
+
+if __name__ == "__main__":
+    main()
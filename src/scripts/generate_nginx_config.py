@@ -0,0 +1,33 @@
+import argparse
+import sys
+
+from ..app.core.config import settings
+from ..app.core.utils.slide_affinity import parse_backends, render_nginx_config, slide_route_patterns
+from ..app.main import app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate an nginx config that keeps each slide on one app process.")
+    parser.add_argument(
+        "--backends",
+        default=settings.SLIDE_AFFINITY_BACKENDS,
+        help="Comma-separated host:port of the app processes. Defaults to SLIDE_AFFINITY_BACKENDS.",
+    )
+    parser.add_argument("--listen", type=int, default=80, help="Port nginx listens on.")
+    parser.add_argument("--tile-store-dir", default="/code/tile_store", help="Tile store directory as nginx sees it.")
+    parser.add_argument("--output", help="File to write the config to. Defaults to standard output.")
+    args = parser.parse_args()
+
+    patterns = slide_route_patterns(route.path for route in app.routes if hasattr(route, "path"))
+    tile_store = (settings.TILE_STORE_ACCEL_PREFIX, args.tile_store_dir) if settings.TILE_STORE_ACCEL_PREFIX else None
+    config = render_nginx_config(parse_backends(args.backends), patterns, args.listen, tile_store)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(config)
+    else:
+        sys.stdout.write(config)
+
+
+if __name__ == "__main__":
+    main()
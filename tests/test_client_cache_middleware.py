@@ -0,0 +1,31 @@
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from src.app.middleware.client_cache_middleware import ClientCacheMiddleware
+
+
+def _client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(ClientCacheMiddleware, max_age=60)
+
+    @app.get("/page")
+    async def page():
+        return Response(content="<html></html>", media_type="text/html")
+
+    @app.get("/api")
+    async def api():
+        return {"value": 1}
+
+    @app.get("/tile")
+    async def tile():
+        return Response(content=b"tile", media_type="image/jpeg", headers={"Cache-Control": "public, immutable"})
+
+    return TestClient(app)
+
+
+def test_sets_default_cache_control_without_overriding_routes() -> None:
+    client = _client()
+
+    assert client.get("/page").headers["cache-control"] == "public, max-age=60"
+    assert client.get("/api").headers["cache-control"] == "no-store"
+    assert client.get("/tile").headers["cache-control"] == "public, immutable"
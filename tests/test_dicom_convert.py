@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import numpy as np
+import openslide
+from PIL import Image
+
+from src.app.core.utils.dicom_convert import FrameWriter, build_dataset, encode_frames, new_series_uids, plan_levels
+from src.app.core.utils.dicom_wsi import DicomSlide, read_instance
+
+TILE = 64
+
+
+def test_streams_frames_readable_by_the_dicom_reader(tmp_path: Path) -> None:
+    ys, xs = np.mgrid[0:150, 0:300]
+    pixels = np.stack([xs % 256, ys % 256, np.full_like(xs, 128)], axis=2).astype(np.uint8)
+    Image.fromarray(pixels).save(tmp_path / "slide.png")
+    slide = openslide.open_slide(str(tmp_path / "slide.png"))
+    (level,) = plan_levels(slide, TILE)
+    dataset = build_dataset(slide, level, TILE, new_series_uids(), "slide", 1)
+    addresses = [(col, row) for row in range(level.rows) for col in range(level.columns)]
+
+    series = tmp_path / "series"
+    series.mkdir()
+    with open(series / "level-0.dcm", "wb") as fp:
+        writer = FrameWriter(fp, dataset)
+        for start in range(0, len(addresses), 4):
+            for frame in encode_frames(str(tmp_path / "slide.png"), level, addresses[start : start + 4], TILE, 95):
+                writer.write(frame)
+        writer.close()
+
+    instance = read_instance(series / "level-0.dcm")
+    assert instance is not None
+    assert (instance.width, instance.height, len(instance.frames)) == (300, 150, 5 * 3)
+    dicom_slide = DicomSlide.from_folder(series)
+    region = np.asarray(dicom_slide.read_region(dicom_slide.level_count - 1, (0, 0), (300, 150)), dtype=int)
+    assert np.abs(region - pixels).mean() < 3
@@ -0,0 +1,135 @@
+import math
+import os
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.encaps import encapsulate
+from pydicom.uid import JPEGBaseline8Bit, generate_uid
+
+from src.app.core.utils import dicom_wsi
+from src.app.core.utils.dicom_wsi import (
+    VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE,
+    DicomSeriesIndex,
+    DicomSlide,
+    DicomSlideCache,
+    read_instance,
+)
+from src.app.core.utils.slide_cache import series_signatures
+
+TILE = 64
+
+
+def _write_level(path: Path, width: int, height: int, has_bot: bool = True) -> list[bytes]:
+    cols, rows = math.ceil(width / TILE), math.ceil(height / TILE)
+    frames = []
+    for row in range(rows):
+        for col in range(cols):
+            buffer = BytesIO()
+            Image.new("RGB", (TILE, TILE), (col * 40 % 256, row * 40 % 256, width % 256)).save(buffer, "JPEG")
+            frames.append(buffer.getvalue())
+
+    dataset = Dataset()
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.TransferSyntaxUID = JPEGBaseline8Bit
+    dataset.file_meta.MediaStorageSOPClassUID = VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE
+    dataset.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    dataset.SOPClassUID = VL_WHOLE_SLIDE_MICROSCOPY_IMAGE_STORAGE
+    dataset.ImageType = ["ORIGINAL", "PRIMARY", "VOLUME", "NONE"]
+    dataset.Rows = dataset.Columns = TILE
+    dataset.TotalPixelMatrixColumns, dataset.TotalPixelMatrixRows = width, height
+    dataset.NumberOfFrames = len(frames)
+    dataset.SamplesPerPixel = 3
+    dataset.DimensionOrganizationType = "TILED_FULL"
+    dataset.PixelData = encapsulate(frames, has_bot=has_bot)
+    dataset["PixelData"].VR = "OB"
+    dataset.save_as(path, enforce_file_format=True)
+    return frames
+
+
+def test_locates_frames_with_and_without_offset_table(tmp_path: Path) -> None:
+    with_bot = _write_level(tmp_path / "a.dcm", 200, 130)
+    without_bot = _write_level(tmp_path / "b.dcm", 200, 130, has_bot=False)
+
+    for name, frames in (("a.dcm", with_bot), ("b.dcm", without_bot)):
+        instance = read_instance(tmp_path / name)
+        data = (tmp_path / name).read_bytes()
+        assert instance is not None
+        assert len(instance.frames) == len(frames) == 12
+        for spans, frame in zip(instance.frames, frames):
+            assert b"".join(data[offset : offset + length] for offset, length in spans).rstrip(b"\x00") == frame
+
+
+def test_passes_interior_frames_through_and_composes_other_tiles(tmp_path: Path) -> None:
+    base_frames = _write_level(tmp_path / "level0.dcm", 256, 192)
+    _write_level(tmp_path / "level1.dcm", 128, 96)
+    slide = DicomSlide.from_folder(tmp_path)
+
+    assert slide.tile_size == TILE and slide.overlap == 0
+    assert slide.level_dimensions[-1] == (256, 192) and slide.level_dimensions[-2] == (128, 96)
+    top = slide.level_count - 1
+
+    assert slide.read_native_tile(top, 1, 2).rstrip(b"\x00") == base_frames[2 * 4 + 1]
+    assert slide.read_native_tile(top - 2, 0, 0) is None
+
+    composed = slide.get_tile(top - 2, (0, 0))
+    assert composed.size == (64, 48)
+    assert np.asarray(composed).mean() > 0
+
+
+def test_index_only_reads_new_or_changed_files(tmp_path: Path, mocker) -> None:
+    series = tmp_path / "series"
+    series.mkdir()
+    _write_level(series / "level0.dcm", 256, 192)
+    index = DicomSeriesIndex(tmp_path / "index")
+
+    first = index.load(series)
+    assert index.index_path(series).is_file()
+
+    read = mocker.patch("src.app.core.utils.dicom_wsi.read_instance", side_effect=read_instance)
+    assert index.load(series) == first
+    read.assert_not_called()
+
+    _write_level(series / "level1.dcm", 128, 96)
+    instances = index.load(series)
+    read.assert_called_once_with(series / "level1.dcm")
+    assert sorted(instance.width for instance in instances) == [128, 256]
+    assert DicomSlide(instances).read_native_tile(8, 0, 0) is not None
+
+
+def test_cache_rereads_series_rewritten_in_place_and_closes_the_old_one(tmp_path: Path, mocker) -> None:
+    # Every lookup lists the folder again, instead of once the remembered signature expires.
+    mocker.patch.object(series_signatures, "ttl", 0.0)
+    series = tmp_path / "series"
+    series.mkdir()
+    _write_level(series / "level0.dcm", 256, 192)
+    cache = DicomSlideCache(index=DicomSeriesIndex(tmp_path / "index"))
+
+    first = cache.get(series)
+    assert first.read_native_tile(first.level_count - 1, 0, 0) is not None
+    assert cache.get(series) is first
+
+    # Rewriting a file keeps the folder's modification time, but not the file's signature.
+    folder_stat = series.stat()
+    _write_level(series / "level0.dcm", 320, 192)
+    os.utime(series, ns=(folder_stat.st_atime_ns, folder_stat.st_mtime_ns))
+
+    second = cache.get(series)
+    assert second is not first and second.level_dimensions[-1] == (320, 192)
+    assert first._maps == {}
+    assert cache.stats()["size"] == 1
+
+
+def test_thumbnail_is_composed_from_a_finer_level_when_no_stored_level_is_close(tmp_path: Path, mocker) -> None:
+    _write_level(tmp_path / "level0.dcm", 1024, 768)
+    slide = DicomSlide.from_folder(tmp_path)
+
+    thumbnail = slide.get_thumbnail((64, 64))
+    assert thumbnail.size == (64, 48)
+
+    mocker.patch.object(dicom_wsi, "MAX_THUMBNAIL_FRAMES", 100)
+    with pytest.raises(ValueError):
+        slide.get_thumbnail((64, 64))
@@ -0,0 +1,30 @@
+import numpy as np
+
+from src.app.core.utils.level_synthesis import LevelSynthesisStore, halve
+
+
+def test_halve_rounds_odd_sizes_up() -> None:
+    pixels = np.zeros((5, 3, 3), dtype=np.uint8)
+    pixels[0:2, 0:2] = [[[0, 0, 0], [4, 8, 255]], [[4, 8, 255], [0, 0, 255]]]
+
+    halved = halve(pixels)
+
+    assert halved.shape == (3, 2, 3)
+    assert halved[0, 0].tolist() == [2, 4, 191]
+
+
+def test_tiles_include_deepzoom_overlap(tmp_path) -> None:
+    store = LevelSynthesisStore(tmp_path)
+    ys, xs = np.mgrid[0:300, 0:500]
+    level = np.stack([xs % 256, ys % 256, np.zeros_like(xs)], axis=2).astype(np.uint8)
+
+    assert store.levels("slide") is None
+    store.write("slide", {3: level}, tile_size=254, overlap=1)
+
+    assert store.levels("slide") == {3: (500, 300)}
+    first = np.asarray(store.get_tile("slide", 3, (0, 0)))
+    last = np.asarray(store.get_tile("slide", 3, (1, 1)))
+    assert first.shape == (255, 255, 3)
+    assert last.shape == (300 - 253, 500 - 253, 3)
+    assert (last == level[253:, 253:]).all()
+    assert store.stats()["tiles_served"] == 2
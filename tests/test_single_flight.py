@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from src.app.core.utils import cache
+from src.app.core.utils.single_flight import SingleFlight
+
+
+def test_coalesces_concurrent_calls_for_same_key() -> None:
+    flights = SingleFlight()
+    calls = 0
+
+    async def render() -> bytes:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return b"tile"
+
+    async def scenario() -> list[bytes]:
+        return await asyncio.gather(*(flights.do("a", render) for _ in range(5)), flights.do("b", render))
+
+    assert asyncio.run(scenario()) == [b"tile"] * 6
+    assert calls == 2
+    assert flights.stats()["coalesced"] == 4
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_shares_failures_and_survives_cancelled_callers() -> None:
+    flights = SingleFlight()
+
+    async def fail() -> bytes:
+        await asyncio.sleep(0.02)
+        raise ValueError("bad tile")
+
+    async def slow() -> bytes:
+        await asyncio.sleep(0.02)
+        return b"tile"
+
+    async def scenario() -> None:
+        results = await asyncio.gather(flights.do("a", fail), flights.do("a", fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+        leader = asyncio.create_task(flights.do("b", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("b", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == b"tile"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
+
+
+def test_waits_for_result_of_process_holding_redis_lock(mocker) -> None:
+    async def lock_taken(*args, **kwargs) -> bool:
+        return False
+
+    peeks = iter([None, b"remote tile"])
+
+    async def peek() -> bytes | None:
+        return next(peeks)
+
+    render = mocker.AsyncMock(return_value=b"local tile")
+    mocker.patch.object(cache, "client", mocker.Mock(set=lock_taken))
+    flights = SingleFlight(redis_lock=True, poll_interval=0)
+
+    assert asyncio.run(flights.do("a", render, peek)) == b"remote tile"
+    render.assert_not_called()
+    assert flights.stats()["remote_coalesced"] == 1
+
+
+def test_cancels_work_once_every_caller_went_away() -> None:
+    flights = SingleFlight()
+    started = asyncio.Event()
+
+    async def slow() -> bytes:
+        started.set()
+        await asyncio.sleep(10)
+        return b"tile"
+
+    async def scenario() -> None:
+        callers = [asyncio.create_task(flights.do("a", slow)) for _ in range(2)]
+        await started.wait()
+        callers[0].cancel()
+        await asyncio.sleep(0)
+        assert flights.stats()["in_flight"] == 1
+
+        callers[1].cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert flights.stats()["in_flight"] == 0
+        assert flights.stats()["abandoned"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import re
+
+import pytest
+
+from src.app.core.utils.slide_affinity import (
+    parse_backends,
+    render_nginx_config,
+    slide_route_pattern,
+    slide_route_patterns,
+)
+
+
+def test_patterns_capture_the_slide_of_slide_routes() -> None:
+    tile = slide_route_pattern("/tiles/{slide_name}/{level}/{col}_{row}.{ext}")
+    dzi = slide_route_pattern("/dzi/{slide_name}.dzi")
+    assert re.match(tile, "/tiles/case 1.svs/12/3_4.jpeg").group(1) == "case 1.svs"
+    assert re.match(dzi, "/dzi/case.ndpi.dzi").group(1) == "case.ndpi"
+    assert not re.match(tile, "/tiles/case.svs/batch")
+
+    assert slide_route_pattern("/api/v1/tasks/pyramid/{slide_name}") is None
+    assert slide_route_pattern("/debug/check-file/{filename}") is None
+    assert slide_route_patterns(["/metadata/{slide_name}", "/metadata/{slide_name}", "/"]) == ["^/metadata/([^/]+)$"]
+
+
+def test_config_hashes_slide_routes_across_backends() -> None:
+    backends = parse_backends(" web1:8000, web2:8000,web1:8000, ")
+    assert backends == ["web1:8000", "web2:8000"]
+    with pytest.raises(ValueError):
+        parse_backends(" , ")
+
+    patterns = slide_route_patterns(["/dzi/{slide_name}.dzi", "/tiles/{slide_name}/batch"])
+    config = render_nginx_config(backends, patterns, tile_store=("/tile-store/", "/code/tile_store"))
+
+    assert "hash $slide_affinity_key consistent;" in config
+    assert config.count("server web2:8000;") == 2
+    assert '"~^/tiles/([^/]+)/batch$" $1;' in config
+    assert "location ~ ^/(?:dzi|tiles)/ {" in config
+    assert "location /tile-store/ {\n        internal;\n        alias /code/tile_store/;" in config
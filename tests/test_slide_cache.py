@@ -0,0 +1,157 @@
+import os
+from pathlib import Path
+
+import openslide
+import pytest
+from pytest_mock import MockerFixture
+
+from src.app.core.utils import slide_cache
+
+
+@pytest.fixture
+def opened(mocker: MockerFixture) -> list:
+    slides: list = []
+
+    def open_slide(path: str):
+        slide = mocker.MagicMock(name=f"OpenSlide({path})")
+        slides.append(slide)
+        return slide
+
+    mocker.patch.object(slide_cache.openslide, "OpenSlide", side_effect=open_slide)
+    mocker.patch.object(
+        slide_cache,
+        "DeepZoomGenerator",
+        side_effect=lambda slide, **kwargs: mocker.MagicMock(
+            level_count=1, level_dimensions=((10, 10),), level_tiles=((1, 1),)
+        ),
+    )
+    return slides
+
+
+def _touch(path: Path, mtime_ns: int) -> Path:
+    path.write_bytes(b"")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def test_lease_reuses_open_handle(tmp_path: Path, opened: list) -> None:
+    path = _touch(tmp_path / "a.svs", 1_000_000_000)
+    handles = slide_cache.SlideHandleCache(max_handles=2)
+
+    with handles.lease(path) as first:
+        pass
+    with handles.lease(path) as second:
+        pass
+
+    assert first is second
+    assert len(opened) == 1
+    assert handles.stats()["hits"] == 1
+    assert handles.stats()["misses"] == 1
+
+
+def test_evicts_and_closes_least_recently_used(tmp_path: Path, opened: list) -> None:
+    paths = [_touch(tmp_path / f"{name}.svs", 1_000_000_000) for name in "abc"]
+    handles = slide_cache.SlideHandleCache(max_handles=2)
+
+    for path in paths:
+        with handles.lease(path):
+            pass
+
+    assert handles.stats()["size"] == 2
+    assert handles.stats()["evictions"] == 1
+    opened[0].close.assert_called_once()
+    opened[2].close.assert_not_called()
+
+
+def test_leased_handle_is_not_closed(tmp_path: Path, opened: list) -> None:
+    a, b = _touch(tmp_path / "a.svs", 1_000_000_000), _touch(tmp_path / "b.svs", 1_000_000_000)
+    handles = slide_cache.SlideHandleCache(max_handles=1)
+
+    with handles.lease(a):
+        with handles.lease(b):
+            assert handles.stats()["size"] == 2
+        opened[0].close.assert_not_called()
+        opened[1].close.assert_called_once()
+
+    assert handles.stats()["size"] == 1
+
+
+def test_invalidated_handle_is_closed_on_release(tmp_path: Path, opened: list) -> None:
+    path = _touch(tmp_path / "a.svs", 1_000_000_000)
+    handles = slide_cache.SlideHandleCache(max_handles=1)
+
+    with handles.lease(path):
+        assert handles.invalidate(path) == 1
+        opened[0].close.assert_not_called()
+
+    opened[0].close.assert_called_once()
+
+
+def test_modified_file_gets_fresh_handle(tmp_path: Path, opened: list) -> None:
+    path = _touch(tmp_path / "a.svs", 1_000_000_000)
+    handles = slide_cache.SlideHandleCache(max_handles=4)
+
+    with handles.lease(path):
+        pass
+    _touch(path, 2_000_000_000)
+    with handles.lease(path):
+        pass
+
+    assert len(opened) == 2
+    opened[0].close.assert_called_once()
+    assert handles.stats()["size"] == 1
+    assert handles.stats()["invalidations"] == 1
+
+
+def test_geometry_outlives_evicted_handle(tmp_path: Path, opened: list) -> None:
+    a, b = _touch(tmp_path / "a.svs", 1_000_000_000), _touch(tmp_path / "b.svs", 1_000_000_000)
+    handles = slide_cache.SlideHandleCache(max_handles=1)
+
+    assert handles.cached_geometry(a) is None
+    for path in (a, b):
+        with handles.lease(path):
+            pass
+
+    geometry = handles.cached_geometry(a)
+    assert geometry is not None
+    assert geometry.has_tile(0, 0, 0)
+    assert not geometry.has_tile(0, 1, 0)
+    assert len(opened) == 2
+
+
+def test_series_identity_follows_files_rewritten_in_place(tmp_path: Path, mocker: MockerFixture) -> None:
+    series = tmp_path / "series"
+    series.mkdir()
+    _touch(series / "level0.dcm", 1_000_000_000)
+    signatures = slide_cache.series_signatures
+    mocker.patch.object(signatures, "ttl", 60.0)
+    signatures.clear()
+
+    first = slide_cache.slide_identity(series)
+    folder_stat = series.stat()
+    _touch(series / "level0.dcm", 2_000_000_000)
+    os.utime(series, ns=(folder_stat.st_atime_ns, folder_stat.st_mtime_ns))
+
+    # Requests within the TTL reuse the folder listing instead of scanning the folder again.
+    assert slide_cache.slide_identity(series) == first
+    signatures.clear()
+    assert slide_cache.slide_identity(series) != first
+
+
+def _tiled_slide(mocker: MockerFixture, tile: tuple[int, int], downsamples: tuple[float, ...], **properties: str):
+    for level in range(len(downsamples)):
+        properties[f"openslide.level[{level}].tile-width"] = str(tile[0])
+        properties[f"openslide.level[{level}].tile-height"] = str(tile[1])
+    return mocker.MagicMock(properties=properties, level_count=len(downsamples), level_downsamples=downsamples)
+
+
+def test_deepzoom_options_follow_native_tiles(mocker: MockerFixture) -> None:
+    native = slide_cache.deepzoom_options(_tiled_slide(mocker, (512, 512), (1.0, 4.0, 16.0)))
+    assert native == slide_cache.DeepZoomOptions(512, 0, slide_cache.DEEPZOOM_LIMIT_BOUNDS)
+
+    default = slide_cache.DeepZoomOptions()
+    assert slide_cache.deepzoom_options(_tiled_slide(mocker, (512, 16), (1.0,))) == default
+    assert slide_cache.deepzoom_options(mocker.MagicMock(properties={}, level_count=1)) == default
+
+    shifted = _tiled_slide(mocker, (256, 256), (1.0, 4.0), **{openslide.PROPERTY_NAME_BOUNDS_X: "512"})
+    assert slide_cache.deepzoom_options(shifted) == default
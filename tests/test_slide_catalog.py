@@ -0,0 +1,67 @@
+import asyncio
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from src.app.core.utils import slide_catalog
+from src.app.core.utils.slide_catalog import SlideDimensions, list_entries, read_dimensions, scan_slides
+
+
+def test_lists_slide_files_and_series_folders_only(tmp_path: Path) -> None:
+    (tmp_path / "a.svs").write_bytes(b"x" * 10)
+    (tmp_path / "notes.txt").write_text("not a slide")
+    (tmp_path / "series").mkdir()
+    (tmp_path / "series" / "level0.dcm").write_bytes(b"x" * 5)
+    (tmp_path / "series" / "level1.dcm").write_bytes(b"x" * 3)
+    (tmp_path / "mirax").mkdir()
+    (tmp_path / "mirax" / "Data0000.dat").write_bytes(b"x")
+    (tmp_path / "empty").mkdir()
+
+    entries = list_entries(tmp_path)
+
+    assert sorted(entries) == ["a.svs", "mirax", "series"]
+    assert entries["a.svs"].format == "svs" and entries["a.svs"].size_bytes == 10
+    assert entries["series"].format == "dicom" and entries["series"].size_bytes == 8
+    assert entries["mirax"].format == "mrxs"
+    assert list_entries(tmp_path, ["a.svs", "deleted.svs"]).keys() == {"a.svs"}
+
+
+def test_scan_adds_updates_and_removes_rows(tmp_path: Path, mocker: MockerFixture) -> None:
+    for name, size in (("new.svs", 1), ("changed.svs", 2), ("same.svs", 3)):
+        (tmp_path / name).write_bytes(b"x" * size)
+    same_mtime = (tmp_path / "same.svs").stat().st_mtime_ns
+    known = [("changed.svs", 1, 0), ("same.svs", 3, same_mtime), ("gone.svs", 4, 0)]
+
+    db = mocker.Mock(execute=mocker.AsyncMock(return_value=mocker.Mock(all=lambda: known)))
+    crud = mocker.patch.object(slide_catalog, "crud_slides", mocker.AsyncMock())
+    read = mocker.patch.object(slide_catalog, "read_dimensions", return_value=SlideDimensions(100, 50, 3))
+    on_change = mocker.AsyncMock()
+
+    counts = asyncio.run(scan_slides(db, tmp_path, on_change=on_change))
+
+    assert counts == {"added": 1, "updated": 1, "removed": 1, "unchanged": 1}
+    assert sorted(call.args[0].name for call in read.call_args_list) == ["changed.svs", "new.svs"]
+
+    created = crud.create.call_args.kwargs["object"]
+    assert created.name == "new.svs" and created.width == 100 and created.size_bytes == 1
+
+    assert crud.update.call_args.kwargs["name"] == "changed.svs"
+    updated = crud.update.call_args.kwargs["object"]
+    assert updated.size_bytes == 2 and updated.thumbnail_path is None and updated.optimized_path is None
+
+    crud.db_delete.assert_awaited_once_with(db=db, name="gone.svs")
+    assert sorted(call.args[0] for call in on_change.await_args_list) == ["changed.svs", "new.svs"]
+
+
+def test_reads_mrxs_folders_through_their_index_file(tmp_path: Path, mocker: MockerFixture) -> None:
+    (tmp_path / "mirax").mkdir()
+    (tmp_path / "mirax" / "slide.mrxs").write_text("")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "Data0000.dat").write_bytes(b"x")
+    opened = mocker.patch.object(
+        slide_catalog.openslide, "OpenSlide", return_value=mocker.Mock(dimensions=(300, 200), level_count=4)
+    )
+
+    assert read_dimensions(tmp_path / "mirax", "mrxs") == SlideDimensions(300, 200, 4)
+    opened.assert_called_once_with(str(tmp_path / "mirax" / "slide.mrxs"))
+    assert read_dimensions(tmp_path / "data", "mrxs") == SlideDimensions()
@@ -0,0 +1,54 @@
+import asyncio
+from io import BytesIO
+
+import pydicom
+from pydicom.dataset import FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+from src.app.core.utils import cache
+from src.app.core.utils.slide_metadata import SlideMetadataCache, filtered_dicom_metadata
+
+
+def test_shares_metadata_through_redis(mocker) -> None:
+    stored = {}
+
+    async def redis_set(key: str, value: str, ex: int) -> None:
+        stored[key] = value
+
+    async def redis_get(key: str) -> str | None:
+        return stored.get(key)
+
+    mocker.patch.object(cache, "client", mocker.Mock(set=redis_set, get=redis_get))
+    writer, reader = SlideMetadataCache(), SlideMetadataCache()
+
+    async def scenario() -> None:
+        cached = await writer.put("slide", {"levels": 3, "level_dimensions": [(1, 1), (2, 2), (4, 3)]})
+        assert cached["level_dimensions"] == [[1, 1], [2, 2], [4, 3]]
+        assert await reader.get("slide") == cached
+        assert await reader.get("slide") == cached
+        assert await reader.get("other") is None
+
+    asyncio.run(scenario())
+
+    assert reader.stats()["redis_hits"] == 1
+    assert reader.stats()["hits"] == 1
+    assert reader.stats()["misses"] == 1
+
+
+def test_skips_pixel_data_and_deferred_values() -> None:
+    dataset = pydicom.Dataset()
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset.PatientID = "P1"
+    dataset.ICCProfile = b"\0" * 4096
+    dataset.BitsAllocated = 8
+    dataset.PixelData = b"\0" * 64
+
+    buffer = BytesIO()
+    dataset.save_as(buffer, enforce_file_format=False)
+    buffer.seek(0)
+    header = pydicom.dcmread(buffer, defer_size=1024, force=True)
+
+    metadata = filtered_dicom_metadata(header)
+
+    assert metadata == {"(0010,0020)": "P1", "(0028,0100)": "8"}
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openslide
+from openslide.deepzoom import DeepZoomGenerator
+from PIL import Image
+
+from src.app.core.utils.slide_cache import DEEPZOOM_LIMIT_BOUNDS, DeepZoomOptions, deepzoom_options
+from src.app.core.utils.slide_normalize import NormalizedSlideStore, level_sizes, normalization_reason, normalize_slide
+
+
+def test_level_sizes_halve_down_to_one_tile() -> None:
+    assert level_sizes(1000, 300, 256) == [(1000, 300), (500, 150), (250, 75)]
+    assert level_sizes(200, 100, 256) == [(200, 100)]
+
+
+def test_normalized_copy_is_tiled_and_pyramidal(tmp_path) -> None:
+    ys, xs = np.mgrid[0:700, 0:900]
+    pixels = np.stack([xs % 256, ys % 256, (xs + ys) % 256], axis=2).astype(np.uint8)
+    source = tmp_path / "slide.png"
+    Image.fromarray(pixels).save(source)
+    store = NormalizedSlideStore(tmp_path / "normalized")
+    store.root.mkdir()
+
+    with openslide.open_slide(str(source)) as slide:
+        assert normalization_reason(slide) == "untiled base level"
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        summary = normalize_slide(source, store.path("slide"), executor, batch_size=4)
+
+    assert summary["levels"] == 3
+    assert store.existing_path("slide") is not None
+    assert [path.name for path in store.root.iterdir()] == ["slide.tiff"]
+    with openslide.OpenSlide(str(store.path("slide"))) as copy:
+        assert copy.level_dimensions == ((900, 700), (450, 350), (225, 175))
+        assert normalization_reason(copy) is None
+        tile = DeepZoomGenerator(copy, 254, 1).get_tile(10, (1, 1))
+        assert tile.size == (256, 256)
+        assert np.abs(np.asarray(tile).astype(int) - pixels[253:509, 253:509]).mean() < 4
+
+        assert deepzoom_options(copy) == DeepZoomOptions(256, 0, DEEPZOOM_LIMIT_BOUNDS)
+        aligned = DeepZoomGenerator(copy, 256, 0, limit_bounds=DEEPZOOM_LIMIT_BOUNDS)
+        assert aligned.level_tiles[-1] == (4, 3)
+        tile = aligned.get_tile(aligned.level_count - 1, (1, 1))
+        assert np.abs(np.asarray(tile).astype(int) - pixels[256:512, 256:512]).mean() < 4
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from PIL import Image
+
+from src.app.core.utils import slide_previews
+from src.app.core.utils.slide_previews import PreviewStore, best_size, generate_previews
+
+
+def test_picks_smallest_precomputed_size_covering_request() -> None:
+    assert best_size([128, 256, 512], 200) == 256
+    assert best_size([128, 256, 512], 256) == 256
+    assert best_size([128, 256, 512], 2000) == 512
+
+
+def test_renders_sizes_up_to_source_size(mocker, tmp_path: Path) -> None:
+    mocker.patch.object(
+        slide_previews,
+        "read_preview_sources",
+        return_value={"thumbnail": Image.new("RGB", (1024, 512)), "label": Image.new("RGBA", (100, 60))},
+    )
+    store = PreviewStore(tmp_path)
+
+    manifest = generate_previews(tmp_path / "slide.svs", store, "slide")
+
+    assert manifest == {"thumbnail": [128, 256, 512, 1024], "label": [128]}
+    assert store.read_manifest("slide") == manifest
+    assert Image.open(store.path("slide", "thumbnail", 256)).size == (256, 128)
+    assert Image.open(store.path("slide", "label", 128)).size == (100, 60)
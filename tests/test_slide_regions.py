@@ -0,0 +1,74 @@
+import asyncio
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+from pytest_mock import MockerFixture
+
+from src.app.core.utils import slide_regions
+from src.app.core.utils.slide_regions import PngEncoder, RegionEncoder, TiffEncoder, stream_region
+
+
+def _gradient(width: int, height: int) -> np.ndarray:
+    ys, xs = np.mgrid[0:height, 0:width]
+    return np.stack([xs % 256, ys % 256, (xs + ys) % 256], axis=2).astype(np.uint8)
+
+
+def _encode(encoder: RegionEncoder, region: np.ndarray, disconnect_after: int | None = None) -> tuple[bytes, int]:
+    reads = 0
+
+    async def read_block(x: int, y: int, width: int, height: int) -> np.ndarray:
+        nonlocal reads
+        reads += 1
+        return region[y : y + height, x : x + width]
+
+    async def is_disconnected() -> bool:
+        return disconnect_after is not None and reads >= disconnect_after
+
+    async def collect() -> bytes:
+        return b"".join([chunk async for chunk in stream_region(encoder, read_block, is_disconnected)])
+
+    return asyncio.run(collect()), reads
+
+
+def test_streams_png_and_tiled_tiff() -> None:
+    region = _gradient(600, 300)
+
+    png, _ = _encode(PngEncoder(600, 300), region)
+    tiff_encoder = TiffEncoder(600, 300, mpp=0.5)
+    tiff, reads = _encode(tiff_encoder, region)
+
+    assert (np.asarray(Image.open(BytesIO(png))) == region).all()
+    assert len(tiff) == tiff_encoder.content_length
+    assert reads == 3 * 2
+    image = Image.open(BytesIO(tiff))
+    assert (np.asarray(image) == region).all()
+    assert image.tag_v2[322] == 256
+
+
+def test_stops_reading_when_client_disconnects() -> None:
+    region = _gradient(600, 600)
+
+    _, reads = _encode(TiffEncoder(600, 600), region, disconnect_after=2)
+
+    assert reads == 2
+
+
+def test_region_encoders_must_encode() -> None:
+    with pytest.raises(TypeError):
+        RegionEncoder(10, 10)
+
+
+def test_region_blocks_check_the_slide_format_once(mocker: MockerFixture) -> None:
+    is_dicom = mocker.patch.object(slide_regions.dicom_wsi, "is_dicom_series", return_value=False)
+    read = mocker.patch.object(slide_regions, "_read", side_effect=lambda *args: Image.new("RGB", args[-1]))
+
+    block = slide_regions.read_region_block(Path("slide.svs"), 0, 0, 1.0, 1000, 600, dicom=False)
+    assert block.shape == (600, 1000, 3)
+    assert read.call_count == 4
+    assert is_dicom.call_count == 0
+
+    slide_regions.read_region_block(Path("slide.svs"), 0, 0, 1.0, 1000, 600)
+    assert is_dicom.call_count == 1
@@ -0,0 +1,66 @@
+import asyncio
+from collections import OrderedDict
+from pathlib import Path
+
+from arq.jobs import JobStatus
+from pytest_mock import MockerFixture
+
+from src.app.core.utils import queue, slide_serving, slide_staging
+from src.app.core.utils.slide_staging import SlideStagingCache
+
+SLIDE = Path("slide.svs")
+
+
+def test_slide_jobs_are_queued_again_once_finished(mocker: MockerFixture) -> None:
+    pool = mocker.patch.object(queue, "pool", mocker.AsyncMock())
+    job = mocker.patch.object(slide_serving, "Job").return_value
+    job.status = mocker.AsyncMock(return_value=JobStatus.in_progress)
+    mocker.patch.object(slide_serving, "_checked_jobs", OrderedDict())
+
+    def enqueue() -> None:
+        asyncio.run(slide_serving.enqueue_slide_job("stage_slide", SLIDE, "stage:slide"))
+
+    # A running job is left alone, and not looked at again until the recheck interval passed.
+    enqueue()
+    enqueue()
+    assert job.status.await_count == 1
+    pool.enqueue_job.assert_not_called()
+
+    # Once the interval passed, a finished or failed job is queued again in place of its kept result.
+    slide_serving._checked_jobs["stage:slide"] = 0.0
+    job.status.return_value = JobStatus.complete
+    enqueue()
+    pool.delete.assert_awaited_once_with("arq:result:stage:slide")
+    pool.enqueue_job.assert_awaited_once_with("stage_slide", "slide.svs", _job_id="stage:slide")
+
+
+def test_slide_job_memory_is_bounded(mocker: MockerFixture) -> None:
+    mocker.patch.object(queue, "pool", mocker.AsyncMock())
+    mocker.patch.object(slide_serving, "Job").return_value.status = mocker.AsyncMock(return_value=JobStatus.not_found)
+    mocker.patch.object(slide_serving, "_checked_jobs", OrderedDict())
+    mocker.patch.object(slide_serving, "SLIDE_JOB_MEMORY", 2)
+
+    async def enqueue_all() -> None:
+        for job_id in ("tissue:a", "tissue:b", "tissue:c"):
+            await slide_serving.enqueue_slide_job("generate_slide_tissue_mask", SLIDE, job_id)
+
+    asyncio.run(enqueue_all())
+    assert list(slide_serving._checked_jobs) == ["tissue:b", "tissue:c"]
+    assert queue.pool.enqueue_job.await_count == 3
+
+
+def test_evicted_copies_are_staged_again(tmp_path: Path, mocker: MockerFixture) -> None:
+    store = mocker.patch.object(slide_staging, "store", SlideStagingCache(tmp_path, max_bytes=1024, min_idle=0))
+    pool = mocker.patch.object(queue, "pool", mocker.AsyncMock())
+    mocker.patch.object(slide_serving, "Job").return_value.status = mocker.AsyncMock(return_value=JobStatus.complete)
+    mocker.patch.object(slide_serving, "_checked_jobs", OrderedDict())
+
+    store.path("v1", SLIDE.name).parent.mkdir()
+    store.path("v1", SLIDE.name).write_bytes(b"x")
+    asyncio.run(slide_serving.request_staging(SLIDE, "v1"))
+    pool.enqueue_job.assert_not_called()
+
+    # The staging job of the evicted copy finished long ago; the copy is made again.
+    store.make_room(1024)
+    asyncio.run(slide_serving.request_staging(SLIDE, "v1"))
+    pool.enqueue_job.assert_awaited_once_with("stage_slide", SLIDE.name, _job_id="stage:v1")
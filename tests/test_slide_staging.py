@@ -0,0 +1,58 @@
+import os
+import time
+from pathlib import Path
+
+from src.app.core.utils.slide_cache import slide_identity
+from src.app.core.utils.slide_staging import SlideStagingCache, slide_members
+
+
+def write(path: Path, size: int) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def test_members_include_companion_folders(tmp_path: Path) -> None:
+    mrxs = write(tmp_path / "case.mrxs", 10)
+    write(tmp_path / "case" / "Data0000.dat", 10)
+    series = write(tmp_path / "series" / "level0.dcm", 10).parent
+
+    assert slide_members(mrxs) == [mrxs, tmp_path / "case"]
+    assert slide_members(series) == [series]
+    assert slide_members(write(tmp_path / "case.svs", 10)) == [tmp_path / "case.svs"]
+    assert slide_members(write(tmp_path / "case.vms", 10)) is None
+
+
+def test_stages_multi_file_slides(tmp_path: Path) -> None:
+    mrxs = write(tmp_path / "slides" / "case.mrxs", 100)
+    write(tmp_path / "slides" / "case" / "Data0000.dat", 400)
+    store = SlideStagingCache(tmp_path / "staging", max_bytes=1000)
+    slide_id = slide_identity(mrxs)
+
+    assert store.existing_path(slide_id, mrxs.name) is None
+    assert store.stage(mrxs, slide_id)["bytes"] == 500
+    assert store.existing_path(slide_id, mrxs.name) == tmp_path / "staging" / slide_id / "case.mrxs"
+    assert (tmp_path / "staging" / slide_id / "case" / "Data0000.dat").stat().st_size == 400
+    assert store.stage(mrxs, slide_id) == {"skipped": "already staged"}
+    assert store.stats() == {"slides": 1, "bytes": 500, "max_bytes": 1000}
+
+
+def test_evicts_idle_copies_least_recently_used_first(tmp_path: Path) -> None:
+    slides = [write(tmp_path / "slides" / f"{name}.svs", 400) for name in "abc"]
+    store = SlideStagingCache(tmp_path / "staging", max_bytes=1000, touch_interval=0, min_idle=60)
+    ids = [slide_identity(slide) for slide in slides]
+    store.stage(slides[0], ids[0])
+    store.stage(slides[1], ids[1])
+
+    # Both copies are in use, so the third slide is left on network storage.
+    assert store.stage(slides[2], ids[2])["skipped"] == "slide does not fit the staging budget"
+
+    idle = time.time() - 120
+    for slide_id in ids[:2]:
+        os.utime(tmp_path / "staging" / slide_id, (idle, idle))
+    store.existing_path(ids[0], slides[0].name)
+
+    assert store.stage(slides[2], ids[2])["evicted"] == [ids[1]]
+    assert store.existing_path(ids[1], slides[1].name) is None
+    assert store.existing_path(ids[0], slides[0].name) is not None
+    assert store.stage(write(tmp_path / "slides" / "big.svs", 2000), "big")["skipped"].startswith("slide does not")
@@ -0,0 +1,100 @@
+import asyncio
+
+from pytest_mock import MockerFixture
+
+from src.app.core.utils import cache
+from src.app.core.utils.tile_cache import TileCache, TileKey
+from src.app.core.utils.tile_encoding import TileEncoding
+
+
+def _key(col: int) -> TileKey:
+    return TileKey("slide", 10, col, 0, TileEncoding("jpeg", 75))
+
+
+def test_evicts_least_recently_used_within_byte_budget() -> None:
+    tiles = TileCache(max_bytes=400)
+
+    tiles.put_local(_key(0), b"a" * 100)
+    tiles.put_local(_key(1), b"b" * 100)
+    tiles.put_local(_key(2), b"c" * 100)
+    assert tiles.get_local(_key(0)) is not None
+
+    tiles.put_local(_key(3), b"d" * 100)
+    tiles.put_local(_key(4), b"e" * 100)
+
+    assert tiles.get_local(_key(1)) is None
+    assert tiles.get_local(_key(0)) is not None
+    assert tiles.stats()["size_bytes"] <= 400
+    assert tiles.stats()["evictions"] == 1
+
+
+def test_skips_tiles_too_large_for_budget() -> None:
+    tiles = TileCache(max_bytes=400)
+
+    tiles.put_local(_key(0), b"a" * 101)
+
+    assert tiles.stats()["entries"] == 0
+
+
+def test_reports_hit_ratio() -> None:
+    tiles = TileCache(max_bytes=1024)
+
+    async def scenario() -> None:
+        await tiles.put(_key(0), b"tile")
+        assert await tiles.get(_key(0)) == b"tile"
+        assert await tiles.get(_key(1)) is None
+
+    asyncio.run(scenario())
+
+    assert tiles.stats()["hit_ratio"] == 0.5
+
+
+class _FakeRedis:
+    def __init__(self) -> None:
+        self.values: dict[str, bytes] = {}
+        self.writes = 0
+
+    async def get(self, key: str) -> bytes | None:
+        return self.values.get(key)
+
+    def pipeline(self, transaction: bool = True) -> "_FakeRedis":
+        return self
+
+    async def __aenter__(self) -> "_FakeRedis":
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        return None
+
+    def set(self, key: str, value: bytes, ex: int | None = None) -> None:
+        self.values[key] = value
+        self.writes += 1
+
+    async def execute(self) -> None:
+        return None
+
+
+def test_spills_to_redis_on_eviction_only(mocker: MockerFixture) -> None:
+    redis = mocker.patch.object(cache, "client", _FakeRedis())
+    tiles = TileCache(max_bytes=200, spill_to_redis=True)
+
+    async def scenario() -> None:
+        await tiles.put(_key(0), b"a" * 50)
+        await tiles.put(_key(1), b"b" * 50)
+        assert redis.writes == 0
+
+        await tiles.put(_key(2), b"c" * 50, shared=True)
+        assert list(redis.values) == [_key(2).redis_key()]
+
+        await tiles.put(_key(3), b"d" * 50)
+        await tiles.put(_key(4), b"e" * 50)
+        assert _key(0).redis_key() in redis.values
+
+        # The evicted tile comes back from Redis, and is promoted to memory again.
+        assert await tiles.get(_key(0)) == b"a" * 50
+        assert tiles.peek_local(_key(0)) is not None
+
+    asyncio.run(scenario())
+
+    assert tiles.stats()["redis_hits"] == 1
+    assert tiles.stats()["spilled"] == redis.writes
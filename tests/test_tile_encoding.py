@@ -0,0 +1,32 @@
+import pytest
+
+from src.app.core.utils.tile_encoding import (
+    QualityProfile,
+    TileEncoding,
+    negotiate_format,
+    parse_quality_profiles,
+    select_encoding,
+)
+
+
+def test_quality_profiles_apply_by_depth_below_full_resolution() -> None:
+    profiles = parse_quality_profiles("3:70, 0:85:0, 6:55")
+
+    assert profiles == [QualityProfile(0, 85, 0), QualityProfile(3, 70), QualityProfile(6, 55)]
+    assert select_encoding("jpeg", 17, 18, profiles, 75) == TileEncoding("jpeg", 85, 0)
+    assert select_encoding("jpeg", 14, 18, profiles, 75) == TileEncoding("jpeg", 70)
+    assert select_encoding("webp", 17, 18, profiles, 75) == TileEncoding("webp", 85)
+    assert select_encoding("jpeg", 0, 18, profiles, 75).quality == 55
+    assert select_encoding("png", 17, 18, profiles, 75).label == "png"
+    assert select_encoding("jpeg", 17, 18, [], 75) == TileEncoding("jpeg", 75)
+
+    with pytest.raises(ValueError):
+        parse_quality_profiles("0")
+
+
+def test_negotiates_webp_only_for_default_jpeg_urls() -> None:
+    assert negotiate_format("jpeg", "image/avif,image/webp,*/*") == "webp"
+    assert negotiate_format("jpg", "image/webp", negotiate=False) == "jpeg"
+    assert negotiate_format("jpeg", None) == "jpeg"
+    assert negotiate_format("png", "image/webp") == "png"
+    assert negotiate_format("gif", "image/webp") is None
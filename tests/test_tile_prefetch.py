@@ -0,0 +1,95 @@
+import asyncio
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from src.app.core.utils import slide_serving, tile_prefetch
+from src.app.core.utils.slide_cache import SlideGeometry
+from src.app.core.utils.tile_prefetch import TilePrefetcher, is_near, prefetch_candidates
+from src.app.core.utils.tile_render import RenderPriority
+
+GEOMETRY = SlideGeometry(3, ((100, 100), (200, 200), (400, 400)), ((1, 1), (4, 4), (8, 8)))
+
+
+def test_candidates_are_the_ring_and_the_children() -> None:
+    ring, children = [(1, 1, 0), (1, 0, 1), (1, 1, 1)], [(2, 0, 0), (2, 1, 0), (2, 0, 1), (2, 1, 1)]
+    assert prefetch_candidates(GEOMETRY, 1, 0, 0) == ring + children
+    assert len(prefetch_candidates(GEOMETRY, 1, 1, 1)) == 12
+    assert prefetch_candidates(GEOMETRY, 2, 7, 7) == [(2, 6, 6), (2, 7, 6), (2, 6, 7)]
+
+
+def test_is_near_scales_across_levels() -> None:
+    assert is_near((2, 3, 3), (1, 1, 1))
+    assert not is_near((2, 5, 3), (1, 1, 1))
+    assert is_near((0, 0, 0), (1, 1, 1))
+    assert not is_near((1, 3, 1), (1, 1, 1))
+    assert not is_near((3, 2, 2), (1, 1, 1))
+
+
+def test_prefetches_within_budget_and_cancels_when_the_viewport_moves() -> None:
+    fetched: list[tuple[int, int, int]] = []
+    release = asyncio.Event()
+
+    async def fetch(level: int, col: int, row: int) -> None:
+        await release.wait()
+        fetched.append((level, col, row))
+
+    async def scenario() -> None:
+        prefetcher = TilePrefetcher(budget=10, max_concurrent=1, viewport_seconds=0)
+        assert prefetcher.schedule("viewer", "slide", GEOMETRY, (1, 1, 1), fetch) == 10
+        assert prefetcher.stats()["over_budget"] == 1
+
+        # Zooming into the far corner leaves all but one pending prefetch behind, and the budget is spent.
+        assert prefetcher.schedule("viewer", "slide", GEOMETRY, (2, 7, 7), fetch) == 0
+        await asyncio.sleep(0)
+        assert prefetcher.stats()["cancelled"] == 9
+        assert prefetcher.stats()["pending"] == 1
+
+        # Another viewer has its own budget, and its prefetches land once the fetch goes through.
+        assert prefetcher.schedule("other", "slide", GEOMETRY, (2, 7, 7), fetch) == 3
+        release.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert sorted(fetched) == [(1, 2, 2), (2, 6, 6), (2, 6, 7), (2, 7, 6)]
+        assert prefetcher.stats()["completed"] == 4
+
+    asyncio.run(scenario())
+
+
+def test_skips_prefetch_while_the_renderer_is_busy() -> None:
+    async def fetch(level: int, col: int, row: int) -> None:
+        raise AssertionError("prefetched while busy")
+
+    async def scenario() -> None:
+        prefetcher = TilePrefetcher(busy=lambda: True)
+        prefetcher.schedule("viewer", "slide", GEOMETRY, (2, 7, 7), fetch)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert prefetcher.stats()["skipped"] == 3
+        assert prefetcher.stats()["failed"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_viewer_batches_schedule_prefetch_for_each_served_tile(mocker: MockerFixture) -> None:
+    slide = slide_serving.ServedSlide(Path("slide.svs"), Path("slide.svs"), "slide")
+    mocker.patch.object(slide_serving, "served_slide", return_value=slide)
+    mocker.patch.object(slide_serving, "get_slide_geometry", mocker.AsyncMock(return_value=GEOMETRY))
+    mocker.patch.object(slide_serving, "stored_tile_path", return_value=None)
+    mocker.patch.object(slide_serving, "get_tile_bytes", mocker.AsyncMock(return_value=b"tile"))
+    prefetcher = mocker.patch.object(tile_prefetch, "prefetcher")
+
+    async def frames(priority: RenderPriority) -> list[bytes]:
+        tiles = [(1, 0, 0), (1, 1, 1), (5, 0, 0)]
+        stream = slide_serving.stream_tile_frames("viewer", priority, slide.path, tiles, "jpeg")
+        return [frame async for frame in stream]
+
+    assert len(asyncio.run(frames(RenderPriority.INTERACTIVE))) == 3
+    # The tile outside the pyramid is answered with a 404 frame and prefetches nothing.
+    served = sorted(call.args[3] for call in prefetcher.schedule.call_args_list)
+    assert served == [(1, 0, 0), (1, 1, 1)]
+
+    # Export batches rank below prefetches, so they start none.
+    prefetcher.schedule.reset_mock()
+    assert len(asyncio.run(frames(RenderPriority.BATCH))) == 3
+    prefetcher.schedule.assert_not_called()
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.app.core.exceptions.tile_exceptions import TileQueueFullError
+from src.app.core.utils.tile_render import RenderPriority, TileRenderer
+
+
+def test_rejects_work_beyond_queue_depth() -> None:
+    renderer = TileRenderer(max_workers=1, per_slide_limit=1, max_queue_depth=2)
+    release = threading.Event()
+
+    async def scenario() -> None:
+        first = asyncio.create_task(renderer.run("a", release.wait))
+        second = asyncio.create_task(renderer.run("a", release.wait))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(TileQueueFullError):
+            await renderer.run("b", release.wait)
+
+        release.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(scenario())
+    renderer.shutdown()
+
+    assert renderer.stats()["rejected"] == 1
+    assert renderer.stats()["completed"] == 2
+    assert renderer.stats()["active_slides"] == 0
+
+
+def test_limits_concurrent_renders_per_slide() -> None:
+    renderer = TileRenderer(max_workers=4, per_slide_limit=2, max_queue_depth=16)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def work() -> None:
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        threading.Event().wait(0.02)
+        with lock:
+            running -= 1
+
+    async def scenario() -> None:
+        await asyncio.gather(*(renderer.run("a", work) for _ in range(6)))
+
+    asyncio.run(scenario())
+    renderer.shutdown()
+
+    assert peak == 2
+
+
+def test_serves_classes_in_priority_order_and_users_in_turns() -> None:
+    renderer = TileRenderer(max_workers=1, per_slide_limit=1, max_queue_depth=16)
+    release = threading.Event()
+    order: list[str] = []
+
+    async def scenario() -> None:
+        blocker = asyncio.create_task(renderer.run("a", release.wait))
+        await asyncio.sleep(0.01)
+
+        waiting = [
+            asyncio.create_task(renderer.run("a", order.append, name, priority=priority, user=user))
+            for name, priority, user in (
+                ("batch", RenderPriority.BATCH, "export"),
+                ("bulk-1", RenderPriority.INTERACTIVE, "bulk"),
+                ("bulk-2", RenderPriority.INTERACTIVE, "bulk"),
+                ("bulk-3", RenderPriority.INTERACTIVE, "bulk"),
+                ("viewer", RenderPriority.INTERACTIVE, "viewer"),
+            )
+        ]
+        await asyncio.sleep(0)
+        assert renderer.stats()["classes"]["interactive"]["queued"] == 4
+
+        release.set()
+        await asyncio.gather(blocker, *waiting)
+
+    asyncio.run(scenario())
+    renderer.shutdown()
+
+    assert order == ["bulk-1", "viewer", "bulk-2", "bulk-3", "batch"]
+
+
+def test_sheds_lower_classes_first() -> None:
+    renderer = TileRenderer(max_workers=1, per_slide_limit=1, max_queue_depth=4)
+    release = threading.Event()
+
+    async def scenario() -> None:
+        admitted = [asyncio.create_task(renderer.run("a", release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(TileQueueFullError) as rejected:
+            await renderer.run("a", release.wait, priority=RenderPriority.BATCH)
+        assert rejected.value.retry_after >= 1
+
+        admitted.append(asyncio.create_task(renderer.run("a", release.wait, priority=RenderPriority.PREFETCH)))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*admitted)
+
+    asyncio.run(scenario())
+    renderer.shutdown()
+
+    classes = renderer.stats()["classes"]
+    assert classes["batch"]["rejected"] == 1
+    assert classes["prefetch"]["completed"] == 1
+    assert 'tile_render_rejected_total{class="batch"} 1' in renderer.metrics()
+    assert 'tile_render_wait_seconds_count{class="interactive"} 2' in renderer.metrics()
+
+
+def test_promotes_waiting_work() -> None:
+    renderer = TileRenderer(max_workers=1, per_slide_limit=1, max_queue_depth=16)
+    release = threading.Event()
+    order: list[str] = []
+
+    async def scenario() -> None:
+        blocker = asyncio.create_task(renderer.run("a", release.wait))
+        await asyncio.sleep(0.01)
+
+        prefetch = asyncio.create_task(
+            renderer.run("a", order.append, "prefetch", priority=RenderPriority.PREFETCH, work_key="tile")
+        )
+        viewer = asyncio.create_task(renderer.run("a", order.append, "viewer", priority=RenderPriority.PREFETCH))
+        await asyncio.sleep(0)
+
+        assert renderer.promote("tile", RenderPriority.INTERACTIVE)
+        assert not renderer.promote("tile", RenderPriority.BATCH)
+        release.set()
+        await asyncio.gather(blocker, prefetch, viewer)
+
+    asyncio.run(scenario())
+    renderer.shutdown()
+
+    assert order == ["prefetch", "viewer"]
+    assert renderer.stats()["classes"]["interactive"]["promoted"] == 1
+
+
+def test_drops_waiting_work_whose_caller_went_away() -> None:
+    renderer = TileRenderer(max_workers=1, per_slide_limit=1, max_queue_depth=16)
+    release = threading.Event()
+    order: list[str] = []
+
+    async def scenario() -> None:
+        blocker = asyncio.create_task(renderer.run("a", release.wait))
+        await asyncio.sleep(0.01)
+        gone = asyncio.create_task(renderer.run("a", order.append, "gone"))
+        kept = asyncio.create_task(renderer.run("a", order.append, "kept"))
+        await asyncio.sleep(0)
+
+        gone.cancel()
+        blocker.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        await kept
+        await asyncio.gather(gone, blocker, return_exceptions=True)
+
+    asyncio.run(scenario())
+    renderer.shutdown()
+
+    assert order == ["kept"]
+    assert renderer.stats()["classes"]["interactive"]["cancelled"] == 1
+    assert renderer.stats()["classes"]["interactive"]["abandoned"] == 1
+    assert renderer.stats()["active_slides"] == 0
+    assert 'tile_render_cancelled_total{class="interactive"} 1' in renderer.metrics()
@@ -0,0 +1,47 @@
+import numpy as np
+
+from src.app.core.utils.tile_encoding import TileEncoding
+from src.app.core.utils.tissue_mask import TissueMaskStore, blank_tile, compute_tissue_mask
+
+
+def _thumbnail() -> np.ndarray:
+    pixels = np.full((64, 64, 3), 236, dtype=np.uint8)
+    pixels[40:50, 33:50] = [200, 120, 180]
+    return pixels
+
+
+def test_thresholds_tissue_and_estimates_glass() -> None:
+    mask, background = compute_tissue_mask(_thumbnail())
+
+    assert background == (236, 236, 236)
+    assert mask[40:50, 33:50].all()
+    assert mask[39, 32] and mask[50, 50]
+    assert not mask[:38].any()
+
+
+def test_maps_tiles_onto_the_mask(tmp_path) -> None:
+    store = TissueMaskStore(tmp_path)
+    mask, background = compute_tissue_mask(_thumbnail())
+    # A 1024x1024 top level with 256-pixel tiles, the mask being its 64x64 level.
+    level_dimensions = [(2**i, 2**i) for i in range(11)]
+    manifest = {
+        "level_dimensions": level_dimensions,
+        "tile_size": 256,
+        "overlap": 1,
+        "background": list(background),
+        "tissue_fraction": float(mask.mean()),
+    }
+    store.write("slide", mask, manifest)
+
+    tissue_mask = store.get("slide")
+
+    assert tissue_mask.is_background(10, 0, 0)
+    assert tissue_mask.is_background(10, 1, 1)
+    assert not tissue_mask.is_background(10, 2, 2)
+    # Tile (1, 2) ends at pixel 513 and only reaches the grown tissue, from pixel 512, through its overlap.
+    assert not tissue_mask.is_background(10, 1, 2)
+    assert not tissue_mask.is_background(0, 0, 0)
+    assert tissue_mask.tile_size_at(10, 3, 0) == (257, 257)
+    assert blank_tile((257, 257), background, TileEncoding("jpeg", 75)) is blank_tile(
+        (257, 257), background, TileEncoding("jpeg", 75)
+    )